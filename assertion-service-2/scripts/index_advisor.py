@@ -0,0 +1,611 @@
+#!/usr/bin/env python3
+"""
+Explain the query shapes used by the scripts and flag the ones no index serves.
+
+Every registered shape (the filters the query-fix scripts send) is run with
+``explain`` at ``executionStats`` verbosity.  For each one the winning plan,
+documents examined per document returned and run time are reported.  Shapes
+that end in a COLLSCAN, or examine more than ``--max-ratio`` documents per
+result, get a suggested index: equality fields first, then the sort, then
+range fields.  The live indexes are also compared with the ones declared by
+the Java domain classes and migrations (AddMemberIdIndexes,
+AddTokenAvailableIndex, ...), and with the ones later migrations drop.
+
+The filters, projections and hints are imported from the query-fix scripts
+themselves, so the shapes cannot drift from what the scripts send.
+
+Equality values (member_id, salesforce_id, emails) are sampled from the
+assertion collection, so plans are chosen as they would be for a real run.
+``executionStats`` runs the query to completion, so each explain is bounded
+by ``--max-time-ms``; a shape that times out is reported with its plan only.
+
+Usage:
+    python index_advisor.py                          # every shape
+    python index_advisor.py --only=short_sf_ids      # shapes whose name contains this
+    python index_advisor.py --json=/tmp/indexes.json # also write the results as JSON
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Tuple, Union
+
+from bson import ObjectId, SON, json_util
+from pymongo.errors import ExecutionTimeout, OperationFailure
+
+CURRENT_DIR = Path(__file__).resolve().parent
+UTILS_DIR = CURRENT_DIR / "utils"
+QUERY_FIXES_DIR = CURRENT_DIR / "query-fixes"
+
+for path in (UTILS_DIR, QUERY_FIXES_DIR):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+from logger_config import setup_logger
+from db_connection import MongoConnectionRegistry
+from config import Config
+from partitioning import range_filter
+from repository import AssertionRef, NotificationRequestRef, OrcidRecordRef, UserRef
+
+# The scripts only run main() under __main__; importing them just sets up their loggers.
+import add_missing_ORCID_iD_from_affiliations
+import backfill_member_id
+import backfill_orcid_record
+import backfill_orcid_record_tokens
+import demote_non_superadmin_admins
+import find_short_sf_ids
+import fix_affiliation_status
+import manage_organizations
+
+logger = setup_logger(__name__, log_file="index-advisor.log")
+
+IndexKey = List[Tuple[str, int]]
+
+# Indexes the services declare, by (database, collection) and index name.
+DECLARED_INDEXES: Dict[Tuple[str, str], Dict[str, IndexKey]] = {
+    ("assertionservice", "assertion"): {
+        # AddMemberIdIndexes
+        "member_id_1_status_1_id_-1": [("member_id", 1), ("status", 1), ("_id", -1)],
+        "member_id_1_email_1_id_1": [("member_id", 1), ("email", 1), ("_id", 1)],
+        # AddTokenAvailableIndex
+        "status_1_token_available_1_created_1": [("status", 1), ("token_available", 1), ("created", 1)],
+        # Assertion @Indexed fields
+        "put_code": [("put_code", 1)],
+        "created": [("created", 1)],
+        "member_id": [("member_id", 1)],
+    },
+    ("assertionservice", "orcid_record"): {
+        "email_unique_idx": [("email", 1)],
+    },
+    ("userservice", "jhi_user"): {
+        "email": [("email", 1)],
+    },
+    ("memberservice", "member"): {
+        "salesforce_id": [("salesforce_id", 1)],
+    },
+}
+
+# Indexes a migration created and a later one dropped; reported if still live.
+DROPPED_INDEXES: Dict[Tuple[str, str], Dict[str, IndexKey]] = {
+    ("assertionservice", "assertion"): {
+        # @Indexed on added_to_orcid, dropped by DropAddedToOrcidIndex
+        "added_to_orcid": [("added_to_orcid", 1)],
+        # CreateAssertionCompoundIndex, dropped by DropRedundantCompoundIndex
+        "added_to_orcid_1_created_1_status_1": [("added_to_orcid", 1), ("created", 1), ("status", 1)],
+        # CreateAssertionStatusCompoundIndex, replaced by AddTokenAvailableIndex
+        "status_1_created_1": [("status", 1), ("created", 1)],
+    },
+}
+
+# Operators whose field can be an equality prefix of an index.
+EQUALITY_OPERATORS = {"$eq", "$in"}
+# Top-level operators no single-field index can serve.
+UNINDEXABLE_OPERATORS = {"$expr", "$where", "$or", "$nor", "$text"}
+
+DEFAULT_MAX_RATIO = 10.0
+DEFAULT_MAX_TIME_MS = 60_000
+SAMPLE_EMAILS = 100
+PLACEHOLDER_ID = "000000000000000000000000"
+
+
+class SampleValues:
+    """Real equality values for the shapes, read once from the assertion collection."""
+
+    def __init__(self, assertion_collection):
+        self.collection = assertion_collection
+        self._values: Dict[str, Any] = {}
+
+    def _first(self, field: str, placeholder: str) -> str:
+        if field not in self._values:
+            doc = self.collection.find_one({field: {"$type": "string", "$ne": ""}}, {"_id": 0, field: 1})
+            self._values[field] = doc[field] if doc else placeholder
+        return self._values[field]
+
+    @property
+    def member_id(self) -> str:
+        return self._first("member_id", PLACEHOLDER_ID)
+
+    @property
+    def salesforce_id(self) -> str:
+        return self._first("salesforce_id", "001000000000000AAA")
+
+    @property
+    def emails(self) -> List[str]:
+        if "emails" not in self._values:
+            cursor = self.collection.find({"email": {"$type": "string"}}, {"_id": 0, "email": 1}).limit(SAMPLE_EMAILS)
+            self._values["emails"] = sorted({doc["email"].strip().lower() for doc in cursor}) or ["a@example.org"]
+        return self._values["emails"]
+
+
+Filter = Union[Dict[str, Any], Callable[[SampleValues], Dict[str, Any]]]
+# An index name, or an index key as passed to ``Cursor.hint``.
+Hint = Union[str, IndexKey]
+
+
+class QueryShape:
+    """One query a script sends: where, what filter, and which script sends it."""
+
+    __slots__ = ("name", "database", "collection", "filter", "projection", "sort", "hint", "source", "note")
+
+    def __init__(self, name: str, database: str, collection: str, filter: Filter,
+                 source: str, projection: Optional[Dict[str, Any]] = None,
+                 sort: Optional[IndexKey] = None, hint: Optional[Hint] = None, note: Optional[str] = None):
+        self.name = name
+        self.database = database
+        self.collection = collection
+        self.filter = filter
+        self.projection = projection
+        self.sort = sort
+        self.hint = hint
+        self.source = source
+        self.note = note
+
+    def build_filter(self, samples: SampleValues) -> Dict[str, Any]:
+        return self.filter(samples) if callable(self.filter) else self.filter
+
+
+SHORT_SF_ID_NOTE = (
+    "$expr on the string length cannot use an index; with an index on salesforce_id, "
+    "{salesforce_id: {$regex: '^.{0,17}$'}} scans keys instead of documents"
+)
+# Any real partition bound exercises the same plan as the hinted _id range scan.
+PARTITION_LOWER_BOUND = ObjectId(PLACEHOLDER_ID)
+
+SHAPES: List[QueryShape] = [
+    QueryShape("short_sf_ids.assertion", "assertionservice", "assertion",
+               find_short_sf_ids.query_short_sf_ids, "find_short_sf_ids.find_problematic_assertions",
+               projection=AssertionRef.SF_ID_REPORT, note=SHORT_SF_ID_NOTE),
+    QueryShape("short_sf_ids.orcid_record", "assertionservice", "orcid_record",
+               find_short_sf_ids.query_short_token_sf_ids, "find_short_sf_ids.find_problematic_orcid_records",
+               projection=OrcidRecordRef.SF_ID_REPORT,
+               note="$expr/$filter over tokens cannot use an index; the scan is inherent, run it off-peak"),
+    QueryShape("short_sf_ids.send_notifications_request", "assertionservice", "send_notifications_request",
+               find_short_sf_ids.query_short_sf_ids,
+               "find_short_sf_ids.find_problematic_send_notifications_request",
+               projection=NotificationRequestRef.SF_ID_REPORT, note=SHORT_SF_ID_NOTE),
+    QueryShape("short_sf_ids.jhi_user", "userservice", "jhi_user", find_short_sf_ids.query_short_sf_ids,
+               "find_short_sf_ids.find_problematic_users", projection=UserRef.SF_ID_REPORT, note=SHORT_SF_ID_NOTE),
+    QueryShape("added_to_orcid_without_put_code", "assertionservice", "assertion",
+               fix_affiliation_status.ADDED_WITHOUT_PUT_CODE,
+               "fix_affiliation_status.find_problematic_affiliations", projection=AssertionRef.STATUS_REPORT),
+    QueryShape("put_code_without_orcid_id", "assertionservice", "assertion",
+               add_missing_ORCID_iD_from_affiliations.MISSING_ORCID_ID,
+               "add_missing_ORCID_iD_from_affiliations.find_problematic_assertions",
+               projection=AssertionRef.ORCID_MATCH),
+    QueryShape("orcid_records_with_tokens_by_email", "assertionservice", "orcid_record",
+               lambda s: add_missing_ORCID_iD_from_affiliations.orcid_records_with_tokens(s.emails),
+               "add_missing_ORCID_iD_from_affiliations._orcid_records_for",
+               projection=OrcidRecordRef.ACTIVE_TOKENS),
+    QueryShape("orcid_records_by_email", "assertionservice", "orcid_record",
+               lambda s: {"email": {"$in": s.emails}},
+               "backfill_orcid_record_tokens._plan_chunk",
+               projection=backfill_orcid_record_tokens.ORCID_RECORD_PLAN_PROJECTION),
+    QueryShape("orcid_record_normalized_emails", "assertionservice", "orcid_record",
+               backfill_orcid_record.NORMALIZED_EMAIL, "backfill_orcid_record._sorted_emails",
+               projection=backfill_orcid_record.EMAIL_ONLY, sort=[("email", 1)],
+               hint=backfill_orcid_record.ORCID_RECORD_EMAIL_INDEX),
+    QueryShape("orcid_record_unnormalized_emails", "assertionservice", "orcid_record",
+               backfill_orcid_record.UNNORMALIZED_EMAIL, "backfill_orcid_record._sorted_emails",
+               projection=backfill_orcid_record.EMAIL_ONLY),
+    QueryShape("assertions_by_salesforce_id", "assertionservice", "assertion",
+               lambda s: {"salesforce_id": {"$in": [s.salesforce_id]}},
+               "backfill_member_id._scan_range",
+               projection=backfill_member_id.TOP_LEVEL_SCAN_PROJECTION),
+    QueryShape("assertions_by_salesforce_id.partitioned", "assertionservice", "assertion",
+               lambda s: {**range_filter(PARTITION_LOWER_BOUND, None), "salesforce_id": {"$in": [s.salesforce_id]}},
+               "backfill_member_id._scan_range (--partitions)",
+               projection=backfill_member_id.TOP_LEVEL_SCAN_PROJECTION, hint=backfill_member_id.PARTITION_HINT),
+    QueryShape("orcid_records_by_token_salesforce_id", "assertionservice", "orcid_record",
+               lambda s: {"tokens.salesforce_id": {"$in": [s.salesforce_id]}},
+               "backfill_member_id.scan", projection=backfill_member_id.ORCID_RECORD_SCAN_PROJECTION),
+    QueryShape("assertions_by_member_id", "assertionservice", "assertion",
+               lambda s: manage_organizations.member_query(s.member_id),
+               "manage_organizations.find_problematic_assertions"),
+    QueryShape("orcid_records_by_token_member_id", "assertionservice", "orcid_record",
+               lambda s: manage_organizations.member_tokens_query(s.member_id),
+               "manage_organizations._orcid_record_id_ranges", projection={"_id": 1}, sort=[("_id", 1)]),
+    QueryShape("notifications_by_member_id", "assertionservice", "send_notifications_request",
+               lambda s: manage_organizations.member_query(s.member_id),
+               "manage_organizations.find_problematic_send_notifications_request"),
+    QueryShape("member_owner", "userservice", "jhi_user",
+               lambda s: manage_organizations.owner_query(s.member_id),
+               "manage_organizations.find_problematic_users", projection=UserRef.OWNER_REPORT),
+    QueryShape("admins_outside_superadmin_members", "userservice", "jhi_user",
+               lambda s: demote_non_superadmin_admins.demote_query([s.member_id]),
+               "demote_non_superadmin_admins._demote_query", projection=UserRef.ADMIN_AUDIT),
+    QueryShape("superadmin_members", "memberservice", "member",
+               demote_non_superadmin_admins.SUPERADMIN_MEMBERS,
+               "demote_non_superadmin_admins.SuperadminMembers.load",
+               projection=demote_non_superadmin_admins.SUPERADMIN_MEMBER_PROJECTION),
+]
+
+
+def _field_kind(condition: Any) -> str:
+    """'equality', 'range' or 'negation' for one field's condition."""
+    if not isinstance(condition, Mapping) or not any(str(key).startswith("$") for key in condition):
+        return "equality"
+    operators = set(condition)
+    if operators <= EQUALITY_OPERATORS:
+        return "equality"
+    if operators & {"$nin", "$not"} or condition.get("$exists") is False:
+        return "negation"
+    return "range"
+
+
+def suggest_index(query: Mapping[str, Any], sort: Optional[IndexKey] = None) -> Optional[IndexKey]:
+    """Index key for *query* following equality, sort, range order (None if nothing indexable).
+
+    Negations (``$nin``, ``$not``, ``$exists: false``) go last: they can use
+    the index bounds but rarely narrow the scan.  Top-level operators such as
+    ``$expr`` and array positions (``tokens.0``) are left out.
+    """
+    kinds: Dict[str, List[str]] = {"equality": [], "range": [], "negation": []}
+    for field, condition in query.items():
+        if field in UNINDEXABLE_OPERATORS or field.startswith("$"):
+            continue
+        if any(part.isdigit() for part in field.split(".")):
+            continue
+        kinds[_field_kind(condition)].append(field)
+
+    key: IndexKey = [(field, 1) for field in kinds["equality"]]
+    key += list(sort or ())
+    key += [(field, 1) for field in kinds["range"] + kinds["negation"]]
+    seen = set()
+    key = [(field, direction) for field, direction in key if not (field in seen or seen.add(field))]
+    if not key or key == [("_id", 1)]:
+        return None
+    return key
+
+
+def _key_text(key: IndexKey) -> str:
+    return "{" + ", ".join(f"{field}: {direction}" for field, direction in key) + "}"
+
+
+def _serving_index(key: IndexKey, indexes: Mapping[str, IndexKey]) -> Optional[str]:
+    """Name of an index whose key starts with *key*'s fields, if one exists."""
+    fields = [field for field, _ in key]
+    for name, index_key in indexes.items():
+        if [field for field, _ in index_key[:len(fields)]] == fields:
+            return name
+    return None
+
+
+def _plan_stages(plan: Mapping[str, Any]) -> Iterator[Mapping[str, Any]]:
+    plan = plan.get("queryPlan", plan)
+    yield plan
+    if "inputStage" in plan:
+        yield from _plan_stages(plan["inputStage"])
+    for stage in plan.get("inputStages", ()):
+        yield from _plan_stages(stage)
+
+
+class ShapeResult:
+    """Explain output for one shape, reduced to what the report needs."""
+
+    __slots__ = ("shape", "stages", "indexes_used", "returned", "docs_examined", "keys_examined",
+                 "millis", "timed_out", "error", "suggestion", "served_by")
+
+    def __init__(self, shape: QueryShape):
+        self.shape = shape
+        self.stages: List[str] = []
+        self.indexes_used: List[str] = []
+        self.returned = self.docs_examined = self.keys_examined = self.millis = 0
+        self.timed_out = False
+        self.error: Optional[str] = None
+        self.suggestion: Optional[IndexKey] = None
+        self.served_by: Optional[str] = None
+
+    @property
+    def collscan(self) -> bool:
+        return "COLLSCAN" in self.stages
+
+    @property
+    def ratio(self) -> float:
+        return self.docs_examined / max(self.returned, 1)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.shape.name,
+            "namespace": f"{self.shape.database}.{self.shape.collection}",
+            "source": self.shape.source,
+            "stages": self.stages,
+            "indexes_used": self.indexes_used,
+            "n_returned": self.returned,
+            "docs_examined": self.docs_examined,
+            "keys_examined": self.keys_examined,
+            "docs_examined_per_returned": round(self.ratio, 2),
+            "execution_time_ms": self.millis,
+            "timed_out": self.timed_out,
+            "error": self.error,
+            "suggested_index": dict(self.suggestion) if self.suggestion else None,
+            "served_by": self.served_by,
+            "note": self.shape.note,
+        }
+
+
+class IndexAdvisor:
+    """Runs ``explain`` for each shape and compares the plans with the declared indexes."""
+
+    def __init__(self, registry: MongoConnectionRegistry, max_ratio: float = DEFAULT_MAX_RATIO,
+                 max_time_ms: int = DEFAULT_MAX_TIME_MS):
+        self.registry = registry
+        self.max_ratio = max_ratio
+        self.max_time_ms = max_time_ms
+        self.samples = SampleValues(registry.get("assertionservice").get_collection("assertion"))
+        self._live: Dict[Tuple[str, str], Dict[str, IndexKey]] = {}
+
+    def live_indexes(self, database: str, collection: str) -> Dict[str, IndexKey]:
+        namespace = (database, collection)
+        if namespace not in self._live:
+            info = self.registry.get(database).get_collection(collection).index_information()
+            self._live[namespace] = {name: list(spec["key"]) for name, spec in info.items()}
+        return self._live[namespace]
+
+    def _explain(self, shape: QueryShape, verbosity: str) -> Dict[str, Any]:
+        command = SON([("find", shape.collection), ("filter", shape.build_filter(self.samples))])
+        if shape.projection:
+            command["projection"] = shape.projection
+        if shape.sort:
+            command["sort"] = SON(shape.sort)
+        if shape.hint:
+            live = self.live_indexes(shape.database, shape.collection)
+            if isinstance(shape.hint, str) and shape.hint in live:
+                command["hint"] = shape.hint
+            elif not isinstance(shape.hint, str) and list(shape.hint) in live.values():
+                command["hint"] = SON(shape.hint)
+        command["maxTimeMS"] = self.max_time_ms
+        return self.registry.get(shape.database).db.command("explain", command, verbosity=verbosity)
+
+    def explain(self, shape: QueryShape) -> ShapeResult:
+        result = ShapeResult(shape)
+        try:
+            try:
+                explained = self._explain(shape, "executionStats")
+            except (ExecutionTimeout, OperationFailure) as e:
+                if not isinstance(e, ExecutionTimeout) and e.code != 50:
+                    raise
+                result.timed_out = True
+                explained = self._explain(shape, "queryPlanner")
+        except OperationFailure as e:
+            result.error = str(e)
+            return result
+
+        stages = list(_plan_stages(explained.get("queryPlanner", {}).get("winningPlan", {})))
+        result.stages = [stage.get("stage", "?") for stage in stages]
+        result.indexes_used = [stage["indexName"] for stage in stages if stage.get("indexName")]
+        stats = explained.get("executionStats", {})
+        result.returned = stats.get("nReturned", 0)
+        result.docs_examined = stats.get("totalDocsExamined", 0)
+        result.keys_examined = stats.get("totalKeysExamined", 0)
+        result.millis = stats.get("executionTimeMillis", 0)
+
+        if result.collscan or result.ratio > self.max_ratio:
+            result.suggestion = suggest_index(shape.build_filter(self.samples), shape.sort)
+            if result.suggestion:
+                result.served_by = _serving_index(
+                    result.suggestion, self.live_indexes(shape.database, shape.collection)
+                )
+        return result
+
+    def missing_declared_indexes(self) -> List[Tuple[str, str, str, IndexKey]]:
+        """Declared indexes not found on the server (by key, whatever their name)."""
+        missing = []
+        for (database, collection), declared in DECLARED_INDEXES.items():
+            live_keys = [key for key in self.live_indexes(database, collection).values()]
+            for name, key in declared.items():
+                if key not in live_keys:
+                    missing.append((database, collection, name, key))
+        return missing
+
+    def undeclared_live_indexes(self) -> List[Tuple[str, str, str, IndexKey]]:
+        """Indexes on the server that no service declares (other than ``_id_`` and dropped ones)."""
+        extra = []
+        for (database, collection), declared in DECLARED_INDEXES.items():
+            known_keys = list(declared.values()) + list(DROPPED_INDEXES.get((database, collection), {}).values())
+            for name, key in self.live_indexes(database, collection).items():
+                if name != "_id_" and key not in known_keys:
+                    extra.append((database, collection, name, key))
+        return extra
+
+    def dropped_live_indexes(self) -> List[Tuple[str, str, str, IndexKey]]:
+        """Indexes a later migration drops that are still on the server."""
+        stale = []
+        for (database, collection), dropped in DROPPED_INDEXES.items():
+            live = self.live_indexes(database, collection)
+            for name, key in live.items():
+                if key in dropped.values():
+                    stale.append((database, collection, name, key))
+        return stale
+
+
+def log_result(result: ShapeResult, max_ratio: float):
+    shape = result.shape
+    if result.error:
+        logger.error("  [ERROR]    %s (%s.%s): %s", shape.name, shape.database, shape.collection, result.error)
+        return
+    if result.collscan:
+        flag = "COLLSCAN"
+    elif result.ratio > max_ratio:
+        flag = "RATIO"
+    else:
+        flag = "ok"
+    logger.info("  [%-8s] %s (%s.%s)", flag, shape.name, shape.database, shape.collection)
+    logger.info("      source:   %s", shape.source)
+    logger.info("      plan:     %s%s", " <- ".join(result.stages) or "?",
+                f" (index: {', '.join(result.indexes_used)})" if result.indexes_used else "")
+    if result.timed_out:
+        logger.info("      stats:    timed out after maxTimeMS; plan only")
+    else:
+        logger.info(
+            "      stats:    %d docs examined / %d returned (ratio %.1f), %d keys examined, %d ms",
+            result.docs_examined, result.returned, result.ratio, result.keys_examined, result.millis,
+        )
+    if result.suggestion:
+        if result.served_by:
+            logger.info("      index:    %s exists as %s (%s)", _key_text(result.suggestion), result.served_by,
+                        "used" if result.served_by in result.indexes_used else "not chosen")
+        else:
+            logger.info("      suggest:  db.%s.createIndex(%s)", shape.collection, _key_text(result.suggestion))
+    if shape.note and flag != "ok":
+        logger.info("      note:     %s", shape.note)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Explain the script query shapes and suggest missing indexes",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Explain every registered shape
+  python index_advisor.py
+
+  # Only the short salesforce_id scans
+  python index_advisor.py --only=short_sf_ids
+
+  # Flag shapes examining more than 100 documents per result, write JSON
+  python index_advisor.py --max-ratio=100 --json=/tmp/index-advisor.json
+
+Environment Variables:
+  SPRING_DATA_MONGODB_URI - MongoDB connection string
+        """,
+    )
+    parser.add_argument("--mongo-uri", help="MongoDB URI (overrides env)")
+    parser.add_argument("--only", default=None, help="Only explain shapes whose name contains this text")
+    parser.add_argument(
+        "--max-ratio",
+        type=float,
+        default=DEFAULT_MAX_RATIO,
+        help=f"Flag shapes examining more documents per result than this (default: {DEFAULT_MAX_RATIO:g})",
+    )
+    parser.add_argument(
+        "--max-time-ms",
+        type=int,
+        default=DEFAULT_MAX_TIME_MS,
+        help=f"Time limit for each explain (default: {DEFAULT_MAX_TIME_MS})",
+    )
+    parser.add_argument("--json", default=None, help="Also write the results to this JSON file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+
+    config = Config()
+    mongo_uri = args.mongo_uri or config.mongo_uri
+    shapes = [shape for shape in SHAPES if not args.only or args.only in shape.name]
+    if not shapes:
+        logger.error("No query shape matches --only=%s", args.only)
+        return 1
+
+    logger.info("=" * 80)
+    logger.info("Index advisor")
+    logger.info("=" * 80)
+    logger.info("Databases:    %s", ", ".join(sorted({shape.database for shape in shapes})))
+    logger.info("Query shapes: %d", len(shapes))
+    logger.info("MongoDB URI:  %s...", mongo_uri[:20] if len(mongo_uri) > 20 else mongo_uri)
+    logger.info("=" * 80 + "\n")
+
+    registry = MongoConnectionRegistry(mongo_uri, max_pool_size=config.mongo_max_pool_size)
+
+    try:
+        if not registry.connect():
+            logger.error("Failed to connect to MongoDB. Exiting.")
+            return 1
+
+        advisor = IndexAdvisor(registry, max_ratio=args.max_ratio, max_time_ms=args.max_time_ms)
+
+        logger.info("\n" + "=" * 80)
+        logger.info("QUERY SHAPES (explain executionStats)")
+        logger.info("=" * 80)
+        results = []
+        for shape in shapes:
+            result = advisor.explain(shape)
+            log_result(result, args.max_ratio)
+            results.append(result)
+
+        logger.info("\n" + "=" * 80)
+        logger.info("DECLARED INDEXES (Java domain classes and migrations)")
+        logger.info("=" * 80)
+        missing = advisor.missing_declared_indexes()
+        for database, collection, name, key in missing:
+            logger.warning("  missing:    %s.%s %s %s", database, collection, name, _key_text(key))
+        undeclared = advisor.undeclared_live_indexes()
+        for database, collection, name, key in undeclared:
+            logger.info("  undeclared: %s.%s %s %s", database, collection, name, _key_text(key))
+        dropped = advisor.dropped_live_indexes()
+        for database, collection, name, key in dropped:
+            logger.warning("  dropped:    %s.%s %s %s (a later migration drops it)",
+                           database, collection, name, _key_text(key))
+        if not missing:
+            logger.info("  Every declared index exists")
+
+        flagged = [r for r in results if not r.error and (r.collscan or r.ratio > args.max_ratio)]
+        suggested = {
+            (r.shape.collection, tuple(r.suggestion)) for r in flagged if r.suggestion and not r.served_by
+        }
+        logger.info("\n" + "=" * 80)
+        logger.info("SUMMARY")
+        logger.info("=" * 80)
+        logger.info("  Shapes explained:         %d", len(results))
+        logger.info("  COLLSCAN:                 %d", sum(1 for r in results if r.collscan))
+        logger.info("  Over --max-ratio:         %d",
+                    sum(1 for r in results if not r.error and not r.collscan and r.ratio > args.max_ratio))
+        logger.info("  Errors:                   %d", sum(1 for r in results if r.error))
+        logger.info("  Declared indexes missing: %d", len(missing))
+        logger.info("  Dropped indexes present:  %d", len(dropped))
+        for collection, key in sorted(suggested):
+            logger.info("  suggest: db.%s.createIndex(%s)", collection, _key_text(list(key)))
+
+        if args.json:
+            report = {
+                "shapes": [r.as_dict() for r in results],
+                "missing_declared_indexes": [
+                    {"namespace": f"{d}.{c}", "name": n, "key": dict(k)} for d, c, n, k in missing
+                ],
+                "undeclared_indexes": [
+                    {"namespace": f"{d}.{c}", "name": n, "key": dict(k)} for d, c, n, k in undeclared
+                ],
+                "dropped_indexes_present": [
+                    {"namespace": f"{d}.{c}", "name": n, "key": dict(k)} for d, c, n, k in dropped
+                ],
+            }
+            with open(args.json, "w") as f:
+                json.dump(report, f, indent=2, default=json_util.default)
+            logger.info("\n  JSON report written to %s", args.json)
+
+        logger.info("=" * 80)
+        return 0
+
+    except KeyboardInterrupt:
+        logger.info("\n\n Operation cancelled by user (Ctrl+C)")
+        return 1
+    except Exception as e:
+        logger.error("\n Unexpected error: %s", e, exc_info=True)
+        return 1
+    finally:
+        registry.disconnect()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
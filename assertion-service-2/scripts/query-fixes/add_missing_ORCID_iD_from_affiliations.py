@@ -14,7 +14,8 @@ import argparse
 import sys
 from pathlib import Path
 from typing import List, Dict, Any
-from pymongo.errors import OperationFailure
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
 
 CURRENT_DIR = Path(__file__).resolve().parent
 UTILS_DIR = CURRENT_DIR.parent / "utils"
@@ -26,39 +27,58 @@ if str(UTILS_DIR) not in sys.path:
 from logger_config import setup_logger
 from db_connection import MongoDBConnection
 from config import Config
+from write_pipeline import BulkWritePipeline
+from write_throttle import get_write_throttle
+from batch_sizer import AdaptiveBatchSizer, SizedBatch
+from repository import AssertionRef, OrcidRecordRef, Repository
 
 # Set up logging
 logger = setup_logger(__name__, log_file='add-missing-ORCID-iD-from-affiliations.log')
 
+# Assertions pushed to ORCID (they have a put_code) without an orcid_id.
+MISSING_ORCID_ID = {
+    'orcid_id': {
+        '$exists': False
+    },
+    'put_code': {
+        '$exists': True,
+        '$ne': ''
+    }
+}
+
+# Assertions looked up with one orcid_record query at a time; the bulk_write
+# batches size themselves (see AdaptiveBatchSizer).
+BATCH_SIZE = 1000
+# How often (in assertions updated) to emit a progress line.
+PROGRESS_EVERY = 10_000
+
+
+def orcid_records_with_tokens(emails: List[str]) -> Dict[str, Any]:
+    """orcid_records of *emails* that hold at least one token."""
+    return {"email": {"$in": emails}, "tokens.0": {"$exists": True}}
+
 
 class AddMissingORCIDiDFROMAffiliations:
 
     def __init__(self, connection: MongoDBConnection, collection_assertion: str, collection_orcid_record: str, full_report: bool):
         self.connection = connection
         self.collection_assertion = connection.get_collection(collection_assertion)
-        self.collection_orcid_record = connection.get_collection(collection_orcid_record)
+        self.assertions = Repository(self.collection_assertion, AssertionRef)
+        self.orcid_records = Repository(connection.get_collection(collection_orcid_record), OrcidRecordRef)
         self.full_report = full_report
+        self.sizer = AdaptiveBatchSizer(name=collection_assertion, log=logger)
+        self.throttle = get_write_throttle(self.collection_assertion.database.client)
 
-    def find_problematic_assertions(self) -> List[Dict[str, Any]]:
+    def find_problematic_assertions(self) -> List[AssertionRef]:
         """
         Find assertions without Orcid iD.
 
         Returns:
             List of problematic assertions documents
         """
-        query = {
-            'orcid_id': {
-                '$exists': False
-            },
-            'put_code': {
-                '$exists': True,
-                '$ne': ''
-            }
-        }
-
         try:
             logger.info("Searching for problematic assertions...")
-            assertions = list(self.collection_assertion.find(query))
+            assertions = self.assertions.find_all(MISSING_ORCID_ID, AssertionRef.ORCID_MATCH)
             logger.info(f"Found {len(assertions)} assertions to fix")
             return assertions
         except OperationFailure as e:
@@ -68,7 +88,7 @@ class AddMissingORCIDiDFROMAffiliations:
             logger.error(f"Unexpected error during query: {e}")
             return []
 
-    def print_report(self, assertions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def print_report(self, assertions: List[AssertionRef]) -> List[Dict[str, Any]]:
         if not assertions:
             logger.info("No problematic assertions found")
             return []
@@ -82,39 +102,32 @@ class AddMissingORCIDiDFROMAffiliations:
         no_match = 0
 
         try:
-            for assertion in assertions:
-                assertion_salesforce_id = assertion.get('salesforce_id')
-                assertion_email = assertion.get('email')
-                if self.full_report:
-                    logger.info(
-                        f"  Assertion with Salesforce id {assertion_salesforce_id} and email {assertion_email}"
-                    )
-
-                orcid_record = self.collection_orcid_record.find_one({
-                    "email": assertion_email,
-                    "tokens": {
-                        "$exists": True,
-                        "$ne": [],
-                        "$elemMatch": {
-                            "salesforce_id": assertion_salesforce_id,
-                            "revoked_date": {"$exists": False}
-                        }
-                    }
-                })
-
-                if orcid_record:
-                    orcid = orcid_record.get('orcid')
-                    assertions_to_modify.append({
-                        "assertion_id": assertion.get('_id'),
-                        "assertion_email": assertion_email,
-                        "orcid": orcid
-                    })
-                    modified_count += 1
-                    logger.info(f"    Orcid {orcid} will be added to assertion with Salesforce id {assertion_salesforce_id} and email {assertion_email}")
-                else:
-                    no_match += 1
+            for start in range(0, len(assertions), BATCH_SIZE):
+                chunk = assertions[start:start + BATCH_SIZE]
+                records = self._orcid_records_for(chunk)
+
+                for assertion in chunk:
+                    assertion_salesforce_id = assertion.salesforce_id
+                    assertion_email = assertion.email
                     if self.full_report:
-                        logger.info("    No matching ORCID record found")
+                        logger.info(
+                            f"  Assertion with Salesforce id {assertion_salesforce_id} and email {assertion_email}"
+                        )
+
+                    orcid_record = records.get(assertion_email)
+                    if orcid_record and orcid_record.has_active_token(assertion_salesforce_id):
+                        orcid = orcid_record.orcid
+                        assertions_to_modify.append({
+                            "assertion_id": assertion.id,
+                            "assertion_email": assertion_email,
+                            "orcid": orcid
+                        })
+                        modified_count += 1
+                        logger.info(f"    Orcid {orcid} will be added to assertion with Salesforce id {assertion_salesforce_id} and email {assertion_email}")
+                    else:
+                        no_match += 1
+                        if self.full_report:
+                            logger.info("    No matching ORCID record found")
 
             logger.info("\n" + "="*80)
             logger.info(f"  It will modify {modified_count} assertions")
@@ -131,6 +144,13 @@ class AddMissingORCIDiDFROMAffiliations:
             logger.error(f"Unexpected error during report generation: {e}")
             return []
 
+    def _orcid_records_for(self, assertions: List[AssertionRef]) -> Dict[str, OrcidRecordRef]:
+        """Fetch the orcid_records for a chunk of assertions in one query, keyed by email."""
+        emails = list({a.email for a in assertions if a.email})
+        if not emails:
+            return {}
+        records = self.orcid_records.find(orcid_records_with_tokens(emails), OrcidRecordRef.ACTIVE_TOKENS)
+        return {record.email: record for record in records}
 
     def fix_assertions(self, assertions: List[Dict[str, Any]]) -> int:
         """
@@ -145,25 +165,31 @@ class AddMissingORCIDiDFROMAffiliations:
 
         logger.info(f"\n Applying fixes to {len(assertions)} assertions...")
 
-        modified_count = 0
+        reported = audited = 0
 
-        try:
+        def acknowledge(end: int, _written: int):
+            nonlocal reported, audited
+            # Audit trail: every assertion of an acknowledged batch, in order.
+            for a in assertions[audited:end]:
+                logger.info(f"Assertion updated Email:={a['assertion_email']}, orcid={a['orcid']}")
+            audited = end
+            if end - reported >= PROGRESS_EVERY:
+                reported = end
+                logger.info(f"  ... {pipeline.total} / {len(assertions)} assertions updated")
 
-            for assertion in assertions:
-                orcid = assertion["orcid"]
-                result = self.collection_assertion.update_one(
-                    {"_id": assertion["assertion_id"]},
-                    {
-                        "$set": {
-                            "orcid_id": orcid
-                        }
-                    }
-                )
-                modified_count += result.modified_count
-
-                logger.info(
-                    f"Assertion updated Email:={assertion['assertion_email']}, orcid={orcid}"
-                )
+        try:
+            with BulkWritePipeline(self._flush, on_ack=acknowledge, name='assertion-writer') as pipeline:
+                start = 0
+                while start < len(assertions):
+                    chunk = assertions[start:start + self.sizer.size]
+                    start += len(chunk)
+                    batch = SizedBatch()
+                    for a in chunk:
+                        query, update = {"_id": a["assertion_id"]}, {"$set": {"orcid_id": a["orcid"]}}
+                        batch.add(UpdateOne(query, update), query, update)
+                    pipeline.submit(batch, start)
+            modified_count = pipeline.total
+            self.sizer.log_summary()
 
             logger.info(f" Successfully updated {modified_count} assertions")
 
@@ -176,6 +202,21 @@ class AddMissingORCIDiDFROMAffiliations:
             logger.error(f" Unexpected error during update: {e}")
             return 0
 
+    def _flush(self, batch: SizedBatch) -> int:
+        """Write one batch unordered; return the number of assertions modified."""
+        self.throttle.wait(len(batch))
+        try:
+            with self.sizer.measure(batch):
+                result = self.collection_assertion.bulk_write(batch, ordered=False)
+            return result.modified_count
+        except BulkWriteError as bwe:
+            details = bwe.details or {}
+            errors = details.get('writeErrors', [])
+            logger.warning(f" Bulk write: {details.get('nModified', 0)} modified, {len(errors)} errors")
+            for err in errors[:5]:
+                logger.warning(f"    {err.get('errmsg', err)}")
+            return details.get('nModified', 0)
+
     def verify_fixes(self) -> bool:
         logger.info("\n Verifying fixes...")
         remaining = self.find_problematic_assertions()
@@ -7,10 +7,16 @@ member-service `member` collection, then makes a single pass over each related
 collection, writing the matching member_id via batched bulk updates.
 
 This single-pass design avoids per-member queries: each related collection is
-scanned a small, constant number of times regardless of how many members
-exist, and every write is keyed by `_id` (always indexed). It therefore does
-NOT depend on `salesforce_id` being indexed on the related collections
-(it is not, on orcid_record / send_notifications_request / jhi_user).
+scanned exactly once regardless of how many members exist, and every write is
+keyed by `_id` (always indexed). It therefore does NOT depend on
+`salesforce_id` being indexed on the related collections (it is not, on
+orcid_record / send_notifications_request / jhi_user).
+
+The planning scan writes every required change (`_id`, old value, new value)
+to an on-disk BSON plan under --plan-dir. The apply phase replays that plan
+and verification re-reads only the planned `_id`s with a projection, so the
+collections are not rescanned. Each acknowledged batch is checkpointed, and
+--resume continues an interrupted apply phase from the last checkpoint.
 
 A single member can still be targeted with --source for testing.
 
@@ -25,14 +31,24 @@ Related to: https://orcid.clickup.com/t/9014437828/PD-5585
 Usage:
     python backfill_member_id.py                              # backfill ALL members
     python backfill_member_id.py --source=0012i00000aQxlxAAC  # backfill one member only
+    python backfill_member_id.py --plan-dir=/tmp/plans        # keep plan files elsewhere
+    python backfill_member_id.py --resume                     # continue the latest interrupted run
+    python backfill_member_id.py --partitions=8               # scan large collections in 8 parallel _id ranges
+    python backfill_member_id.py --server-side                # $lookup/$merge inside MongoDB
+    python backfill_member_id.py --token-writes=array-filters # address orcid_record tokens by salesforce_id
 """
 
 import argparse
 import re
 import sys
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Tuple, Set
-from pymongo import UpdateOne
+from typing import TYPE_CHECKING, Any, List, Dict, Optional, Tuple, Set
+from bson import encode
+from bson.raw_bson import RawBSONDocument
 from pymongo.collection import Collection
 from pymongo.errors import OperationFailure, BulkWriteError
 
@@ -44,18 +60,42 @@ if str(UTILS_DIR) not in sys.path:
 
 # Import shared modules
 from logger_config import setup_logger
-from db_connection import MongoDBConnection
+from db_connection import MongoConnectionRegistry
 from config import Config
+from backfill_plan import BackfillPlan, PlanWriter
+from partitioning import id_ranges, range_filter
+from write_pipeline import BulkWritePipeline
+from write_throttle import get_write_throttle
+from batch_sizer import AdaptiveBatchSizer
+from chunked_lookup import DEFAULT_LOOKUP_WORKERS, chunk_values, find_in_chunks
+from raw_bulk import RawBatch, RawBulkWriter, encode_update
+
+if TYPE_CHECKING:
+    from db_connection import MongoDBConnection
 
 # Set up logging
 logger = setup_logger(__name__, log_file='backfill-member-id.log')
 
 SALESFORCE_ID_PATTERN = re.compile(r"^[a-zA-Z0-9]{18}$")
 
-# Number of bulk operations to accumulate before flushing to MongoDB.
+# Planned _ids re-read per verification query, and staged pairs per insert.
+# Bulk writes size their own batches (see AdaptiveBatchSizer).
 BATCH_SIZE = 1000
 # How often (in documents scanned) to emit a progress line.
 PROGRESS_EVERY = 100_000
+# Plan name used for plan directories, and the --resume value meaning "newest".
+PLAN_NAME = 'backfill-member-id'
+LATEST_PLAN = 'latest'
+# How orcid_record token updates address the token: by its array position at
+# planning time, or by salesforce_id through array filters.
+TOKEN_WRITES_INDEX = 'index'
+TOKEN_WRITES_ARRAY_FILTERS = 'array-filters'
+
+# Fields read by the planning scans.
+TOP_LEVEL_SCAN_PROJECTION = {'_id': 1, 'salesforce_id': 1, 'member_id': 1}
+ORCID_RECORD_SCAN_PROJECTION = {'_id': 1, 'tokens.salesforce_id': 1, 'tokens.member_id': 1}
+# Partitioned scans walk the _id index so each worker only touches its own range.
+PARTITION_HINT = [('_id', 1)]
 
 
 class InvalidSalesforceIdError(ValueError):
@@ -82,7 +122,7 @@ def validate_salesforce_id(value: str) -> str:
 class MemberRepository:
     """Read-only access to the member-service `member` collection."""
 
-    def __init__(self, connection_to_db: MongoDBConnection):
+    def __init__(self, connection_to_db: 'MongoDBConnection'):
         self.collection_member = connection_to_db.get_collection('member')
 
     def build_salesforce_to_member_map(self, source_filter: str = None) -> Dict[str, str]:
@@ -147,19 +187,114 @@ class MemberRepository:
         return sf_map
 
 
-class _BulkBackfiller:
-    """Shared bulk-write plumbing for the single-pass backfillers."""
+class _BulkBackfiller(ABC):
+    """Shared plan/apply/verify plumbing for the single-pass backfillers.
+
+    The planning scan records every required change in a `BackfillPlan`; the
+    apply phase replays that plan as `_id`-keyed bulk updates and the verify
+    phase re-reads only the planned `_id`s, so each collection is scanned once.
+    Plan entries are encoded straight into `update` command statements
+    (see raw_bulk), so no per-document UpdateOne is built.
+    """
 
     def __init__(self, collection: Collection, label: str):
         self.collection = collection
         self.label = label
+        self.sizer = AdaptiveBatchSizer(name=label, log=logger)
+        self.writer = RawBulkWriter(collection)
+        self.throttle = get_write_throttle(collection.database.client)
+
+    @abstractmethod
+    def _statement_for(self, entry: Dict[str, Any]) -> RawBSONDocument:
+        """Encoded `update` statement applying one plan entry."""
+
+    @abstractmethod
+    def _entry_applied(self, entry: Dict[str, Any], doc: Dict[str, Any]) -> bool:
+        """Whether the re-read *doc* carries the change planned in *entry*."""
+
+    @abstractmethod
+    def _verify_projection(self) -> Dict[str, int]:
+        """Projection for the verify re-read."""
+
+    def apply(self, plan: BackfillPlan) -> int:
+        """Replay the planned changes in batches; return documents modified.
 
-    def _flush(self, batch: List[UpdateOne]) -> int:
+        After every acknowledged batch the plan checkpoint records how many
+        entries (and which last `_id`) are done, so a rerun with --resume
+        continues after them instead of starting over.
+        """
+        total = plan.count(self.label)
+        replayed = plan.applied(self.label)
+        modified = plan.modified(self.label)
+        if replayed:
+            logger.info("  Resuming %s at entry %d / %d (after _id %s)",
+                        self.label, replayed, total, plan.last_id(self.label))
+        else:
+            logger.info("  Applying %d planned %s updates ...", total, self.label)
+
+        reported = replayed
+
+        def acknowledge(position: Tuple[int, Any], written: int):
+            nonlocal modified, reported
+            modified += written
+            applied, last_id = position
+            plan.checkpoint(self.label, applied, last_id, modified)
+            if applied - reported >= PROGRESS_EVERY:
+                reported = applied
+                logger.info("   ...%s: %d / %d applied", self.label, applied, total)
+
+        # Reading the plan continues while earlier batches are being written.
+        queued = replayed
+        batch = RawBatch.updates()
+        with BulkWritePipeline(self._flush, on_ack=acknowledge, name=f"{self.label}-writer") as pipeline:
+            for entry in plan.entries(self.label, skip=replayed):
+                batch.append(self._statement_for(entry))
+                if len(batch) >= self.sizer.size:
+                    queued += len(batch)
+                    pipeline.submit(batch, (queued, entry['_id']))
+                    batch = RawBatch.updates()
+            if batch:
+                queued += len(batch)
+                pipeline.submit(batch, (queued, entry['_id']))
+        self.sizer.log_summary()
+        return modified
+
+    def verify(self, plan: BackfillPlan) -> int:
+        """Re-read only the planned `_id`s; return how many still need a change."""
+        remaining = 0
+        chunk: Dict[Any, Dict[str, Any]] = {}
+        for entry in plan.entries(self.label):
+            chunk[entry['_id']] = entry
+            if len(chunk) >= BATCH_SIZE:
+                remaining += self._verify_chunk(chunk)
+                chunk = {}
+        if chunk:
+            remaining += self._verify_chunk(chunk)
+        return remaining
+
+    def _verify_chunk(self, chunk: Dict[Any, Dict[str, Any]]) -> int:
+        # Documents deleted since planning are not found and need nothing.
+        remaining = 0
+        try:
+            cursor = self.collection.find(
+                {'_id': {'$in': list(chunk.keys())}}, self._verify_projection()
+            )
+            for doc in cursor:
+                if not self._entry_applied(chunk[doc['_id']], doc):
+                    remaining += 1
+        except OperationFailure as e:
+            logger.error(f" Verification read failed on {self.label}: {e}")
+            raise BackfillError(f"{self.label} verification failed: {e}") from e
+        return remaining
+
+    def _flush(self, batch: RawBatch) -> int:
         """Write a batch of updates, returning the number of documents modified."""
         if not batch:
             return 0
+        self.throttle.wait(len(batch))
         try:
-            return self.collection.bulk_write(batch, ordered=False).modified_count
+            with self.sizer.measure(batch):
+                return self.writer.execute(batch).modified_count
         except (BulkWriteError, OperationFailure) as e:
             detail = getattr(e, 'details', e)
             logger.error(f" Bulk write failed on {self.label}: {detail}")
@@ -167,106 +302,574 @@ class _BulkBackfiller:
 
 
 class TopLevelBackfiller(_BulkBackfiller):
-    """Backfill member_id on a collection with top-level salesforce_id/member_id."""
+    """Backfill member_id on a collection with top-level salesforce_id/member_id.
+
+    Plan entries: ``{_id, old, new}`` with the previous and target member_id.
+    """
+
+    def scan(self, sf_map: Dict[str, str], sf_ids: List[str], plan: BackfillPlan,
+             partitions: int = 1) -> Tuple[int, int]:
+        """Single read-only pass over the collection, recording changes in *plan*.
 
-    def scan(self, sf_map: Dict[str, str], sf_ids: List[str], apply: bool) -> Tuple[int, int, int]:
-        """Single pass over the collection.
+        With ``partitions > 1`` the `_id` keyspace is split into ranges that
+        are scanned concurrently, each by its own thread, cursor and plan part
+        file; the per-range counts are summed.
 
-        Returns (scanned, needs_update, modified). When `apply` is False no
-        writes happen and `modified` is 0.
+        Returns (scanned, needs_update).
         """
-        logger.info("  Scanning %s%s ...", self.label, " (applying updates)" if apply else "")
-        scanned = needs_update = modified = 0
-        batch: List[UpdateOne] = []
-        cursor = self.collection.find(
-            {'salesforce_id': {'$in': sf_ids}},
-            {'_id': 1, 'salesforce_id': 1, 'member_id': 1},
+        ranges = id_ranges(self.collection, partitions)
+        if len(ranges) == 1:
+            logger.info("  Scanning %s ...", self.label)
+            with plan.writer(self.label) as writer:
+                scanned, needs_update = self._scan_range(sf_map, sf_ids, writer, None, None, self.label)
+            plan.record(self.label, writer, scanned=scanned)
+            return scanned, needs_update
+
+        logger.info("  Scanning %s in %d _id ranges ...", self.label, len(ranges))
+        writers = [plan.writer(self.label, part) for part in range(len(ranges))]
+        try:
+            with ThreadPoolExecutor(max_workers=len(ranges), thread_name_prefix=self.label) as pool:
+                futures = [
+                    pool.submit(self._scan_range, sf_map, sf_ids, writer, lower, upper,
+                                f"{self.label}[{part}]")
+                    for part, (writer, (lower, upper)) in enumerate(zip(writers, ranges))
+                ]
+                results = [future.result() for future in futures]
+        finally:
+            for writer in writers:
+                writer.close()
+
+        scanned = sum(r[0] for r in results)
+        needs_update = sum(r[1] for r in results)
+        plan.record(self.label, *writers, scanned=scanned, partitions=len(ranges))
+        return scanned, needs_update
+
+    def _scan_range(self, sf_map: Dict[str, str], sf_ids: List[str], writer: PlanWriter,
+                    lower: Any, upper: Any, label: str) -> Tuple[int, int]:
+        """Scan ``lower <= _id < upper`` into *writer*, salesforce_ids chunked by BSON size."""
+        scanned = needs_update = 0
+        partitioned = lower is not None or upper is not None
+        cursor = find_in_chunks(
+            self.collection,
+            'salesforce_id',
+            sf_ids,
+            query=range_filter(lower, upper),
+            projection=TOP_LEVEL_SCAN_PROJECTION,
+            # Ranges already run in parallel; don't multiply threads per range.
+            workers=1 if partitioned else DEFAULT_LOOKUP_WORKERS,
+            hint=PARTITION_HINT if partitioned else None,
             no_cursor_timeout=True,
         )
         try:
             for doc in cursor:
                 scanned += 1
                 if scanned % PROGRESS_EVERY == 0:
-                    logger.info("   ...%s: scanned %d, %d need update", self.label, scanned, needs_update)
+                    logger.info("   ...%s: scanned %d, %d need update", label, scanned, needs_update)
 
                 target = sf_map.get(doc.get('salesforce_id'))
                 if target is None or doc.get('member_id') == target:
                     continue
 
                 needs_update += 1
-                if apply:
-                    batch.append(UpdateOne(
-                        {'_id': doc['_id']},
-                        {'$set': {'member_id': target}},
-                    ))
-                    if len(batch) >= BATCH_SIZE:
-                        modified += self._flush(batch)
-                        batch = []
-
-            if apply:
-                modified += self._flush(batch)
+                writer.write({'_id': doc['_id'], 'old': doc.get('member_id'), 'new': target})
         finally:
             cursor.close()
 
-        return scanned, needs_update, modified
+        return scanned, needs_update
+
+    def _statement_for(self, entry: Dict[str, Any]) -> RawBSONDocument:
+        return encode_update({'_id': entry['_id']}, {'$set': {'member_id': entry['new']}})
+
+    def _verify_projection(self) -> Dict[str, int]:
+        return {'_id': 1, 'member_id': 1}
+
+    def _entry_applied(self, entry: Dict[str, Any], doc: Dict[str, Any]) -> bool:
+        return doc.get('member_id') == entry['new']
 
 
 class OrcidRecordBackfiller(_BulkBackfiller):
-    """Backfill tokens[].member_id on the orcid_record collection."""
+    """Backfill tokens[].member_id on the orcid_record collection.
+
+    Plan entries: ``{_id, tokens: [{i, sf, old, new}]}``, one item per token
+    that needs a member_id.  Token contents other than salesforce_id/member_id
+    never reach the plan file.
+
+    Either way only the changed ``member_id`` fields are written, never the
+    whole ``tokens`` array.  With ``token_writes='index'`` each token is
+    addressed by its position at planning time (guarded by its salesforce_id);
+    with ``'array-filters'`` by salesforce_id through ``tokens.$[tN]``, so
+    tokens added or reordered by the member portal since planning are still
+    updated correctly.
+    """
 
-    def __init__(self, collection: Collection):
+    def __init__(self, collection: Collection, token_writes: str = TOKEN_WRITES_INDEX):
         super().__init__(collection, 'orcid_record')
+        self.token_writes = token_writes
 
-    def scan(self, sf_map: Dict[str, str], sf_ids: List[str], apply: bool) -> Tuple[int, int, int, int]:
-        """Single pass over the collection.
+    def scan(self, sf_map: Dict[str, str], sf_ids: List[str], plan: BackfillPlan) -> Tuple[int, int, int]:
+        """Single read-only pass over the collection, recording changes in *plan*.
 
-        Returns (scanned, docs_needing_update, tokens_needing_update, modified).
-        Each affected document has its whole `tokens` array rewritten, changing
-        only the member_id of tokens that need it; all other fields are kept.
+        Only each token's salesforce_id and member_id are read.  The update
+        bytes saved over rewriting ``tokens`` are estimated from that
+        projection, so the rewrite size is a lower bound (other token fields
+        would be rewritten too).
+
+        Returns (scanned, docs_needing_update, tokens_needing_update).
         """
-        logger.info("  Scanning %s%s ...", self.label, " (applying updates)" if apply else "")
-        scanned = docs_needing = tokens_needing = modified = 0
-        batch: List[UpdateOne] = []
+        logger.info("  Scanning %s ...", self.label)
+        scanned = docs_needing = tokens_needing = 0
+        rewrite_bytes = targeted_bytes = 0
         cursor = self.collection.find(
             {'tokens.salesforce_id': {'$in': sf_ids}},
-            {'_id': 1, 'tokens': 1},
+            ORCID_RECORD_SCAN_PROJECTION,
             no_cursor_timeout=True,
         )
         try:
-            for doc in cursor:
-                scanned += 1
-                if scanned % PROGRESS_EVERY == 0:
-                    logger.info("   ...%s: scanned %d, %d need update", self.label, scanned, docs_needing)
-
-                tokens = doc.get('tokens') or []
-                doc_changed = False
-                for token in tokens:
-                    target = sf_map.get(token.get('salesforce_id'))
-                    if target is None or token.get('member_id') == target:
+            with plan.writer(self.label) as writer:
+                for doc in cursor:
+                    scanned += 1
+                    if scanned % PROGRESS_EVERY == 0:
+                        logger.info("   ...%s: scanned %d, %d need update", self.label, scanned, docs_needing)
+
+                    tokens = doc.get('tokens') or []
+                    changes = []
+                    for i, token in enumerate(tokens):
+                        salesforce_id = token.get('salesforce_id')
+                        target = sf_map.get(salesforce_id)
+                        if target is None or token.get('member_id') == target:
+                            continue
+                        changes.append({'i': i, 'sf': salesforce_id, 'old': token.get('member_id'), 'new': target})
+
+                    if not changes:
                         continue
-                    token['member_id'] = target
-                    tokens_needing += 1
-                    doc_changed = True
-
-                if not doc_changed:
-                    continue
 
-                docs_needing += 1
-                if apply:
-                    batch.append(UpdateOne(
-                        {'_id': doc['_id']},
-                        {'$set': {'tokens': tokens}},
-                    ))
-                    if len(batch) >= BATCH_SIZE:
-                        modified += self._flush(batch)
-                        batch = []
-
-            if apply:
-                modified += self._flush(batch)
+                    docs_needing += 1
+                    tokens_needing += len(changes)
+                    entry = {'_id': doc['_id'], 'tokens': changes}
+                    writer.write(entry)
+                    rewrite_bytes += self._rewrite_size(tokens, changes)
+                    _, update, array_filters = self._token_update(entry)
+                    targeted_bytes += len(encode(update))
+                    if array_filters:
+                        targeted_bytes += len(encode({'arrayFilters': array_filters}))
+                plan.record(self.label, writer, scanned=scanned, tokens=tokens_needing,
+                            rewrite_bytes=rewrite_bytes, targeted_bytes=targeted_bytes)
         finally:
             cursor.close()
 
-        return scanned, docs_needing, tokens_needing, modified
+        return scanned, docs_needing, tokens_needing
+
+    @staticmethod
+    def _rewrite_size(tokens: List[Dict[str, Any]], changes: List[Dict[str, Any]]) -> int:
+        """Encoded size of the equivalent ``{'$set': {'tokens': [...]}}`` rewrite."""
+        rewritten = [dict(token) for token in tokens]
+        for change in changes:
+            rewritten[change['i']]['member_id'] = change['new']
+        return len(encode({'$set': {'tokens': rewritten}}))
+
+    def log_oplog_savings(self, plan: BackfillPlan):
+        """Report the update bytes saved versus rewriting each whole ``tokens`` array.
+
+        The oplog records an update roughly as its changed fields, so this is
+        also the approximate oplog (and replication) volume saved.
+        """
+        recorded = plan.manifest['collections'].get(self.label, {})
+        rewrite = recorded.get('rewrite_bytes')
+        targeted = recorded.get('targeted_bytes')
+        if not rewrite or targeted is None:
+            return
+        logger.info(
+            " orcid_record update volume: %.1f KB targeted vs at least %.1f KB for full tokens rewrites "
+            "(>= ~%.1f KB / %.0f%% less oplog)",
+            targeted / 1024, rewrite / 1024, (rewrite - targeted) / 1024,
+            100.0 * (rewrite - targeted) / rewrite,
+        )
+
+    def _statement_for(self, entry: Dict[str, Any]) -> RawBSONDocument:
+        query, update, array_filters = self._token_update(entry)
+        return encode_update(query, update, array_filters)
+
+    def _token_update(self, entry: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any], Optional[List[Dict[str, Any]]]]:
+        """Return (filter, update, array_filters) for one plan entry."""
+        query: Dict[str, Any] = {'_id': entry['_id']}
+        update: Dict[str, Any] = {}
+        if self.token_writes == TOKEN_WRITES_ARRAY_FILTERS:
+            # One identifier per salesforce_id: every token of that member gets
+            # the member_id wherever it sits in the array when the write lands.
+            array_filters: List[Dict[str, Any]] = []
+            for n, (salesforce_id, member_id) in enumerate(
+                    sorted({(c['sf'], c['new']) for c in entry['tokens']})):
+                update[f"tokens.$[t{n}].member_id"] = member_id
+                array_filters.append({f"t{n}.salesforce_id": salesforce_id})
+            return query, {'$set': update}, array_filters
+
+        # Guard each positional write with the salesforce_id seen at planning
+        # time so a token array reshuffled since then is left alone (and then
+        # reported by verification) rather than written at the wrong index.
+        for change in entry['tokens']:
+            query[f"tokens.{change['i']}.salesforce_id"] = change['sf']
+            update[f"tokens.{change['i']}.member_id"] = change['new']
+        return query, {'$set': update}, None
+
+    def _verify_projection(self) -> Dict[str, int]:
+        return {'_id': 1, 'tokens.salesforce_id': 1, 'tokens.member_id': 1}
+
+    def _entry_applied(self, entry: Dict[str, Any], doc: Dict[str, Any]) -> bool:
+        tokens = doc.get('tokens') or []
+        if self.token_writes == TOKEN_WRITES_ARRAY_FILTERS:
+            return all(
+                token.get('member_id') == change['new']
+                for change in entry['tokens']
+                for token in tokens
+                if token.get('salesforce_id') == change['sf']
+            )
+        return all(
+            change['i'] < len(tokens) and tokens[change['i']].get('member_id') == change['new']
+            for change in entry['tokens']
+        )
+
+
+class MemberIdStage:
+    """Temporary ``{_id: salesforce_id, member_id}`` collection for server-side joins.
+
+    `$lookup` only joins within one database, so the map is staged in every
+    database that holds a collection to backfill and dropped afterwards.
+    """
+
+    def __init__(self, sf_map: Dict[str, str]):
+        self.sf_map = sf_map
+        self.name = f"tmp_backfill_member_id_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        self._staged: List[Collection] = []
+
+    def stage(self, connection: 'MongoDBConnection') -> str:
+        """Create the staging collection in *connection*'s database; return its name."""
+        collection = connection.get_collection(self.name)
+        docs = [{'_id': sf, 'member_id': mid} for sf, mid in self.sf_map.items()]
+        try:
+            for start in range(0, len(docs), BATCH_SIZE):
+                collection.insert_many(docs[start:start + BATCH_SIZE], ordered=False)
+        except (BulkWriteError, OperationFailure) as e:
+            collection.drop()
+            raise BackfillError(f"Failed to stage member map in {connection.database_name}: {e}") from e
+        self._staged.append(collection)
+        logger.info("  Staged %d salesforce_id -> member_id pairs in %s.%s",
+                    len(docs), connection.database_name, self.name)
+        return self.name
+
+    def drop(self):
+        for collection in self._staged:
+            try:
+                collection.drop()
+            except OperationFailure as e:
+                logger.warning(" Could not drop staging collection %s: %s", collection.full_name, e)
+        self._staged = []
+
+
+class _ServerSideBackfiller(ABC):
+    """Backfill entirely inside MongoDB: `$lookup` the staged map, then `$merge`.
+
+    Counts come from a `$group` over the same pipeline, so documents never
+    cross the network in either the dry run or the apply phase.  The
+    salesforce_ids are sorted and split into BSON-sized `$in` chunks; each
+    document is counted and merged by exactly one chunk, the one holding
+    the smallest of its salesforce_ids in the map.
+    """
+
+    def __init__(self, collection: Collection, label: str, stage_name: str, sf_ids: List[str]):
+        self.collection = collection
+        self.label = label
+        self.stage_name = stage_name
+        self.chunks = list(chunk_values(sorted(sf_ids)))
+
+    @abstractmethod
+    def _join(self, chunk: List[str]) -> List[Dict[str, Any]]:
+        """Pipeline prefix for the documents owned by *chunk*, ending in a numeric `_changed` field."""
+
+    @abstractmethod
+    def _rewrite(self) -> Dict[str, Any]:
+        """`$project` stage producing the fields to merge back."""
+
+    def _when_matched(self) -> Any:
+        """`$merge` whenMatched action applied to the current document."""
+        return 'merge'
+
+    def count(self) -> Tuple[int, int, int]:
+        """Return (scanned, docs_needing_update, items_needing_update)."""
+        scanned = docs = items = 0
+        for chunk in self.chunks:
+            pipeline = self._join(chunk) + [{'$group': {
+                '_id': None,
+                'scanned': {'$sum': 1},
+                'docs': {'$sum': {'$cond': [{'$gt': ['$_changed', 0]}, 1, 0]}},
+                'items': {'$sum': '$_changed'},
+            }}]
+            try:
+                result = list(self.collection.aggregate(pipeline, allowDiskUse=True))
+            except OperationFailure as e:
+                logger.error(f" Server-side count failed on {self.label}: {e}")
+                raise BackfillError(f"{self.label} server-side count failed: {e}") from e
+            if result:
+                scanned += result[0]['scanned']
+                docs += result[0]['docs']
+                items += result[0]['items']
+        return scanned, docs, items
+
+    def apply(self):
+        """Rewrite the documents that need it with one `$merge` per salesforce_id chunk."""
+        logger.info("  Merging %s server-side (%d chunk(s)) ...", self.label, len(self.chunks))
+        for chunk in self.chunks:
+            pipeline = self._join(chunk) + [
+                {'$match': {'_changed': {'$gt': 0}}},
+                self._rewrite(),
+                {'$merge': {
+                    'into': self.collection.name,
+                    'on': '_id',
+                    'whenMatched': self._when_matched(),
+                    'whenNotMatched': 'discard',
+                }},
+            ]
+            try:
+                self.collection.aggregate(pipeline, allowDiskUse=True)
+            except OperationFailure as e:
+                logger.error(f" Server-side merge failed on {self.label}: {e}")
+                raise BackfillError(f"{self.label} server-side merge failed: {e}") from e
+
+
+class TopLevelServerSideBackfiller(_ServerSideBackfiller):
+    """Server-side member_id backfill for top-level salesforce_id/member_id."""
+
+    def _join(self, chunk: List[str]) -> List[Dict[str, Any]]:
+        # A single-valued salesforce_id only ever matches one chunk.
+        return [
+            {'$match': {'salesforce_id': {'$in': chunk}}},
+            {'$project': {'salesforce_id': 1, 'member_id': 1}},
+            {'$lookup': {
+                'from': self.stage_name,
+                'localField': 'salesforce_id',
+                'foreignField': '_id',
+                'as': '_map',
+            }},
+            {'$set': {'_target': {'$arrayElemAt': ['$_map.member_id', 0]}}},
+            {'$set': {'_changed': {'$cond': [
+                {'$and': [
+                    {'$ne': [{'$ifNull': ['$_target', None]}, None]},
+                    {'$ne': ['$_target', {'$ifNull': ['$member_id', None]}]},
+                ]},
+                1, 0,
+            ]}}},
+        ]
+
+    def _rewrite(self) -> Dict[str, Any]:
+        return {'$project': {'_id': 1, 'member_id': '$_target'}}
+
+
+class OrcidRecordServerSideBackfiller(_ServerSideBackfiller):
+    """Server-side tokens[].member_id backfill for orcid_record.
+
+    The merge carries only the salesforce_id -> member_id pairs; the
+    whenMatched pipeline applies them to the record's tokens as they are
+    when the write happens, so tokens added or reordered since the read are
+    kept (the equivalent of addressing tokens by salesforce_id with array
+    filters).
+    """
+
+    def __init__(self, collection: Collection, stage_name: str, sf_ids: List[str]):
+        super().__init__(collection, 'orcid_record', stage_name, sf_ids)
+
+    def _join(self, chunk: List[str]) -> List[Dict[str, Any]]:
+        return [
+            {'$match': {'tokens.salesforce_id': {'$in': chunk}}},
+            {'$project': {'tokens.salesforce_id': 1, 'tokens.member_id': 1}},
+            {'$lookup': {
+                'from': self.stage_name,
+                'localField': 'tokens.salesforce_id',
+                'foreignField': '_id',
+                'as': '_map',
+            }},
+            # A record with tokens in several chunks belongs to the chunk of its smallest one.
+            {'$set': {'_owner': {'$min': '$_map._id'}}},
+            {'$match': {'_owner': {'$gte': chunk[0], '$lte': chunk[-1]}}},
+            {'$set': {'_changed': {'$size': {'$filter': {
+                'input': {'$ifNull': ['$tokens', []]},
+                'as': 't',
+                'cond': {'$let': {
+                    'vars': {'target': {'$arrayElemAt': [
+                        {'$map': {
+                            'input': {'$filter': {
+                                'input': '$_map',
+                                'as': 'm',
+                                'cond': {'$eq': ['$$m._id', '$$t.salesforce_id']},
+                            }},
+                            'as': 'm',
+                            'in': '$$m.member_id',
+                        }},
+                        0,
+                    ]}},
+                    'in': {'$and': [
+                        {'$ne': [{'$ifNull': ['$$target', None]}, None]},
+                        {'$ne': ['$$target', {'$ifNull': ['$$t.member_id', None]}]},
+                    ]},
+                }},
+            }}}}},
+        ]
+
+    def _rewrite(self) -> Dict[str, Any]:
+        return {'$project': {'_id': 1, '_map': 1}}
+
+    def _when_matched(self) -> List[Dict[str, Any]]:
+        return [{'$set': {'tokens': {'$map': {
+            'input': {'$ifNull': ['$tokens', []]},
+            'as': 't',
+            'in': {'$let': {
+                'vars': {'m': {'$arrayElemAt': [
+                    {'$filter': {
+                        'input': '$$new._map',
+                        'as': 'm',
+                        'cond': {'$eq': ['$$m._id', '$$t.salesforce_id']},
+                    }},
+                    0,
+                ]}},
+                'in': {'$cond': [
+                    {'$eq': [{'$ifNull': ['$$m.member_id', None]}, None]},
+                    '$$t',
+                    {'$mergeObjects': ['$$t', {'member_id': '$$m.member_id'}]},
+                ]},
+            }},
+        }}}}]
+
+
+def run_server_side(sf_map: Dict[str, str], connection_assertionservice: 'MongoDBConnection',
+                    connection_userservice: 'MongoDBConnection') -> int:
+    """Count, confirm, `$merge` and re-count entirely inside MongoDB."""
+    sf_ids = list(sf_map.keys())
+    stage = MemberIdStage(sf_map)
+    try:
+        logger.info("\n" + "="*80)
+        logger.info("PLANNING (server-side): staging member map and counting with $group")
+        logger.info("(no writes to related collections happen in this phase)")
+        logger.info("="*80)
+
+        assertion_stage = stage.stage(connection_assertionservice)
+        user_stage = stage.stage(connection_userservice)
+
+        backfillers = [
+            TopLevelServerSideBackfiller(
+                connection_assertionservice.get_collection('assertion'), 'assertion',
+                assertion_stage, sf_ids),
+            OrcidRecordServerSideBackfiller(
+                connection_assertionservice.get_collection('orcid_record'), assertion_stage, sf_ids),
+            TopLevelServerSideBackfiller(
+                connection_assertionservice.get_collection('send_notifications_request'),
+                'send_notifications_request', assertion_stage, sf_ids),
+            TopLevelServerSideBackfiller(
+                connection_userservice.get_collection('jhi_user'), 'jhi_user', user_stage, sf_ids),
+        ]
+
+        counts = {bf.label: bf.count() for bf in backfillers}
+        logger.info("")
+        for label, (scanned, docs, items) in counts.items():
+            logger.info(" %-28s scanned %d, %d need member_id%s", label + ':', scanned, docs,
+                        f" ({items} tokens)" if label == 'orcid_record' else "")
+
+        if not any(docs for _, docs, _ in counts.values()):
+            logger.info(
+                "\n member_id is already backfilled on all related records "
+                "for the %d member(s) in scope. Nothing to do.",
+                len(sf_map),
+            )
+            return 0
+
+        exit_code = confirm_backfill(
+            len(sf_map), counts['assertion'][1], counts['orcid_record'][1], counts['orcid_record'][2],
+            counts['send_notifications_request'][1], counts['jhi_user'][1],
+        )
+        if exit_code is not None:
+            return exit_code
+
+        logger.info("\n" + "="*80)
+        logger.info("EXECUTING BACKFILL (server-side $merge)")
+        logger.info("="*80)
+
+        for bf in backfillers:
+            if counts[bf.label][1]:
+                started = time.monotonic()
+                bf.apply()
+                # $merge reports no counts; verification below re-counts what is left.
+                logger.info(" %s: $merge done in %.1fs (%d documents planned)",
+                            bf.label, time.monotonic() - started, counts[bf.label][1])
+
+        logger.info("\n" + "="*80)
+        logger.info("VERIFYING BACKFILL")
+        logger.info("="*80)
+
+        left = {bf.label: bf.count()[1] for bf in backfillers}
+        if any(left.values()):
+            logger.warning(
+                " Verification failed: %d records still missing or mismatched (%s)",
+                sum(left.values()), ", ".join(f"{k}={v}" for k, v in left.items()),
+            )
+            return 1
+
+        logger.info(" Verification passed: all related records carry the expected member_id")
+        return 0
+    finally:
+        stage.drop()
+
+
+def confirm_backfill(members_in_scope: int, a_needs: int, o_docs_needs: int, o_tokens_needs: int,
+                     n_needs: int, u_needs: int) -> Optional[int]:
+    """Show the pending changes and ask to proceed.
+
+    Returns None to proceed, otherwise the exit code to stop with.
+    """
+    logger.info("\n" + "="*80)
+    logger.info("  WARNING: This will modify the database!")
+    logger.info(f"  Members in scope:               {members_in_scope}")
+    logger.info(f"  assertion docs to update:       {a_needs}")
+    logger.info(f"  orcid_record docs to update:    {o_docs_needs}  ({o_tokens_needs} tokens)")
+    logger.info(f"  send_notifications to update:   {n_needs}")
+    logger.info(f"  jhi_user docs to update:        {u_needs}")
+    logger.info("  Member documents themselves will NOT be modified")
+    logger.info("="*80)
+
+    try:
+        response = input("\nDo you want to proceed? (yes/no): ").strip().lower()
+        if response not in ('yes', 'y'):
+            logger.info("\n Operation cancelled by user")
+            return 0
+    except (KeyboardInterrupt, EOFError):
+        logger.info("\n\n Operation cancelled by user")
+        return 1
+    return None
+
+
+def load_resume_plan(resume: str, plan_dir: str, source_filter: str = None,
+                     token_writes: str = TOKEN_WRITES_INDEX) -> BackfillPlan:
+    """Return the plan to resume, refusing plans that are unfinished or out of scope."""
+    if resume == LATEST_PLAN:
+        plan = BackfillPlan.latest(plan_dir, PLAN_NAME)
+        if plan is None:
+            raise BackfillError(f"No {PLAN_NAME} plan found in {plan_dir!r} to resume")
+    else:
+        plan = BackfillPlan(Path(resume))
+
+    if not plan.get('complete'):
+        raise BackfillError(
+            f"Plan {plan.directory} is incomplete (planning was interrupted); "
+            f"run without --resume to plan again"
+        )
+    if source_filter and plan.get('source') != source_filter:
+        raise BackfillError(
+            f"Plan {plan.directory} was built for source={plan.get('source')!r}, "
+            f"not {source_filter!r}"
+        )
+    planned_token_writes = plan.get('token_writes', TOKEN_WRITES_INDEX)
+    if planned_token_writes != token_writes:
+        raise BackfillError(
+            f"Plan {plan.directory} was built with --token-writes={planned_token_writes}; "
+            f"resume it with the same option"
+        )
+    return plan
 
 
 def parse_arguments():
@@ -293,6 +896,46 @@ Environment Variables:
         help='Optional Salesforce ID. When given, only that member is '
              'backfilled; otherwise every member is processed.'
     )
+    parser.add_argument(
+        '--plan-dir',
+        default='plans',
+        help='Directory where the planning pass writes its BSON change plan '
+             '(default: plans).'
+    )
+    parser.add_argument(
+        '--partitions',
+        type=int,
+        default=1,
+        help='Split the _id keyspace of assertion, send_notifications_request '
+             'and jhi_user into this many ranges and scan them in parallel '
+             'during planning (default: 1). Keep it at or below MONGO_MAX_POOL_SIZE.'
+    )
+    parser.add_argument(
+        '--server-side',
+        action='store_true',
+        help='Do the join inside MongoDB: stage the salesforce_id -> member_id '
+             'map, $lookup it and $merge the results, so documents never cross '
+             'the network. No plan is written, so --resume does not apply.'
+    )
+    parser.add_argument(
+        '--token-writes',
+        choices=(TOKEN_WRITES_INDEX, TOKEN_WRITES_ARRAY_FILTERS),
+        default=TOKEN_WRITES_INDEX,
+        help='How orcid_record tokens are addressed when applying the plan: '
+             'by array position at planning time (index, default) or by '
+             'salesforce_id with array filters (array-filters), which stays '
+             'correct if tokens are added or reordered concurrently.'
+    )
+    parser.add_argument(
+        '--resume',
+        nargs='?',
+        const=LATEST_PLAN,
+        default=None,
+        metavar='PLAN',
+        help='Skip planning and continue applying an interrupted run from its '
+             'last checkpoint. Takes a plan directory, or the most recent plan '
+             'in --plan-dir when no value is given.'
+    )
 
     return parser.parse_args()
 
@@ -308,6 +951,10 @@ def main():
             logger.error(str(e))
             return 1
 
+    if args.server_side and args.resume:
+        logger.error("--server-side writes no plan, so it cannot be combined with --resume")
+        return 1
+
     config = Config()
     mongo_uri = config.mongo_uri
 
@@ -324,27 +971,17 @@ def main():
     logger.info("Scope: %s", f"single member (salesforce_id={source_filter})" if source_filter else "ALL members")
     logger.info("="*80 + "\n")
 
-    connection_assertionservice = MongoDBConnection(mongo_uri, database_assertionservice)
-    connection_userservice = MongoDBConnection(mongo_uri, database_userservice)
-    connection_memberservice = MongoDBConnection(mongo_uri, database_memberservice)
+    # One pooled client serves all three databases.
+    registry = MongoConnectionRegistry(mongo_uri, max_pool_size=config.mongo_max_pool_size)
+    plan = None
 
     try:
-        if not connection_memberservice.connect():
-            logger.error("Failed to connect to memberservice MongoDB. Exiting.")
-            return 1
-        if not connection_assertionservice.connect():
-            logger.error("Failed to connect to assertionservice MongoDB. Exiting.")
+        if not registry.connect():
+            logger.error("Failed to connect to MongoDB. Exiting.")
             return 1
-        if not connection_userservice.connect():
-            logger.error("Failed to connect to userservice MongoDB. Exiting.")
-            return 1
-
-        member_repo = MemberRepository(connection_memberservice)
-        sf_map = member_repo.build_salesforce_to_member_map(source_filter)
-        if not sf_map:
-            logger.info("\n No usable members found. Nothing to do.")
-            return 0
-        sf_ids = list(sf_map.keys())
+        connection_memberservice = registry.get(database_memberservice)
+        connection_assertionservice = registry.get(database_assertionservice)
+        connection_userservice = registry.get(database_userservice)
 
         assertion_bf = TopLevelBackfiller(
             connection_assertionservice.get_collection('assertion'), 'assertion')
@@ -354,81 +991,112 @@ def main():
         user_bf = TopLevelBackfiller(
             connection_userservice.get_collection('jhi_user'), 'jhi_user')
         orcid_bf = OrcidRecordBackfiller(
-            connection_assertionservice.get_collection('orcid_record'))
+            connection_assertionservice.get_collection('orcid_record'), args.token_writes)
 
-        # ---- Planning phase: one read-only pass per collection ----
-        logger.info("\n" + "="*80)
-        logger.info("PLANNING: scanning each collection once to count required changes")
-        logger.info("(no writes happen in this phase)")
-        logger.info("="*80)
-
-        a_scanned, a_needs, _ = assertion_bf.scan(sf_map, sf_ids, apply=False)
-        o_scanned, o_docs_needs, o_tokens_needs, _ = orcid_bf.scan(sf_map, sf_ids, apply=False)
-        n_scanned, n_needs, _ = notification_bf.scan(sf_map, sf_ids, apply=False)
-        u_scanned, u_needs, _ = user_bf.scan(sf_map, sf_ids, apply=False)
+        if args.server_side:
+            sf_map = MemberRepository(connection_memberservice).build_salesforce_to_member_map(source_filter)
+            if not sf_map:
+                logger.info("\n No usable members found. Nothing to do.")
+                return 0
+            exit_code = run_server_side(sf_map, connection_assertionservice, connection_userservice)
+            if exit_code == 0:
+                logger.info("\n" + "="*80)
+                logger.info("Script completed successfully")
+                logger.info("="*80)
+            return exit_code
+
+        if args.resume:
+            # ---- Resume: reuse the finished plan, skip member loading and planning ----
+            plan = load_resume_plan(args.resume, args.plan_dir, source_filter, args.token_writes)
+            a_needs = plan.count('assertion')
+            o_docs_needs = plan.count('orcid_record')
+            o_tokens_needs = plan.manifest['collections'].get('orcid_record', {}).get('tokens', 0)
+            n_needs = plan.count('send_notifications_request')
+            u_needs = plan.count('jhi_user')
+            members_in_scope = plan.get('members', 0)
+
+            logger.info("\n Resuming plan %s", plan.directory)
+            for label in ('assertion', 'orcid_record', 'send_notifications_request', 'jhi_user'):
+                logger.info("   %-28s %d / %d entries already applied",
+                            label + ':', plan.applied(label), plan.count(label))
+        else:
+            member_repo = MemberRepository(connection_memberservice)
+            sf_map = member_repo.build_salesforce_to_member_map(source_filter)
+            if not sf_map:
+                logger.info("\n No usable members found. Nothing to do.")
+                return 0
+            sf_ids = list(sf_map.keys())
+            members_in_scope = len(sf_map)
+
+            # ---- Planning phase: one read-only pass per collection ----
+            logger.info("\n" + "="*80)
+            logger.info("PLANNING: scanning each collection once to record required changes")
+            logger.info("(no writes happen in this phase)")
+            logger.info("="*80)
+
+            plan = BackfillPlan.create(args.plan_dir, PLAN_NAME)
+            plan.set('source', source_filter)
+            plan.set('token_writes', args.token_writes)
+
+            a_scanned, a_needs = assertion_bf.scan(sf_map, sf_ids, plan, args.partitions)
+            o_scanned, o_docs_needs, o_tokens_needs = orcid_bf.scan(sf_map, sf_ids, plan)
+            n_scanned, n_needs = notification_bf.scan(sf_map, sf_ids, plan, args.partitions)
+            u_scanned, u_needs = user_bf.scan(sf_map, sf_ids, plan, args.partitions)
+
+            logger.info("")
+            logger.info(" assertion:                   scanned %d, %d need member_id", a_scanned, a_needs)
+            logger.info(" orcid_record:                scanned %d, %d need member_id (%d tokens)",
+                        o_scanned, o_docs_needs, o_tokens_needs)
+            orcid_bf.log_oplog_savings(plan)
+            logger.info(" send_notifications_request:  scanned %d, %d need member_id", n_scanned, n_needs)
+            logger.info(" jhi_user:                    scanned %d, %d need member_id", u_scanned, u_needs)
+
+            total_needs = a_needs + n_needs + u_needs + o_docs_needs
+            if total_needs == 0:
+                logger.info(
+                    "\n member_id is already backfilled on all related records "
+                    "for the %d member(s) in scope. Nothing to do.",
+                    members_in_scope,
+                )
+                plan.discard()
+                return 0
 
-        logger.info("")
-        logger.info(" assertion:                   scanned %d, %d need member_id", a_scanned, a_needs)
-        logger.info(" orcid_record:                scanned %d, %d need member_id (%d tokens)",
-                    o_scanned, o_docs_needs, o_tokens_needs)
-        logger.info(" send_notifications_request:  scanned %d, %d need member_id", n_scanned, n_needs)
-        logger.info(" jhi_user:                    scanned %d, %d need member_id", u_scanned, u_needs)
-
-        total_needs = a_needs + n_needs + u_needs + o_docs_needs
-        if total_needs == 0:
-            logger.info(
-                "\n member_id is already backfilled on all related records "
-                "for the %d member(s) in scope. Nothing to do.",
-                len(sf_map),
-            )
-            return 0
+            plan.set('members', members_in_scope)
+            plan.set('complete', True)
 
-        logger.info("\n" + "="*80)
-        logger.info("  WARNING: This will modify the database!")
-        logger.info(f"  Members in scope:               {len(sf_map)}")
-        logger.info(f"  assertion docs to update:       {a_needs}")
-        logger.info(f"  orcid_record docs to update:    {o_docs_needs}  ({o_tokens_needs} tokens)")
-        logger.info(f"  send_notifications to update:   {n_needs}")
-        logger.info(f"  jhi_user docs to update:        {u_needs}")
-        logger.info("  Member documents themselves will NOT be modified")
-        logger.info("="*80)
+            logger.info("\n Plan written to %s (%d bytes)", plan.directory, plan.total_bytes())
 
-        try:
-            response = input("\nDo you want to proceed? (yes/no): ").strip().lower()
-            if response not in ('yes', 'y'):
-                logger.info("\n Operation cancelled by user")
-                return 0
-        except (KeyboardInterrupt, EOFError):
-            logger.info("\n\n Operation cancelled by user")
-            return 1
+        exit_code = confirm_backfill(members_in_scope, a_needs, o_docs_needs, o_tokens_needs, n_needs, u_needs)
+        if exit_code is not None:
+            return exit_code
 
-        # ---- Execution phase: one pass per collection, batched bulk writes ----
+        # ---- Execution phase: replay the plan as batched bulk writes ----
         logger.info("\n" + "="*80)
         logger.info("EXECUTING BACKFILL")
         logger.info("="*80)
 
         if a_needs:
-            _, _, a_modified = assertion_bf.scan(sf_map, sf_ids, apply=True)
+            a_modified = assertion_bf.apply(plan)
             logger.info(" assertion: %d documents updated", a_modified)
         if o_docs_needs:
-            _, _, _, o_modified = orcid_bf.scan(sf_map, sf_ids, apply=True)
+            o_modified = orcid_bf.apply(plan)
             logger.info(" orcid_record: %d documents updated", o_modified)
         if n_needs:
-            _, _, n_modified = notification_bf.scan(sf_map, sf_ids, apply=True)
+            n_modified = notification_bf.apply(plan)
             logger.info(" send_notifications_request: %d documents updated", n_modified)
         if u_needs:
-            _, _, u_modified = user_bf.scan(sf_map, sf_ids, apply=True)
+            u_modified = user_bf.apply(plan)
             logger.info(" jhi_user: %d documents updated", u_modified)
 
-        # ---- Verification phase: re-scan, expect nothing left ----
+        # ---- Verification phase: re-read only the planned _ids ----
         logger.info("\n" + "="*80)
         logger.info("VERIFYING BACKFILL")
         logger.info("="*80)
 
-        _, a_left, _ = assertion_bf.scan(sf_map, sf_ids, apply=False)
-        _, o_left, _, _ = orcid_bf.scan(sf_map, sf_ids, apply=False)
-        _, n_left, _ = notification_bf.scan(sf_map, sf_ids, apply=False)
-        _, u_left, _ = user_bf.scan(sf_map, sf_ids, apply=False)
+        a_left = assertion_bf.verify(plan)
+        o_left = orcid_bf.verify(plan)
+        n_left = notification_bf.verify(plan)
+        u_left = user_bf.verify(plan)
 
         remaining = a_left + o_left + n_left + u_left
         if remaining > 0:
@@ -453,6 +1121,9 @@ def main():
         return 1
     except BackfillError as e:
         logger.error(f"\nBackfill operation failed: {e}")
+        # Only a finished plan can be resumed; a failure while planning needs a fresh run.
+        if plan is not None and plan.get('complete'):
+            logger.error("Re-run with --resume=%s to continue from the last checkpoint", plan.directory)
         return 1
     except KeyboardInterrupt:
         logger.info("\n\n Operation cancelled by user (Ctrl+C)")
@@ -461,9 +1132,7 @@ def main():
         logger.error(f"\n Unexpected error: {e}", exc_info=True)
         raise
     finally:
-        connection_assertionservice.disconnect()
-        connection_memberservice.disconnect()
-        connection_userservice.disconnect()
+        registry.disconnect()
 
 
 if __name__ == '__main__':
@@ -11,14 +11,16 @@ without requiring a full permission-grant flow.
 Usage:
     python backfill_orcid_record.py                   # scan and (on confirm) insert
     python backfill_orcid_record.py --source-email=x  # only handle one email
+    python backfill_orcid_record.py --memory-budget-mb=256  # sort legacy emails on disk
 """
 
 import argparse
+import heapq
 import re
 import sys
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import List, Set
+from typing import Iterable, Iterator, List, Optional, Tuple
 
 from pymongo import InsertOne
 from pymongo.errors import BulkWriteError, OperationFailure
@@ -32,12 +34,23 @@ if str(UTILS_DIR) not in sys.path:
 from logger_config import setup_logger
 from db_connection import MongoDBConnection
 from config import Config
+from write_pipeline import BulkWritePipeline
+from write_throttle import get_write_throttle
+from batch_sizer import AdaptiveBatchSizer, SizedBatch
+from external_sort import ExternalSorter, sorted_difference
 
 logger = setup_logger(__name__, log_file="backfill-orcid-record.log")
 
 EMAIL_PATTERN = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
 
-BATCH_SIZE = 1000
+# Stored emails that change when normalized (strip + lower) and therefore
+# cannot be read in index order; there should be few or none.
+_NEEDS_NORMALIZING = re.compile(r"[A-Z]|[^\x00-\x7f]|^\s|\s$")
+NORMALIZED_EMAIL = {"email": {"$type": "string", "$not": _NEEDS_NORMALIZING}}
+UNNORMALIZED_EMAIL = {"email": {"$type": "string", "$regex": _NEEDS_NORMALIZING}}
+ORCID_RECORD_EMAIL_INDEX = "email_unique_idx"
+EMAIL_ONLY = {"_id": 0, "email": 1}
+
 PROGRESS_EVERY = 100_000
 
 
@@ -53,123 +66,164 @@ def validate_email(value: str) -> str:
 class OrcidRecordBackfiller:
     """Find emails missing from ``orcid_record`` and insert placeholder documents."""
 
-    def __init__(self, connection: MongoDBConnection):
+    def __init__(self, connection: MongoDBConnection, memory_budget_mb: Optional[int] = None):
         self.connection = connection
+        self.memory_budget_mb = memory_budget_mb
         self.collection_assertion = connection.get_collection("assertion")
         self.collection_orcid_record = connection.get_collection("orcid_record")
-
-    def _distinct_emails(self, collection, label: str) -> Set[str]:
-        """Return the set of distinct (lower-cased) email strings in *collection*."""
-        logger.info("  Reading distinct emails from %s ...", label)
+        self.sizer = AdaptiveBatchSizer(name="orcid_record", log=logger)
+        self.throttle = get_write_throttle(self.collection_orcid_record.database.client)
+
+    def _sorted_emails(self, collection, label: str, index: Optional[str] = None,
+                       validate: bool = False) -> Iterator[str]:
+        """Stream the distinct lower-cased emails of *collection* in ascending order.
+
+        Emails are stored lower-cased by the application, so the bulk of them
+        is read already sorted: via *index* when the collection has one on
+        ``email``, otherwise through a disk-backed ``$group`` + ``$sort``.
+        Legacy values that would sort differently once normalized (upper-case,
+        non-ASCII or padded) are fetched separately, normalized and merged in;
+        with a memory budget they are sorted on disk instead of in a set.
+        """
+        logger.info("  Streaming sorted emails from %s ...", label)
         try:
-            raw = collection.distinct("email")
+            if index:
+                primary = (
+                    doc["email"] for doc in
+                    collection.find(NORMALIZED_EMAIL, EMAIL_ONLY).sort("email", 1).hint(index)
+                )
+            else:
+                primary = (
+                    doc["_id"] for doc in collection.aggregate(
+                        [
+                            {"$match": NORMALIZED_EMAIL},
+                            {"$group": {"_id": "$email"}},
+                            {"$sort": {"_id": 1}},
+                        ],
+                        allowDiskUse=True,
+                    )
+                )
+            normalized = (
+                doc["email"].strip().lower()
+                for doc in collection.find(UNNORMALIZED_EMAIL, EMAIL_ONLY)
+            )
+            if self.memory_budget_mb:
+                legacy = ExternalSorter(f"{label}-legacy-emails", self.memory_budget_mb, unique=True)
+                legacy.extend(normalized)
+                legacy_count = legacy.stats.items
+            else:
+                legacy = sorted(set(normalized))
+                legacy_count = len(legacy)
         except OperationFailure as e:
-            logger.error("  Failed to query distinct emails in %s: %s", label, e)
+            logger.error("  Failed to query emails in %s: %s", label, e)
             raise
+        if legacy_count:
+            logger.info("    %s: %d emails needed normalizing", label, legacy_count)
 
-        emails: Set[str] = set()
-        bad = 0
-        for e in raw:
-            if not e:
-                continue
-            lower = e.strip().lower()
-            if EMAIL_PATTERN.match(lower):
-                emails.add(lower)
-            else:
-                bad += 1
-        logger.info("    %s: %d unique emails (%d invalid skipped)", label, len(emails), bad)
-        return emails
-
-    def discover_missing(self, source_email: str = None) -> List[str]:
-        """Return sorted list of emails present in assertion (or source_email)
-        that have no matching ``orcid_record`` document."""
-
+        previous = None
+        streamed = bad = 0
+        try:
+            for email in heapq.merge(primary, legacy):
+                if not email or email == previous:
+                    continue
+                previous = email
+                if validate and not EMAIL_PATTERN.match(email):
+                    bad += 1
+                    continue
+                streamed += 1
+                yield email
+        finally:
+            if isinstance(legacy, ExternalSorter):
+                legacy.close()
+        logger.info("    %s: %d unique emails%s", label, streamed,
+                    f" ({bad} invalid skipped)" if validate else "")
+        if isinstance(legacy, ExternalSorter) and legacy_count:
+            logger.info("    %s legacy email sort: %s", label, legacy.stats.summary())
+
+    def discover_missing(self, source_email: str = None) -> Iterator[str]:
+        """Yield, in sorted order, emails present in assertion (or source_email)
+        that have no matching ``orcid_record`` document.
+
+        Both collections are streamed in email order and merge-joined, so
+        memory stays constant whatever their size.
+        """
         if source_email:
-            candidate_emails = {source_email}
             logger.info("  Single-email mode: %s", source_email)
-        else:
-            logger.info("  Building candidate set from assertion ...")
-            from_assertion = self._distinct_emails(self.collection_assertion, "assertion")
-            candidate_emails = from_assertion
-            logger.info("  Combined candidate set: %d unique emails", len(candidate_emails))
-
-        if not candidate_emails:
-            return []
-
-        # Collect existing orcid_record emails
-        logger.info("  Reading existing emails from orcid_record ...")
-        try:
-            raw = self.collection_orcid_record.distinct("email")
-        except OperationFailure as e:
-            logger.error("  Failed to query orcid_record emails: %s", e)
-            raise
-
-        existing: Set[str] = set()
-        for e in raw:
-            if e:
-                existing.add(e.strip().lower())
-        logger.info("    orcid_record: %d existing emails", len(existing))
-
-        missing = sorted(candidate_emails - existing)
-        logger.info(
-            "  Missing from orcid_record: %d / %d candidate emails",
-            len(missing),
-            len(candidate_emails),
-        )
-        return missing
-
-    def insert_placeholders(self, emails: List[str], apply: bool) -> int:
+            existing = self.collection_orcid_record.count_documents(
+                {"email": {"$regex": f"^{re.escape(source_email)}$", "$options": "i"}}, limit=1
+            )
+            if not existing:
+                yield source_email
+            return
+
+        candidates = self._sorted_emails(self.collection_assertion, "assertion", validate=True)
+        existing = self._sorted_emails(self.collection_orcid_record, "orcid_record", index=ORCID_RECORD_EMAIL_INDEX)
+        yield from sorted_difference(candidates, existing)
+
+    def count_missing(self, source_email: str = None, sample_size: int = 10) -> Tuple[int, List[str]]:
+        """Dry run: return (number of missing emails, the first *sample_size* of them)."""
+        missing = 0
+        sample: List[str] = []
+        for email in self.discover_missing(source_email):
+            missing += 1
+            if len(sample) < sample_size:
+                sample.append(email)
+        logger.info("  Missing from orcid_record: %d email(s)", missing)
+        return missing, sample
+
+    def insert_placeholders(self, emails: Iterable[str], apply: bool) -> int:
         """Insert a minimal OrcidRecord for each email.  Returns count inserted.
 
-        When ``apply`` is False this is a dry-run that only logs what *would*
-        happen; no writes are performed.
+        *emails* may be a stream (e.g. :meth:`discover_missing`); it is
+        consumed once.  When ``apply`` is False this is a dry-run that only
+        logs what *would* happen; no writes are performed.
         """
-        if not emails:
-            logger.info("  No emails to insert.")
-            return 0
-
-        logger.info(
-            "  %s placeholders for %d emails ...",
-            "Inserting" if apply else "DRY-RUN — would insert",
-            len(emails),
-        )
+        logger.info("  %s placeholders ...", "Inserting" if apply else "DRY-RUN — would insert")
 
         now = datetime.now(timezone.utc)
-        batch: List[InsertOne] = []
-        inserted = 0
-
-        for i, email in enumerate(emails):
-            if i > 0 and i % PROGRESS_EVERY == 0:
-                logger.info("    ... %d / %d processed", i, len(emails))
-
-            doc = {
-                "email": email,
-                "created": now,
-                "modified": now,
-            }
-
-            if apply:
-                batch.append(InsertOne(doc))
-                if len(batch) >= BATCH_SIZE:
-                    inserted += self._flush(batch)
-                    batch = []
-
-        if apply and batch:
-            inserted += self._flush(batch)
-
-        if apply:
+        batch = SizedBatch()
+        processed = 0
+
+        with BulkWritePipeline(self._flush, name="orcid_record-writer") as pipeline:
+            for email in emails:
+                processed += 1
+                if processed % PROGRESS_EVERY == 0:
+                    logger.info("    ... %d processed", processed)
+
+                doc = {
+                    "email": email,
+                    "created": now,
+                    "modified": now,
+                }
+
+                if apply:
+                    batch.add(InsertOne(doc), doc)
+                    if len(batch) >= self.sizer.size:
+                        pipeline.submit(batch)
+                        batch = SizedBatch()
+
+            if apply and batch:
+                pipeline.submit(batch)
+        inserted = pipeline.total
+        self.sizer.log_summary()
+
+        if not processed:
+            logger.info("  No emails to insert.")
+        elif apply:
             logger.info("  Inserted %d orcid_record documents", inserted)
         else:
-            logger.info("  (dry-run — %d would be inserted)", len(emails))
+            logger.info("  (dry-run — %d would be inserted)", processed)
 
         return inserted
 
-    def _flush(self, batch: List[InsertOne]) -> int:
+    def _flush(self, batch: SizedBatch) -> int:
         """Execute a batch of inserts; return count of documents inserted."""
         if not batch:
             return 0
+        self.throttle.wait(len(batch))
         try:
-            result = self.collection_orcid_record.bulk_write(batch, ordered=False)
+            with self.sizer.measure(batch):
+                result = self.collection_orcid_record.bulk_write(batch, ordered=False)
             return result.inserted_count
         except BulkWriteError as bwe:
             # Some inserts may have succeeded; log details and continue.
@@ -199,6 +253,9 @@ Examples:
   # Handle a single email only
   python backfill_orcid_record.py --source-email=researcher@example.org
 
+  # Sort the emails that need normalizing in temp files, within ~256MB
+  python backfill_orcid_record.py --memory-budget-mb=256
+
 Environment Variables:
   SPRING_DATA_MONGODB_URI - MongoDB connection string
         """,
@@ -211,6 +268,13 @@ Environment Variables:
         help="Optional single email to process. When given only that email "
         "is checked / inserted; otherwise every distinct email in assertion.",
     )
+    parser.add_argument(
+        "--memory-budget-mb",
+        type=int,
+        default=None,
+        help="Sort the emails that need normalizing in temp files within roughly "
+        "this much memory instead of in an in-memory set.",
+    )
 
     return parser.parse_args()
 
@@ -252,13 +316,13 @@ def main():
             logger.error("Failed to connect to MongoDB. Exiting.")
             return 1
 
-        backfiller = OrcidRecordBackfiller(connection)
+        backfiller = OrcidRecordBackfiller(connection, memory_budget_mb=args.memory_budget_mb)
 
         logger.info("\n" + "=" * 80)
         logger.info("PLANNING: discover missing emails (no writes)")
         logger.info("=" * 80)
 
-        missing = backfiller.discover_missing(source_email)
+        missing, sample = backfiller.count_missing(source_email)
 
         if not missing:
             logger.info(
@@ -266,19 +330,16 @@ def main():
             )
             return 0
 
-        logger.info("\n  Summary: %d email(s) missing an orcid_record", len(missing))
-        if len(missing) <= 20:
-            for e in missing:
-                logger.info("    - %s", e)
-        else:
-            for e in missing[:10]:
-                logger.info("    - %s", e)
-            logger.info("    ... and %d more", len(missing) - 10)
+        logger.info("\n  Summary: %d email(s) missing an orcid_record", missing)
+        for e in sample:
+            logger.info("    - %s", e)
+        if missing > len(sample):
+            logger.info("    ... and %d more", missing - len(sample))
 
         logger.info("\n" + "=" * 80)
         logger.info("  WARNING: This will INSERT new documents!")
         logger.info("  Collection:     orcid_record")
-        logger.info("  Documents:      %d new placeholder(s)", len(missing))
+        logger.info("  Documents:      %d new placeholder(s)", missing)
         logger.info("  Each contains:  email, created, modified (nothing else)")
         logger.info("=" * 80)
 
@@ -295,19 +356,20 @@ def main():
         logger.info("EXECUTING — inserting placeholder orcid_record documents")
         logger.info("=" * 80)
 
-        inserted = backfiller.insert_placeholders(missing, apply=True)
+        # Re-run the merge-join and insert as it streams.
+        inserted = backfiller.insert_placeholders(backfiller.discover_missing(source_email), apply=True)
 
         logger.info("\n" + "=" * 80)
         logger.info("VERIFYING — re-scan for still-missing emails")
         logger.info("=" * 80)
 
-        still_missing = backfiller.discover_missing(source_email)
+        still_missing, sample = backfiller.count_missing(source_email)
 
         if still_missing:
             logger.warning(
-                " Verification: %d email(s) still missing (expected 0)", len(still_missing)
+                " Verification: %d email(s) still missing (expected 0)", still_missing
             )
-            for e in still_missing[:10]:
+            for e in sample:
                 logger.warning("    - %s", e)
             return 1
 
@@ -10,12 +10,16 @@ Usage:
 
 import argparse
 import re
+import shutil
 import sys
+import tempfile
+import weakref
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, List, Set, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 
-from pymongo import InsertOne, UpdateOne
+from bson import decode_file_iter
+from bson.raw_bson import RawBSONDocument
 from pymongo.collection import Collection
 from pymongo.errors import BulkWriteError, OperationFailure
 
@@ -28,14 +32,31 @@ if str(UTILS_DIR) not in sys.path:
 from logger_config import setup_logger
 from db_connection import MongoDBConnection
 from config import Config
+from write_pipeline import BulkWritePipeline
+from write_throttle import get_write_throttle
+from chunked_lookup import find_in_chunks
+from batch_sizer import AdaptiveBatchSizer
+from raw_bulk import RawBatch, RawBulkWriter, encode_insert, encode_update
+from compact_set import CompactSetMap, CompactStringSet, SetMap
+from external_sort import SortedSetMap
+from backfill_plan import PlanWriter
+from raw_fields import RAW_CODEC_OPTIONS
 
 logger = setup_logger(__name__, log_file="backfill-orcid-record-tokens.log")
 
 EMAIL_PATTERN = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+# Fields the orcid_record planning scan reads; whole tokens are never fetched.
+ORCID_RECORD_PLAN_PROJECTION = {"_id": 1, "email": 1, "tokens.member_id": 1}
 
-BATCH_SIZE = 1000
 PROGRESS_EVERY = 100_000
 
+# With --memory-budget-mb, planning memory per candidate email held in a
+# chunk (dict entry, member_id set, seen flag), used to size the chunks.
+CHUNK_BYTES_PER_EMAIL = 600
+
+# email -> member_ids still expected on that email's orcid_record.
+NeededMap = Union[SetMap, CompactSetMap, SortedSetMap]
+
 
 def validate_email(value: str) -> str:
     """Return the lowercased email if it looks valid; raise otherwise."""
@@ -46,21 +67,97 @@ def validate_email(value: str) -> str:
     return value.lower()
 
 
+class TokenPlanSummary:
+    """Counters filled in while :meth:`OrcidRecordTokenBackfiller.plan` streams."""
+
+    __slots__ = ("scanned", "records_to_update", "tokens_to_add", "records_to_create")
+
+    def __init__(self):
+        self.scanned = 0
+        self.records_to_update = 0
+        self.tokens_to_add = 0
+        self.records_to_create = 0
+
+    @property
+    def remaining(self) -> int:
+        return self.records_to_update + self.records_to_create
+
+
+class PlannedOps:
+    """
+    The statements of one planning pass, spooled to a temp file until written.
+
+    orcid_record is read once: the confirmed counts and the writes come from
+    the same plan.  Statements are appended to a BSON file as they are
+    planned (the same format as backfill_plan) and streamed back in plan
+    order, so memory stays flat however many records need a write.
+    """
+
+    def __init__(self, temp_dir: Optional[str] = None):
+        self.directory = Path(tempfile.mkdtemp(prefix="backfill-tokens-plan-", dir=temp_dir))
+        self._cleanup = weakref.finalize(self, shutil.rmtree, str(self.directory), True)
+        self.path = self.directory / "plan.bson"
+        self.writer = PlanWriter(self.path)
+
+    def add(self, batch: RawBatch):
+        for statement in batch:
+            self.writer.write({"c": batch.command, "s": statement})
+
+    def __len__(self) -> int:
+        return self.writer.entries
+
+    @property
+    def bytes(self) -> int:
+        return self.writer.bytes
+
+    def __iter__(self) -> Iterator[Tuple[str, RawBSONDocument]]:
+        """(command, statement) pairs in plan order."""
+        self.writer.close()
+        with open(self.path, "rb") as f:
+            for entry in decode_file_iter(f, codec_options=RAW_CODEC_OPTIONS):
+                yield entry["c"], entry["s"]
+
+    def close(self):
+        """Delete the spool file."""
+        self.writer.close()
+        self._cleanup()
+
+
 class OrcidRecordTokenBackfiller:
     """Ensure every (email, member_id) in assertion has a matching token."""
 
-    def __init__(self, connection: MongoDBConnection):
+    def __init__(self, connection: MongoDBConnection, compact_sets: bool = False,
+                 memory_budget_mb: Optional[int] = None):
+        self.compact_sets = compact_sets
+        # With a budget, the (email, member_id) pairs are sorted on disk with
+        # half of it and planned in email chunks sized from the other half.
+        self.memory_budget_mb = memory_budget_mb
+        self.chunk_emails = (
+            max(1000, memory_budget_mb * 1024 * 1024 // 2 // CHUNK_BYTES_PER_EMAIL)
+            if memory_budget_mb else None
+        )
+        self.spilled: List[SortedSetMap] = []
         self.collection_assertion: Collection = connection.get_collection("assertion")
         self.collection_orcid_record: Collection = connection.get_collection("orcid_record")
+        # Token appends and whole-record inserts differ a lot in size, so
+        # each op type gets its own batch size.
+        self.sizers = {
+            label: AdaptiveBatchSizer(name=f"orcid_record {label}", log=logger)
+            for label in ("add-token", "insert-record")
+        }
+        self.writer = RawBulkWriter(self.collection_orcid_record)
+        self.throttle = get_write_throttle(self.collection_orcid_record.database.client)
 
     # ---- planning ---------------------------------------------------------
 
-    def build_needed_map(self, member_id: str = None, source_email: str = None) -> Dict[str, Set[str]]:
+    def build_needed_map(self, member_id: str = None, source_email: str = None) -> NeededMap:
         """Return ``{email_lower: {member_id, ...}}`` from the assertion collection.
 
         One ``(email, memberId)`` pair per distinct assertion grouping, computed
         server-side.  Assertions with a blank member_id or an unparseable email
-        are skipped with a count.
+        are skipped with a count.  With ``compact_sets`` the map is a
+        ``CompactSetMap`` instead of a dict of sets; with a memory budget it
+        is a ``SortedSetMap`` spilled to temp files and planned in chunks.
         """
         match: Dict[str, object] = {"member_id": {"$nin": [None, ""]}}
         if member_id:
@@ -75,7 +172,7 @@ class OrcidRecordTokenBackfiller:
             {"$group": {"_id": {"email": {"$toLower": "$email"}, "member_id": "$member_id"}}},
         ]
 
-        needed: Dict[str, Set[str]] = {}
+        needed = self._new_needed_map()
         bad_email = 0
         pairs = 0
         try:
@@ -93,44 +190,87 @@ class OrcidRecordTokenBackfiller:
                 continue
             if not mid:
                 continue
-            needed.setdefault(email, set()).add(mid)
+            needed.add(email, mid)
             pairs += 1
 
+        if isinstance(needed, SortedSetMap):
+            logger.info(
+                "    assertion: %d (email, member_id) pairs (%d invalid emails skipped), sorted on disk",
+                pairs, bad_email,
+            )
+            return needed
         logger.info(
             "    assertion: %d emails, %d (email, member_id) pairs (%d invalid emails skipped)",
             len(needed), pairs, bad_email,
         )
+        if self.compact_sets:
+            logger.info("    compact email map: %.1f MB", needed.nbytes / (1024 * 1024))
         return needed
 
-    def plan(self, needed: Dict[str, Set[str]]) -> Tuple[List[UpdateOne], List[InsertOne], int, int]:
-        """Single read-only pass over orcid_record.
-
-        Returns ``(updates, inserts, tokens_to_add, records_to_create)``.
-        Existing tokens are preserved; only missing placeholders are appended.
+    def _new_needed_map(self) -> NeededMap:
+        if self.memory_budget_mb:
+            # Only the latest map is still read; drop the previous one's temp files.
+            for previous in self.spilled:
+                previous.close()
+            needed = SortedSetMap("backfill-tokens-needed", self.memory_budget_mb / 2)
+            self.spilled.append(needed)
+            return needed
+        return CompactSetMap() if self.compact_sets else SetMap()
+
+    def log_spill_summary(self):
+        """Temp usage and merge throughput of the on-disk email maps (if any)."""
+        for number, needed in enumerate(self.spilled, 1):
+            logger.info("  Needed-map sort %d: %s", number, needed.sorter.stats.summary())
+
+    def plan(self, needed: NeededMap, summary: "TokenPlanSummary") -> Iterator[RawBatch]:
+        """Single read-only pass over orcid_record, streamed in bulk-op batches.
+
+        Yields pre-encoded ``RawBatch``es sized by ``self.sizers``: token
+        appends for existing records while the cursor is read, then inserts for
+        emails with no record at all.  Counters accumulate on *summary* as
+        batches are produced, so memory stays flat however large
+        orcid_record is.  Existing tokens are preserved; only missing
+        placeholders are appended.
+
+        A ``SortedSetMap`` is planned ``chunk_emails`` emails at a time, in
+        email order, so only one chunk is held in memory.
         """
         if not needed:
-            return [], [], 0, 0
+            return
+
+        if isinstance(needed, SortedSetMap):
+            logger.info("  Scanning orcid_record in chunks of %d candidate emails ...", self.chunk_emails)
+            for chunk in needed.chunks(self.chunk_emails):
+                yield from self._plan_chunk(chunk, summary)
+            return
 
-        emails = list(needed.keys())
-        logger.info("  Scanning orcid_record for %d candidate emails ...", len(emails))
+        logger.info("  Scanning orcid_record for %d candidate emails ...", len(needed))
+        yield from self._plan_chunk(needed, summary)
 
-        updates: List[UpdateOne] = []
-        tokens_to_add = 0
-        seen: Set[str] = set()
-        scanned = 0
+    def _plan_chunk(self, needed: Union[Dict[str, Set[str]], CompactSetMap],
+                    summary: "TokenPlanSummary") -> Iterator[RawBatch]:
+        """Plan the token appends and inserts for the emails in *needed*."""
+        seen = CompactStringSet() if self.compact_sets else set()
+        batch = RawBatch.updates()
 
         # Restrict the scan to candidate emails so large collections aren't read
-        # in full.  $in on the unique email index keeps this efficient.
-        cursor = self.collection_orcid_record.find(
-            {"email": {"$in": emails}},
-            {"_id": 1, "email": 1, "tokens": 1},
+        # in full.  $in on the unique email index keeps this efficient; the
+        # email list is split into BSON-sized chunks queried concurrently.
+        cursor = find_in_chunks(
+            self.collection_orcid_record,
+            "email",
+            needed.keys(),
+            projection=ORCID_RECORD_PLAN_PROJECTION,
             no_cursor_timeout=True,
         )
         try:
             for doc in cursor:
-                scanned += 1
-                if scanned % PROGRESS_EVERY == 0:
-                    logger.info("    ... scanned %d records, %d need tokens", scanned, len(updates))
+                summary.scanned += 1
+                if summary.scanned % PROGRESS_EVERY == 0:
+                    logger.info(
+                        "    ... scanned %d records, %d need tokens",
+                        summary.scanned, summary.records_to_update,
+                    )
 
                 email = (doc.get("email") or "").strip().lower()
                 if email not in needed:
@@ -141,54 +281,115 @@ class OrcidRecordTokenBackfiller:
                 existing_members = {
                     t.get("member_id") for t in tokens if isinstance(t, dict) and t.get("member_id")
                 }
-                missing = needed[email] - existing_members
+                missing = sorted(needed[email] - existing_members)
                 if not missing:
                     continue
 
-                new_tokens = list(tokens) + [{"member_id": mid} for mid in sorted(missing)]
-                tokens_to_add += len(missing)
-                updates.append(
-                    UpdateOne(
-                        {"_id": doc["_id"]},
-                        {"$set": {"tokens": new_tokens, "modified": datetime.now(timezone.utc)}},
+                summary.records_to_update += 1
+                summary.tokens_to_add += len(missing)
+                # Append only the placeholders; the $nin guard keeps a rerun
+                # (or a concurrent writer) from adding duplicates.
+                batch.append(
+                    encode_update(
+                        {"_id": doc["_id"], "tokens.member_id": {"$nin": missing}},
+                        {
+                            "$push": {"tokens": {"$each": [{"member_id": mid} for mid in missing]}},
+                            "$set": {"modified": datetime.now(timezone.utc)},
+                        },
                     )
                 )
+                if len(batch) >= self.sizers["add-token"].size:
+                    yield batch
+                    batch = RawBatch.updates()
         finally:
             cursor.close()
 
+        if batch:
+            yield batch
+        batch = RawBatch.inserts()
+
         # Emails with assertions but no orcid_record at all -> insert.
         now = datetime.now(timezone.utc)
-        inserts: List[InsertOne] = []
-        for email in emails:
+        for email in needed.keys():
             if email in seen:
                 continue
             tokens = [{"member_id": mid} for mid in sorted(needed[email])]
-            inserts.append(
-                InsertOne(
+            summary.records_to_create += 1
+            batch.append(
+                encode_insert(
                     {"email": email, "tokens": tokens, "created": now, "modified": now}
                 )
             )
-
-        return updates, inserts, tokens_to_add, len(inserts)
+            if len(batch) >= self.sizers["insert-record"].size:
+                yield batch
+                batch = RawBatch.inserts()
+        if batch:
+            yield batch
+
+    def count(self, needed: NeededMap) -> "TokenPlanSummary":
+        """Dry run: drain :meth:`plan` without keeping any ops."""
+        summary = TokenPlanSummary()
+        for _ in self.plan(needed, summary):
+            pass
+        return summary
+
+    def plan_ops(self, needed: NeededMap) -> Tuple["TokenPlanSummary", PlannedOps]:
+        """Run :meth:`plan` once, keeping its statements for :meth:`execute`."""
+        summary = TokenPlanSummary()
+        planned = PlannedOps()
+        try:
+            for batch in self.plan(needed, summary):
+                planned.add(batch)
+        except BaseException:
+            planned.close()
+            raise
+        logger.info("  Plan spool: %d statements, %.1f MB", len(planned), planned.bytes / (1024 * 1024))
+        return summary, planned
+
+    def batches(self, planned: PlannedOps) -> Iterator[RawBatch]:
+        """Regroup planned statements into batches of the sizers' current size."""
+        batch: Optional[RawBatch] = None
+        for command, statement in planned:
+            if batch is None or batch.command != command:
+                if batch:
+                    yield batch
+                batch = RawBatch(command)
+            batch.append(statement)
+            if len(batch) >= self.sizers["insert-record" if command == "insert" else "add-token"].size:
+                yield batch
+                batch = RawBatch(command)
+        if batch:
+            yield batch
 
     # ---- execution --------------------------------------------------------
 
-    def execute(self, ops: List, label: str) -> int:
-        """Run a list of bulk ops in batches; return documents written."""
-        if not ops:
-            return 0
-        written = 0
-        for start in range(0, len(ops), BATCH_SIZE):
-            batch = ops[start:start + BATCH_SIZE]
-            written += self._flush(batch, label)
-            if start and start % (BATCH_SIZE * 50) == 0:
-                logger.info("    ... %s: %d / %d written", label, written, len(ops))
-        logger.info("  %s: %d documents written", label, written)
-        return written
-
-    def _flush(self, batch: List, label: str) -> int:
+    def execute(self, batches: Iterable[RawBatch]) -> Tuple[int, int]:
+        """Write streamed op batches through the bulk-write pipeline.
+
+        Returns ``(records updated, records inserted)`` as acknowledged by the server.
+        """
+        written = {"update": 0, "insert": 0}
+
+        def acknowledge(context: Tuple[int, str], count: int):
+            number, command = context
+            written[command] += count
+            if number and number % 50 == 0:
+                logger.info("    ... %d documents written", pipeline.total)
+
+        with BulkWritePipeline(self._flush, on_ack=acknowledge, name="orcid_record-writer") as pipeline:
+            for number, batch in enumerate(batches):
+                pipeline.submit(batch, (number, batch.command))
+        for sizer in self.sizers.values():
+            sizer.log_summary()
+        logger.info("  orcid_record: %d documents written", pipeline.total)
+        return written["update"], written["insert"]
+
+    def _flush(self, batch: RawBatch) -> int:
+        label = "insert-record" if batch.command == "insert" else "add-token"
+        self.throttle.wait(len(batch))
         try:
-            result = self.collection_orcid_record.bulk_write(batch, ordered=False)
+            with self.sizers[label].measure(batch):
+                result = self.writer.execute(batch)
             return result.modified_count + result.inserted_count + result.upserted_count
         except BulkWriteError as bwe:
             detail = getattr(bwe, "details", {}) or {}
@@ -218,6 +419,12 @@ Examples:
   # Scope to a single email
   python backfill_orcid_record_tokens.py --source-email=researcher@example.org
 
+  # Hold the email map in compact hash arrays (tens of millions of emails)
+  python backfill_orcid_record_tokens.py --compact-sets
+
+  # Plan within ~512MB, spilling the email map to temp files
+  python backfill_orcid_record_tokens.py --memory-budget-mb=512
+
 Environment Variables:
   SPRING_DATA_MONGODB_URI - MongoDB connection string
         """,
@@ -235,6 +442,19 @@ Environment Variables:
         default=None,
         help="Optional single email to process (case-insensitive).",
     )
+    parser.add_argument(
+        "--compact-sets",
+        action="store_true",
+        help="Keep the planning email sets in sorted hash arrays instead of "
+        "Python sets: several times less memory, somewhat slower lookups.",
+    )
+    parser.add_argument(
+        "--memory-budget-mb",
+        type=int,
+        default=None,
+        help="Plan within roughly this much memory: the (email, member_id) pairs "
+        "are sorted in temp files and orcid_record is checked one email chunk at a time.",
+    )
     return parser.parse_args()
 
 
@@ -273,7 +493,9 @@ def main():
             logger.error("Failed to connect to MongoDB. Exiting.")
             return 1
 
-        backfiller = OrcidRecordTokenBackfiller(connection)
+        backfiller = OrcidRecordTokenBackfiller(
+            connection, compact_sets=args.compact_sets, memory_budget_mb=args.memory_budget_mb
+        )
 
         logger.info("\n" + "=" * 80)
         logger.info("PLANNING: discover missing tokens (no writes)")
@@ -284,23 +506,27 @@ def main():
             logger.info("\n No (email, member_id) pairs found in assertion. Nothing to do.")
             return 0
 
-        updates, inserts, tokens_to_add, records_to_create = backfiller.plan(needed)
+        summary, planned = backfiller.plan_ops(needed)
 
-        if not updates and not inserts:
+        if not summary.remaining:
             logger.info(
                 "\n Every (email, member_id) pair already has a matching token. Nothing to do."
             )
             return 0
 
         logger.info("\n  Summary")
-        logger.info("    Existing records needing a token:  %d  (%d tokens to add)", len(updates), tokens_to_add)
-        logger.info("    Missing records to create:         %d", records_to_create)
+        logger.info(
+            "    Existing records needing a token:  %d  (%d tokens to add)",
+            summary.records_to_update, summary.tokens_to_add,
+        )
+        logger.info("    Missing records to create:         %d", summary.records_to_create)
+        backfiller.log_spill_summary()
 
         logger.info("\n" + "=" * 80)
         logger.info("  WARNING: This will modify the database!")
         logger.info("  Collection:                 orcid_record")
-        logger.info("  Records updated (add token): %d", len(updates))
-        logger.info("  Records inserted (new):      %d", records_to_create)
+        logger.info("  Records updated (add token): %d", summary.records_to_update)
+        logger.info("  Records inserted (new):      %d", summary.records_to_create)
         logger.info("  Placeholder shape:           { member_id: <id> }  (no token_id)")
         logger.info("  Existing tokens:             left untouched")
         logger.info("=" * 80)
@@ -318,16 +544,19 @@ def main():
         logger.info("EXECUTING BACKFILL")
         logger.info("=" * 80)
 
-        updated = backfiller.execute(updates, "add-token")
-        inserted = backfiller.execute(inserts, "insert-record")
+        # Write exactly what was confirmed; orcid_record is not read again
+        # until verification.
+        try:
+            updated, inserted = backfiller.execute(backfiller.batches(planned))
+        finally:
+            planned.close()
 
         logger.info("\n" + "=" * 80)
         logger.info("VERIFYING — re-plan, expect nothing left")
         logger.info("=" * 80)
 
         needed_after = backfiller.build_needed_map(args.member_id, source_email)
-        upd_after, ins_after, _, _ = backfiller.plan(needed_after)
-        remaining = len(upd_after) + len(ins_after)
+        remaining = backfiller.count(needed_after).remaining
         if remaining > 0:
             logger.warning(
                 " Verification: %d record(s) still missing a token (expected 0)", remaining
@@ -335,6 +564,7 @@ def main():
             return 1
 
         logger.info(" Verification passed: every assertion pair now has a token")
+        backfiller.log_spill_summary()
         logger.info("\n" + "=" * 80)
         logger.info(
             "Script completed successfully — %d records updated, %d inserted",
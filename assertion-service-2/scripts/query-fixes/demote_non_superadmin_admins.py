@@ -27,6 +27,7 @@ Related to: https://orcid.clickup.com/t/PD-5857
 Usage:
     python demote_non_superadmin_admins.py            # plan, confirm, apply, verify
     python demote_non_superadmin_admins.py --dry-run  # only report what would change
+    python demote_non_superadmin_admins.py --server-side  # count + one update_many on the server
 
 Environment Variables:
     SPRING_DATA_MONGODB_URI - MongoDB connection string (read from env)
@@ -35,7 +36,7 @@ Environment Variables:
 import argparse
 import sys
 from pathlib import Path
-from typing import Dict, List, Set, Tuple
+from typing import TYPE_CHECKING, Dict, List, Set
 
 from pymongo import UpdateOne
 from pymongo.collection import Collection
@@ -49,16 +50,33 @@ if str(UTILS_DIR) not in sys.path:
 
 # Import shared modules
 from logger_config import setup_logger
-from db_connection import MongoDBConnection
+from db_connection import MongoConnectionRegistry
 from config import Config
+from write_pipeline import BulkWritePipeline
+from write_throttle import get_write_throttle
+from batch_sizer import AdaptiveBatchSizer, SizedBatch
+from repository import Repository, UserRef
+
+if TYPE_CHECKING:
+    from db_connection import MongoDBConnection
 
 # Set up logging
 logger = setup_logger(__name__, log_file='demote-non-superadmin-admins.log')
 
-# Number of bulk operations to accumulate before flushing to MongoDB.
-BATCH_SIZE = 1000
 # How often (in documents scanned) to emit a progress line.
 PROGRESS_EVERY = 100_000
+# Users logged for the audit trail in --server-side mode.
+AUDIT_SAMPLE_SIZE = 50
+SUPERADMIN_MEMBERS = {'superadmin_enabled': True}
+SUPERADMIN_MEMBER_PROJECTION = {'_id': 1, 'client_name': 1}
+
+
+def demote_query(superadmin_member_ids) -> Dict:
+    """Admins whose member_id is not a superadmin member (missing/empty included)."""
+    return {
+        'admin': True,
+        'member_id': {'$nin': sorted(superadmin_member_ids)},
+    }
 
 
 class DemotionError(RuntimeError):
@@ -68,7 +86,7 @@ class DemotionError(RuntimeError):
 class SuperadminMembers:
     """Read-only view of superadmin-enabled members."""
 
-    def __init__(self, connection_to_db: MongoDBConnection):
+    def __init__(self, connection_to_db: 'MongoDBConnection'):
         self.collection_member = connection_to_db.get_collection('member')
         self.member_ids: Set[str] = set()
 
@@ -80,10 +98,7 @@ class SuperadminMembers:
 
         try:
             members = list(
-                self.collection_member.find(
-                    {'superadmin_enabled': True},
-                    {'_id': 1, 'client_name': 1},
-                )
+                self.collection_member.find(SUPERADMIN_MEMBERS, SUPERADMIN_MEMBER_PROJECTION)
             )
         except OperationFailure as e:
             logger.error(f"Failed to query members: {e}")
@@ -101,9 +116,9 @@ class SuperadminMembers:
         )
         logger.info("=" * 80)
 
-    def is_allowed_admin(self, user: Dict) -> bool:
+    def is_allowed_admin(self, user: UserRef) -> bool:
         """Return True if this user legitimately belongs to a superadmin member."""
-        member_id = user.get('member_id')
+        member_id = user.member_id
         return bool(member_id) and member_id in self.member_ids
 
 
@@ -112,63 +127,96 @@ class AdminUserDemoter:
 
     def __init__(self, collection: Collection, superadmin_members: SuperadminMembers):
         self.collection = collection
+        self.users = Repository(collection, UserRef)
         self.superadmin_members = superadmin_members
+        self.sizer = AdaptiveBatchSizer(name='jhi_user', log=logger)
+        self.throttle = get_write_throttle(collection.database.client)
 
-    def find_users_to_demote(self) -> List[Dict]:
+    def find_users_to_demote(self) -> List[UserRef]:
         """Single read-only pass over admin users; return those to demote."""
         logger.info("  Scanning admin users in jhi_user ...")
         scanned = 0
-        to_demote: List[Dict] = []
-        cursor = self.collection.find(
-            {'admin': True},
-            {'_id': 1, 'email': 1, 'member_id': 1, 'member_name': 1, 'salesforce_id': 1},
-            no_cursor_timeout=True,
-        )
-        try:
-            for user in cursor:
-                scanned += 1
-                if scanned % PROGRESS_EVERY == 0:
-                    logger.info("   ...jhi_user: scanned %d admin users, %d to demote", scanned, len(to_demote))
-                if not self.superadmin_members.is_allowed_admin(user):
-                    to_demote.append(user)
-        finally:
-            cursor.close()
+        to_demote: List[UserRef] = []
+        for user in self.users.find({'admin': True}, UserRef.ADMIN_AUDIT, no_cursor_timeout=True):
+            scanned += 1
+            if scanned % PROGRESS_EVERY == 0:
+                logger.info("   ...jhi_user: scanned %d admin users, %d to demote", scanned, len(to_demote))
+            if not self.superadmin_members.is_allowed_admin(user):
+                to_demote.append(user)
 
         logger.info("  Admin users scanned: %d, to demote: %d", scanned, len(to_demote))
         return to_demote
 
-    def demote(self, users: List[Dict]) -> int:
+    def demote(self, users: List[UserRef]) -> int:
         """Set admin=false for the given users in batched bulk writes."""
-        modified = 0
-        batch: List[UpdateOne] = []
-        for user in users:
-            batch.append(UpdateOne({'_id': user['_id']}, {'$set': {'admin': False}}))
-            if len(batch) >= BATCH_SIZE:
-                modified += self._flush(batch)
-                batch = []
-        modified += self._flush(batch)
-        return modified
-
-    def _flush(self, batch: List[UpdateOne]) -> int:
+        batch = SizedBatch()
+        with BulkWritePipeline(self._flush, name='jhi_user-writer') as pipeline:
+            for user in users:
+                query, update = {'_id': user.id}, {'$set': {'admin': False}}
+                batch.add(UpdateOne(query, update), query, update)
+                if len(batch) >= self.sizer.size:
+                    pipeline.submit(batch)
+                    batch = SizedBatch()
+            pipeline.submit(batch)
+        self.sizer.log_summary()
+        return pipeline.total
+
+    # ---- server-side mode ---------------------------------------------------
+
+    def _demote_query(self) -> Dict:
+        return demote_query(self.superadmin_members.member_ids)
+
+    def count_users_to_demote(self) -> int:
+        """Server-side equivalent of ``len(find_users_to_demote())``."""
+        try:
+            count = self.collection.count_documents(self._demote_query())
+        except OperationFailure as e:
+            logger.error(f" count_documents failed on jhi_user: {e}")
+            raise DemotionError(f"jhi_user count_documents failed: {e}") from e
+        logger.info("  Admin users to demote: %d", count)
+        return count
+
+    def sample_users_to_demote(self, limit: int = AUDIT_SAMPLE_SIZE) -> List[UserRef]:
+        """A projected sample of the users the server-side update will demote."""
+        try:
+            return self.users.find_all(self._demote_query(), UserRef.ADMIN_AUDIT, limit=limit)
+        except OperationFailure as e:
+            logger.error(f" find failed on jhi_user: {e}")
+            raise DemotionError(f"jhi_user find failed: {e}") from e
+
+    def demote_server_side(self) -> int:
+        """Set admin=false on every user matching the demote query in one update_many."""
+        try:
+            result = self.collection.update_many(self._demote_query(), {'$set': {'admin': False}})
+        except OperationFailure as e:
+            logger.error(f" update_many failed on jhi_user: {e}")
+            raise DemotionError(f"jhi_user update_many failed: {e}") from e
+        logger.info("   Matched: %d", result.matched_count)
+        logger.info("   Modified: %d", result.modified_count)
+        return result.modified_count
+
+    def _flush(self, batch: SizedBatch) -> int:
         if not batch:
             return 0
+        self.throttle.wait(len(batch))
         try:
-            return self.collection.bulk_write(batch, ordered=False).modified_count
+            with self.sizer.measure(batch):
+                return self.collection.bulk_write(batch, ordered=False).modified_count
         except (BulkWriteError, OperationFailure) as e:
             detail = getattr(e, 'details', e)
             logger.error(f" Bulk write failed on jhi_user: {detail}")
             raise DemotionError(f"jhi_user bulk write failed: {e}") from e
 
 
-def _log_affected_users(users: List[Dict]) -> None:
+def _log_affected_users(users: List[UserRef]) -> None:
     logger.info("\nUsers that will have admin set to false:")
     for user in users:
         logger.info(
             "  - email=%s member_id=%s member_name=%s salesforce_id=%s",
-            user.get('email'),
-            user.get('member_id'),
-            user.get('member_name'),
-            user.get('salesforce_id'),
+            user.email,
+            user.member_id,
+            user.member_name,
+            user.salesforce_id,
         )
 
 
@@ -184,6 +232,9 @@ Examples:
   # Only report what would change (no writes, no prompt)
   python demote_non_superadmin_admins.py --dry-run
 
+  # Same checks done entirely on the server (count + sample, one update_many)
+  python demote_non_superadmin_admins.py --server-side --dry-run
+
 Environment Variables:
   SPRING_DATA_MONGODB_URI - MongoDB connection string (read from env)
         """,
@@ -193,9 +244,75 @@ Environment Variables:
         action='store_true',
         help='Only report the admin users that would be demoted; make no changes.',
     )
+    parser.add_argument(
+        '--server-side',
+        action='store_true',
+        help='Count and demote with a single query/update_many on the server '
+             '(member_id $nin the superadmin members) instead of scanning admin '
+             'users client-side. Only a sample of affected users is logged.',
+    )
     return parser.parse_args()
 
 
+def run_server_side(demoter: AdminUserDemoter, dry_run: bool) -> int:
+    """Count, sample, confirm, update_many and re-count: no client-side scan."""
+    logger.info("\n" + "=" * 80)
+    logger.info("PLANNING (server-side): counting admin users to demote")
+    logger.info("(no writes happen in this phase)")
+    logger.info("=" * 80)
+
+    to_demote = demoter.count_users_to_demote()
+    if not to_demote:
+        logger.info("\n No admin users need demoting. Nothing to do.")
+        return 0
+
+    sample = demoter.sample_users_to_demote()
+    _log_affected_users(sample)
+    if to_demote > len(sample):
+        logger.info("  ... and %d more (sample of %d shown)", to_demote - len(sample), len(sample))
+
+    logger.info("\n" + "=" * 80)
+    logger.info("  WARNING: This will modify the database!")
+    logger.info(f"  Admin users to demote (admin -> false): {to_demote}")
+    logger.info("  Member documents will NOT be modified")
+    logger.info("=" * 80)
+
+    if dry_run:
+        logger.info("\n Dry run - no changes made. Re-run without --dry-run to apply.")
+        return 0
+
+    try:
+        response = input("\nDo you want to proceed? (yes/no): ").strip().lower()
+        if response not in ('yes', 'y'):
+            logger.info("\n Operation cancelled by user")
+            return 0
+    except (KeyboardInterrupt, EOFError):
+        logger.info("\n\n Operation cancelled by user")
+        return 1
+
+    logger.info("\n" + "=" * 80)
+    logger.info("EXECUTING DEMOTION (server-side update_many)")
+    logger.info("=" * 80)
+
+    modified = demoter.demote_server_side()
+    logger.info(" jhi_user: %d admin users demoted", modified)
+
+    logger.info("\n" + "=" * 80)
+    logger.info("VERIFYING DEMOTION")
+    logger.info("=" * 80)
+
+    remaining = demoter.count_users_to_demote()
+    if remaining:
+        logger.error(
+            " %d admin user(s) still do not belong to a superadmin-enabled member!",
+            remaining,
+        )
+        return 1
+
+    logger.info("\n All admin users now belong to a superadmin-enabled member.")
+    return 0
+
+
 def main() -> int:
     args = parse_arguments()
 
@@ -211,19 +328,19 @@ def main() -> int:
     logger.info(f"Databases: {database_memberservice}, {database_userservice}")
     logger.info("Collections: member, jhi_user")
     logger.info(f"MongoDB URI: {mongo_uri[:20]}..." if len(mongo_uri) > 20 else f"MongoDB URI: {mongo_uri}")
-    logger.info("Mode: %s", "DRY RUN (no writes)" if args.dry_run else "APPLY (after confirmation)")
+    logger.info("Mode: %s%s", "DRY RUN (no writes)" if args.dry_run else "APPLY (after confirmation)",
+                ", server-side" if args.server_side else "")
     logger.info("=" * 80 + "\n")
 
-    connection_memberservice = MongoDBConnection(mongo_uri, database_memberservice)
-    connection_userservice = MongoDBConnection(mongo_uri, database_userservice)
+    # One pooled client serves both databases.
+    registry = MongoConnectionRegistry(mongo_uri, max_pool_size=config.mongo_max_pool_size)
 
     try:
-        if not connection_memberservice.connect():
-            logger.error("Failed to connect to memberservice MongoDB. Exiting.")
-            return 1
-        if not connection_userservice.connect():
-            logger.error("Failed to connect to userservice MongoDB. Exiting.")
+        if not registry.connect():
+            logger.error("Failed to connect to MongoDB. Exiting.")
             return 1
+        connection_memberservice = registry.get(database_memberservice)
+        connection_userservice = registry.get(database_userservice)
 
         superadmin_members = SuperadminMembers(connection_memberservice)
         superadmin_members.load()
@@ -233,6 +350,9 @@ def main() -> int:
             superadmin_members,
         )
 
+        if args.server_side:
+            return run_server_side(demoter, args.dry_run)
+
         # ---- Planning phase: one read-only pass, no writes ----
         logger.info("\n" + "=" * 80)
         logger.info("PLANNING: scanning admin users to find those to demote")
@@ -294,8 +414,7 @@ def main() -> int:
         logger.error(f" Demotion failed: {e}")
         return 1
     finally:
-        connection_userservice.disconnect()
-        connection_memberservice.disconnect()
+        registry.disconnect()
 
 
 if __name__ == "__main__":
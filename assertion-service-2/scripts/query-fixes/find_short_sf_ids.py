@@ -14,7 +14,7 @@ Usage:
 import argparse
 import sys
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import TYPE_CHECKING, List
 from pymongo.errors import OperationFailure
 
 CURRENT_DIR = Path(__file__).resolve().parent
@@ -24,8 +24,12 @@ if str(UTILS_DIR) not in sys.path:
     sys.path.insert(0, str(UTILS_DIR))
 
 from logger_config import setup_logger
-from db_connection import MongoDBConnection
+from db_connection import MongoConnectionRegistry
 from config import Config
+from repository import AssertionRef, NotificationRequestRef, OrcidRecordRef, Repository, UserRef
+
+if TYPE_CHECKING:
+    from db_connection import MongoDBConnection
 
 logger = setup_logger(__name__, log_file='fix-short-sf-ids.log')
 
@@ -34,15 +38,28 @@ query_short_sf_ids = {
     "$expr": {"$lt": [{"$strLenCP": "$salesforce_id"}, 18]}
 }
 
+query_short_token_sf_ids = {
+    "$expr": {"$gt": [{"$size": {"$filter": {
+        "input": "$tokens",
+        "as": "token",
+        "cond": {"$and": [
+            {"$eq": [{"$type": "$$token.salesforce_id"}, "string"]},
+            {"$lt": [{"$strLenCP": "$$token.salesforce_id"}, 18]},
+        ]},
+    }}}, 0]}
+}
+
 class FindFindShortSfIdsAssertion:
 
-    def __init__(self, connection_to_db: MongoDBConnection):
+    def __init__(self, connection_to_db: 'MongoDBConnection'):
         self.connection_to_db = connection_to_db
-        self.collection_assertion = connection_to_db.get_collection('assertion')
-        self.collection_orcid_record = connection_to_db.get_collection('orcid_record')
-        self.collection_send_notifications_request = connection_to_db.get_collection('send_notifications_request')
+        self.assertions = Repository(connection_to_db.get_collection('assertion'), AssertionRef)
+        self.orcid_records = Repository(connection_to_db.get_collection('orcid_record'), OrcidRecordRef)
+        self.send_notifications_requests = Repository(
+            connection_to_db.get_collection('send_notifications_request'), NotificationRequestRef
+        )
 
-    def find_problematic_assertions(self) -> List[Dict[str, Any]]:
+    def find_problematic_assertions(self) -> List[AssertionRef]:
         """
         Find assertions.
 
@@ -53,7 +70,7 @@ class FindFindShortSfIdsAssertion:
         try:
             logger.info("Searching for assertions...")
 
-            assertions = list(self.collection_assertion.find(query_short_sf_ids))
+            assertions = self.assertions.find_all(query_short_sf_ids, AssertionRef.SF_ID_REPORT)
             logger.info(f"Found {len(assertions)} assertions to fix")
             return assertions
         except OperationFailure as e:
@@ -63,7 +80,7 @@ class FindFindShortSfIdsAssertion:
             logger.error(f"Unexpected error during query: {e}")
             return []
 
-    def find_problematic_orcid_records(self) -> List[Dict[str, Any]]:
+    def find_problematic_orcid_records(self) -> List[OrcidRecordRef]:
         """
         Find orcid records.
 
@@ -74,39 +91,7 @@ class FindFindShortSfIdsAssertion:
         try:
             logger.info("Searching for orcid records...")
 
-            query = {
-                '$expr': {
-                    '$gt': [
-                        {
-                            '$size': {
-                                '$filter': {
-                                    'input': '$tokens',
-                                    'as': 'token',
-                                    'cond': {
-                                        '$and': [
-                                            {
-                                                '$eq': [
-                                                    {
-                                                        '$type': '$$token.salesforce_id'
-                                                    }, 'string'
-                                                ]
-                                            }, {
-                                                '$lt': [
-                                                    {
-                                                        '$strLenCP': '$$token.salesforce_id'
-                                                    }, 18
-                                                ]
-                                            }
-                                        ]
-                                    }
-                                }
-                            }
-                        }, 0
-                    ]
-                }
-            }
-
-            orcid_records = list(self.collection_orcid_record.find(query))
+            orcid_records = self.orcid_records.find_all(query_short_token_sf_ids, OrcidRecordRef.SF_ID_REPORT)
             logger.info(f"Found {len(orcid_records)} orcid records to fix")
             return orcid_records
         except OperationFailure as e:
@@ -116,7 +101,7 @@ class FindFindShortSfIdsAssertion:
             logger.error(f"Unexpected error during query: {e}")
             return []
 
-    def find_problematic_send_notifications_request(self) -> List[Dict[str, Any]]:
+    def find_problematic_send_notifications_request(self) -> List[NotificationRequestRef]:
         """
         Find send_notifications_request.
 
@@ -127,7 +112,9 @@ class FindFindShortSfIdsAssertion:
         try:
             logger.info("Searching for notifications...")
 
-            assertions = list(self.collection_send_notifications_request.find(query_short_sf_ids))
+            assertions = self.send_notifications_requests.find_all(
+                query_short_sf_ids, NotificationRequestRef.SF_ID_REPORT
+            )
             logger.info(f"Found {len(assertions)} send_notifications_request to fix")
             return assertions
         except OperationFailure as e:
@@ -138,7 +125,7 @@ class FindFindShortSfIdsAssertion:
             return []
 
 
-    def print_assertions_report(self, assertions: List[Dict[str, Any]]):
+    def print_assertions_report(self, assertions: List[AssertionRef]):
         if not assertions:
             logger.info("No problematic assertions found")
             return
@@ -148,11 +135,11 @@ class FindFindShortSfIdsAssertion:
         logger.info("="*80)
 
         for i, rec in enumerate(assertions, 1):
-            logger.info(f" Email: {rec.get('email')}, Salesforce Id: {rec.get('salesforce_id')}")
+            logger.info(f" Email: {rec.email}, Salesforce Id: {rec.salesforce_id}")
 
         logger.info("\n" + "="*80)
 
-    def print_orcid_records_report(self, orcid_records: List[Dict[str, Any]]):
+    def print_orcid_records_report(self, orcid_records: List[OrcidRecordRef]):
         if not orcid_records:
             logger.info("No problematic orcid records found")
             return
@@ -162,17 +149,17 @@ class FindFindShortSfIdsAssertion:
         logger.info("="*80)
 
         for i, rec in enumerate(orcid_records, 1):
-            logger.info(f" Email: {rec.get('email')}")
+            logger.info(f" Email: {rec.email}")
             logger.info(f" Tokens:")
 
-            for j, token in enumerate(rec.get('tokens'), 1):
-                salesforce_id = token.get('salesforce_id')
-                if len(salesforce_id) < 18:
-                    logger.info(f"  Salesforce Id: {salesforce_id}, Revoked date: {token.get('revoked_date')}")
+            for j, token in enumerate(rec.tokens, 1):
+                salesforce_id = token.salesforce_id
+                if isinstance(salesforce_id, str) and len(salesforce_id) < 18:
+                    logger.info(f"  Salesforce Id: {salesforce_id}, Revoked date: {token.revoked_date}")
 
         logger.info("\n" + "="*80)
 
-    def print_send_notifications_request_report(self, send_notifications_request: List[Dict[str, Any]]):
+    def print_send_notifications_request_report(self, send_notifications_request: List[NotificationRequestRef]):
         if not send_notifications_request:
             logger.info("No problematic send_notifications_request found")
             return
@@ -181,18 +168,18 @@ class FindFindShortSfIdsAssertion:
         logger.info("PROBLEMATIC NOTIFICATIONS REPORT")
         logger.info("="*80)
         for i, rec in enumerate(send_notifications_request, 1):
-            logger.info(f" Email: {rec.get('email')}, Salesforce Id: {rec.get('salesforce_id')}")
+            logger.info(f" Email: {rec.email}, Salesforce Id: {rec.salesforce_id}")
 
         logger.info("\n" + "="*80)
 
 
 class FindShortSfIdsUser:
 
-    def __init__(self, connection_to_db: MongoDBConnection, collection: str):
+    def __init__(self, connection_to_db: 'MongoDBConnection', collection: str):
         self.connection_to_db = connection_to_db
-        self.collection_users = connection_to_db.get_collection(collection)
+        self.users = Repository(connection_to_db.get_collection(collection), UserRef)
 
-    def find_problematic_users(self) -> List[Dict[str, Any]]:
+    def find_problematic_users(self) -> List[UserRef]:
         """
         Find users.
 
@@ -203,7 +190,7 @@ class FindShortSfIdsUser:
         try:
             logger.info("Searching for users...")
 
-            users = list(self.collection_users.find(query_short_sf_ids))
+            users = self.users.find_all(query_short_sf_ids, UserRef.SF_ID_REPORT)
             logger.info(f"Found {len(users)} users to fix")
             return users
         except OperationFailure as e:
@@ -213,7 +200,7 @@ class FindShortSfIdsUser:
             logger.error(f"Unexpected error during query: {e}")
             return []
 
-    def print_users_report(self, users: List[Dict[str, Any]]):
+    def print_users_report(self, users: List[UserRef]):
         if not users:
             logger.info("No problematic users found")
             return
@@ -223,7 +210,7 @@ class FindShortSfIdsUser:
         logger.info("="*80)
 
         for i, rec in enumerate(users, 1):
-            logger.info(f" email: {rec.get('email')} Salesforce Id: {rec.get('salesforce_id')}")
+            logger.info(f" email: {rec.email} Salesforce Id: {rec.salesforce_id}")
 
         logger.info("\n" + "="*80)
 
@@ -265,17 +252,16 @@ def main():
     logger.info(f"MongoDB URI: {mongo_uri[:20]}..." if len(mongo_uri) > 20 else f"MongoDB URI: {mongo_uri}")
     logger.info("="*80 + "\n")
 
-    connection_assertionservice = MongoDBConnection(mongo_uri, database_assertionservice)
-    connection_userservice = MongoDBConnection(mongo_uri, database_userservice)
+    # One pooled client serves both databases.
+    registry = MongoConnectionRegistry(mongo_uri, max_pool_size=config.mongo_max_pool_size)
 
     try:
-        if not connection_assertionservice.connect():
-            logger.error("Failed to connect to assertionservice MongoDB. Exiting.")
+        if not registry.connect():
+            logger.error("Failed to connect to MongoDB. Exiting.")
             return 1
 
-        if not connection_userservice.connect():
-            logger.error("Failed to connect to userservice MongoDB. Exiting.")
-            return 1
+        connection_assertionservice = registry.get(database_assertionservice)
+        connection_userservice = registry.get(database_userservice)
 
         fixer_assertionservice = FindFindShortSfIdsAssertion(connection_assertionservice)
 
@@ -313,8 +299,7 @@ def main():
         logger.error(f"\n Unexpected error: {e}", exc_info=True)
         return 1
     finally:
-        connection_assertionservice.disconnect()
-        connection_userservice.disconnect()
+        registry.disconnect()
 
 
 if __name__ == '__main__':
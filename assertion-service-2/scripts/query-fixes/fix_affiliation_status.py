@@ -14,7 +14,7 @@ Usage:
 import argparse
 import sys
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List
 from pymongo.errors import OperationFailure
 from bson import ObjectId
 
@@ -27,31 +27,34 @@ if str(UTILS_DIR) not in sys.path:
 from logger_config import setup_logger
 from db_connection import MongoDBConnection
 from config import Config
+from repository import AssertionRef, Repository
 
 logger = setup_logger(__name__, log_file='fix_affiliation_status.log')
 
+# Affiliations marked as added to ORCID that never got a put_code.
+ADDED_WITHOUT_PUT_CODE = {
+    'added_to_orcid': {'$exists': True, '$ne': None},
+    'put_code': {'$exists': False, '$ne': ""},
+}
+
 
 class AffiliationStatusFixer:
 
     def __init__(self, connection: MongoDBConnection, collection_name: str):
         self.connection = connection
         self.collection = connection.get_collection(collection_name)
+        self.affiliations = Repository(self.collection, AssertionRef)
 
-    def find_problematic_affiliations(self) -> List[Dict[str, Any]]:
+    def find_problematic_affiliations(self) -> List[AssertionRef]:
         """
         Find affiliations with added_to_orcid but no put_code.
 
         Returns:
             List of problematic affiliation documents
         """
-        query = {
-            'added_to_orcid': {'$exists': True, '$ne': None},
-            'put_code': {'$exists': False, '$ne': ""},
-        }
-
         try:
             logger.info("Searching for problematic affiliations...")
-            affiliations = list(self.collection.find(query))
+            affiliations = self.affiliations.find_all(ADDED_WITHOUT_PUT_CODE, AssertionRef.STATUS_REPORT)
             logger.info(f"Found {len(affiliations)} affiliations to fix")
             return affiliations
         except OperationFailure as e:
@@ -61,7 +64,7 @@ class AffiliationStatusFixer:
             logger.error(f"Unexpected error during query: {e}")
             return []
 
-    def print_report(self, affiliations: List[Dict[str, Any]]):
+    def print_report(self, affiliations: List[AssertionRef]):
         if not affiliations:
             logger.info("No problematic affiliations found")
             return
@@ -72,7 +75,7 @@ class AffiliationStatusFixer:
 
         status_counts = {}
         for aff in affiliations:
-            status = aff.get('status', 'Unknown')
+            status = aff.status or 'Unknown'
             status_counts[status] = status_counts.get(status, 0) + 1
 
         logger.info(f"\nTotal affiliations to fix: {len(affiliations)}")
@@ -81,16 +84,16 @@ class AffiliationStatusFixer:
             logger.info(f"  - {status}: {count}")
 
         for i, aff in enumerate(affiliations, 1):
-            logger.info(f"\n  {i}. ID: {aff.get('_id')}")
-            logger.info(f"     Status: {aff.get('status', 'Unknown')}")
-            logger.info(f"     Put Code: {'(missing)' if 'put_code' not in aff else aff.get('put_code')}")
-            logger.info(f"     Added to ORCID: {aff.get('added_to_orcid', 'Unknown')}")
-            logger.info(f"     ORCID: {aff.get('orcid_id', 'Unknown')}")
-            logger.info(f"     Organization: {aff.get('org_name', 'Unknown')}")
+            logger.info(f"\n  {i}. ID: {aff.id}")
+            logger.info(f"     Status: {aff.status or 'Unknown'}")
+            logger.info(f"     Put Code: {'(missing)' if aff.put_code is None else aff.put_code}")
+            logger.info(f"     Added to ORCID: {aff.added_to_orcid or 'Unknown'}")
+            logger.info(f"     ORCID: {aff.orcid_id or 'Unknown'}")
+            logger.info(f"     Organization: {aff.org_name or 'Unknown'}")
 
         logger.info("\n" + "="*80)
 
-    def fix_affiliations(self, affiliations: List[Dict[str, Any]]) -> int:
+    def fix_affiliations(self, affiliations: List[AssertionRef]) -> int:
         """
         Fix the status of problematic affiliations.
 
@@ -103,7 +106,7 @@ class AffiliationStatusFixer:
 
         logger.info(f"\n Applying fixes to {len(affiliations)} affiliations...")
 
-        affiliation_ids = [aff['_id'] for aff in affiliations]
+        affiliation_ids = [aff.id for aff in affiliations]
 
         try:
             object_ids = [ObjectId(aid) if not isinstance(aid, ObjectId) else aid for aid in affiliation_ids]
@@ -20,14 +20,20 @@ the source member's client_id becomes the surviving (target) member's client_id.
 
 Related to: https://app.clickup.com/t/9014437828/PD-3781
 
+With --mapping-file, many target/source pairs are handled in one run: the members
+are loaded with a single query and each related collection is reassigned in one
+$in-keyed pass that maps every source to its own target.
+
 Usage:
     python manage_organizations.py --target=<target_member_id> --source=<source_member_id>
+    python manage_organizations.py --mapping-file=merges.csv [--merge]
 """
 
 import argparse
+import csv
 import sys
 from pathlib import Path
-from typing import List, Dict, Any, Tuple
+from typing import TYPE_CHECKING, Iterator, List, Dict, Any, Optional, Tuple
 from bson import ObjectId
 from bson.errors import InvalidId
 from pymongo.errors import OperationFailure
@@ -40,27 +46,49 @@ if str(UTILS_DIR) not in sys.path:
 
 # Import shared modules
 from logger_config import setup_logger
-from db_connection import MongoDBConnection
+from db_connection import MongoConnectionRegistry
 from config import Config
+from repository import MemberRef, Repository, UserRef
+
+if TYPE_CHECKING:
+    from db_connection import MongoDBConnection
 
 # Set up logging
 logger = setup_logger(__name__, log_file='manage-organizations.log')
 
+# Orcid records reassigned per update_many call
+ORCID_RECORD_BATCH_SIZE = 10_000
+
+
+def member_query(member_id: str) -> Dict[str, Any]:
+    return {'member_id': member_id}
+
+
+def member_tokens_query(member_id: str) -> Dict[str, Any]:
+    # Equality with the (string) member id only matches string member_ids,
+    # and unlike an $expr it can use an index on tokens.member_id.
+    return {'tokens.member_id': member_id}
+
+
+def owner_query(member_id: str) -> Dict[str, Any]:
+    """The organization owner of *member_id*."""
+    return {'member_id': member_id, 'main_contact': True}
 
 
 class UpdateOrganizationMember:
 
-    def __init__(self, connection_to_db: MongoDBConnection, target: str, source: str, merge: bool, force_update: bool):
+    def __init__(self, connection_to_db: 'MongoDBConnection', target: str, source: str, merge: bool, force_update: bool):
         self.connection = connection_to_db
         self.collection_member = connection_to_db.get_collection('member')
+        self.members = Repository(self.collection_member, MemberRef)
         self.target = target
         self.source = source
         self.merge = merge
         self.force_update = force_update
-        self.source_member = None
-        self.target_member = None
+        self.source_member: Optional[MemberRef] = None
+        self.target_member: Optional[MemberRef] = None
 
-    def find_problematic_members(self) -> Any:
+    def find_problematic_members(self) -> Optional[MemberRef]:
         """
         Find members to update.
 
@@ -91,13 +119,9 @@ class UpdateOrganizationMember:
                     f"(24-char hex ObjectId): source={self.source}, target={self.target}"
                 )
 
-            source = self.collection_member.find_one(
-                {"_id": source_object_id}
-            )
+            source = self.members.find_one({"_id": source_object_id}, MemberRef.MERGE)
 
-            target = self.collection_member.find_one(
-                {"_id": target_object_id}
-            )
+            target = self.members.find_one({"_id": target_object_id}, MemberRef.MERGE)
 
             if self.merge:
                 if not target:
@@ -121,8 +145,8 @@ class UpdateOrganizationMember:
                     "Found source member to %s member_id=%s, salesforce_id=%s, client_name=%s",
                     action,
                     self.source,
-                    source.get("salesforce_id"),
-                    source.get("client_name"),
+                    source.salesforce_id,
+                    source.client_name,
                 )
             else:
                 logger.info(
@@ -136,8 +160,8 @@ class UpdateOrganizationMember:
                     "Found target member %s member_id=%s, salesforce_id=%s, client_name=%s",
                     action,
                     self.target,
-                    target.get("salesforce_id"),
-                    target.get("client_name"),
+                    target.salesforce_id,
+                    target.client_name,
                 )
             else:
                 logger.info(
@@ -165,7 +189,7 @@ class UpdateOrganizationMember:
 
             if self.merge:
                 source_client_id = (
-                    self.source_member.get('client_id')
+                    self.source_member.client_id
                     if self.source_member else None
                 )
                 if source_client_id:
@@ -206,7 +230,7 @@ class UpdateOrganizationMember:
 
 class UpdateOrganizationsAssertions:
 
-    def __init__(self, connection_to_db: MongoDBConnection, target: str, source: str, member_target: Any, merge: bool = False):
+    def __init__(self, connection_to_db: 'MongoDBConnection', target: str, source: str, member_target: Optional[MemberRef], merge: bool = False):
         self.connection_to_db = connection_to_db
         self.collection_assertion = connection_to_db.get_collection('assertion')
         self.collection_orcid_record = connection_to_db.get_collection('orcid_record')
@@ -216,111 +240,80 @@ class UpdateOrganizationsAssertions:
         self.merge = merge
         self.member_target = member_target
         self.member_id_target = (
-            str(member_target.get('_id'))
-            if member_target and member_target.get('_id') is not None
-            else None
-        )
-        self.salesforce_id_target = (
-            member_target.get('salesforce_id')
-            if member_target and member_target.get('salesforce_id') is not None
+            str(member_target.id)
+            if member_target and member_target.id is not None
             else None
         )
+        self.salesforce_id_target = member_target.salesforce_id if member_target else None
 
-    def find_problematic_assertions(self) -> List[Dict[str, Any]]:
+    def _source_query(self) -> Dict[str, Any]:
+        return member_query(self.source)
+
+    def _source_tokens_query(self) -> Dict[str, Any]:
+        return member_tokens_query(self.source)
+
+    def find_problematic_assertions(self) -> int:
         """
-        Find assertions to update.
+        Count assertions to update.
 
         Returns:
-            List of problematic assertions documents
+            Number of assertions whose member_id is the source
         """
 
         try:
             logger.info("Searching for assertions to update...")
-            assertions = list(self.collection_assertion.find({ 'member_id': self.source }))
-            logger.info(f"Found {len(assertions)} assertions to fix")
+            assertions = self.collection_assertion.count_documents(self._source_query())
+            logger.info(f"Found {assertions} assertions to fix")
             return assertions
         except OperationFailure as e:
             logger.error(f"Failed to query affiliations: {e}")
-            return []
+            return 0
         except Exception as e:
             logger.error(f"Unexpected error during query: {e}")
-            return []
+            return 0
 
-    def find_problematic_orcid_records(self) -> List[Dict[str, Any]]:
+    def find_problematic_orcid_records(self) -> int:
         """
-        Find orcid records to update.
+        Count orcid records to update.
 
         Returns:
-            List of problematic orcid records documents
+            Number of orcid records with at least one token of the source member
         """
 
         try:
             logger.info("Searching for orcid records to update...")
-
-            query = {
-                '$expr': {
-                    '$gt': [
-                        {
-                            '$size': {
-                                '$filter': {
-                                    'input': {'$ifNull': ['$tokens', []]},
-                                    'as': 'token',
-                                    'cond': {
-                                        '$and': [
-                                            {
-                                                '$eq': [
-                                                    {'$type': '$$token.member_id'},
-                                                    'string'
-                                                ]
-                                            },
-                                            {
-                                                '$eq': [
-                                                    '$$token.member_id',
-                                                    self.source
-                                                ]
-                                            }
-                                        ]
-                                    }
-                                }
-                            }
-                        },
-                        0
-                    ]
-                }
-            }
-
-            orcid_records = list(self.collection_orcid_record.find(query))
-            logger.info(f"Found {len(orcid_records)} orcid records to fix")
+            orcid_records = self.collection_orcid_record.count_documents(self._source_tokens_query())
+            logger.info(f"Found {orcid_records} orcid records to fix")
             return orcid_records
         except OperationFailure as e:
             logger.error(f"Failed to query affiliations: {e}")
-            return []
+            return 0
         except Exception as e:
             logger.error(f"Unexpected error during query: {e}")
-            return []
+            return 0
 
-    def find_problematic_send_notifications_request(self) -> List[Dict[str, Any]]:
+    def find_problematic_send_notifications_request(self) -> int:
         """
-        Find send notifications request to update.
+        Count send notifications request to update.
 
         Returns:
-            List of problematic send_notifications_request documents
+            Number of send_notifications_request documents of the source member
         """
 
         try:
             logger.info("Searching for send notifications request to update...")
-            send_notifications_request = list(self.collection_send_notifications_request.find({ 'member_id': self.source }))
-            logger.info(f"Found {len(send_notifications_request)} send notifications request to fix")
+            send_notifications_request = self.collection_send_notifications_request.count_documents(self._source_query())
+            logger.info(f"Found {send_notifications_request} send notifications request to fix")
             return send_notifications_request
         except OperationFailure as e:
             logger.error(f"Failed to query send notifications request: {e}")
-            return []
+            return 0
         except Exception as e:
             logger.error(f"Unexpected error during query: {e}")
-            return []
+            return 0
 
 
-    def print_assertions_report(self, assertions: List[Dict[str, Any]]):
+    def print_assertions_report(self, assertions: int):
         if not assertions:
             logger.info("No problematic assertions found")
             return
@@ -329,12 +322,15 @@ class UpdateOrganizationsAssertions:
         logger.info("PROBLEMATIC ASSERTIONS REPORT")
         logger.info("="*80)
 
-        for i, rec in enumerate(assertions, 1):
+        cursor = self.collection_assertion.find(
+            self._source_query(), {'_id': 0, 'email': 1, 'member_id': 1, 'salesforce_id': 1}
+        )
+        for rec in cursor:
             logger.info(f" Email: {rec.get('email')}, Member Id: {rec.get('member_id')}, Salesforce Id: {rec.get('salesforce_id')}")
 
         logger.info("\n" + "="*80)
 
-    def print_orcid_records_report(self, orcid_records: List[Dict[str, Any]]):
+    def print_orcid_records_report(self, orcid_records: int):
         if not orcid_records:
             logger.info("No problematic orcid records found")
             return
@@ -343,12 +339,15 @@ class UpdateOrganizationsAssertions:
         logger.info("PROBLEMATIC ORCID RECORDS REPORT")
         logger.info("="*80)
 
-        for i, rec in enumerate(orcid_records, 1):
+        cursor = self.collection_orcid_record.find(
+            self._source_tokens_query(), {'_id': 0, 'email': 1, 'salesforce_id': 1}
+        )
+        for rec in cursor:
             logger.info(f" Email: {rec.get('email')} Salesforce Id: {rec.get('salesforce_id')}")
 
         logger.info("\n" + "="*80)
 
-    def print_send_notifications_request_report(self, send_notifications_request: List[Dict[str, Any]]):
+    def print_send_notifications_request_report(self, send_notifications_request: int):
         if not send_notifications_request:
             logger.info("No problematic send notifications found")
             return
@@ -357,12 +356,15 @@ class UpdateOrganizationsAssertions:
         logger.info("PROBLEMATIC SEND NOTIFICATIONS REQUEST REPORT")
         logger.info("="*80)
 
-        for i, rec in enumerate(send_notifications_request, 1):
+        cursor = self.collection_send_notifications_request.find(
+            self._source_query(), {'_id': 0, 'email': 1, 'member_id': 1, 'salesforce_id': 1}
+        )
+        for rec in cursor:
             logger.info(f" Email: {rec.get('email')} Member Id: {rec.get('member_id')} Salesforce Id: {rec.get('salesforce_id')}")
 
         logger.info("\n" + "="*80)
 
-    def fix_assertions(self, assertions: List[Dict[str, Any]]) -> int:
+    def fix_assertions(self, assertions: int) -> int:
         """
         Fix the assertions without Orcid iD.
 
@@ -373,7 +375,7 @@ class UpdateOrganizationsAssertions:
             logger.info("No assertions to fix")
             return 0
 
-        logger.info(f"\n Applying fixes to {len(assertions)} assertions...")
+        logger.info(f"\n Applying fixes to {assertions} assertions...")
 
         try:
 
@@ -382,7 +384,7 @@ class UpdateOrganizationsAssertions:
                 update_fields['salesforce_id'] = self.salesforce_id_target
 
             result = self.collection_assertion.update_many(
-                {'member_id': self.source},
+                self._source_query(),
                 {'$set': update_fields}
             )
 
@@ -399,7 +401,7 @@ class UpdateOrganizationsAssertions:
             logger.error(f" Unexpected error during update: {e}")
             return 0
 
-    def fix_orcid_records(self, orcid_records: List[Dict[str, Any]]) -> int:
+    def fix_orcid_records(self, orcid_records: int) -> int:
         """
         Fix the orcid records that we wanted to update.
 
@@ -410,38 +412,38 @@ class UpdateOrganizationsAssertions:
             logger.info("No orcid records to fix")
             return 0
 
-        logger.info(f"\n Applying fixes to {len(orcid_records)} orcid records...")
+        logger.info(f"\n Applying fixes to {orcid_records} orcid records...")
+
+        token_set_fields = {
+            "tokens.$[token].member_id": self.member_id_target,
+        }
+        if self.salesforce_id_target:
+            token_set_fields["tokens.$[token].salesforce_id"] = self.salesforce_id_target
 
+        matched_count = 0
         modified_count = 0
 
         try:
 
-            for orcid_record in orcid_records:
-                tokens = orcid_record.get("tokens", [])
-
-                for t in tokens:
-                    member_id_update = self.source
-                    member_id_target = self.member_id_target
-                    if member_id_update == t.get("member_id"):
-                        token_set_fields = {
-                            "tokens.$[token].member_id": member_id_target,
-                        }
-                        if self.salesforce_id_target:
-                            token_set_fields["tokens.$[token].salesforce_id"] = self.salesforce_id_target
-
-                        result = self.collection_orcid_record.update_one(
-                            {"_id": orcid_record["_id"]},
-                            {"$set": token_set_fields},
-                            array_filters=[
-                                {"token.member_id": member_id_update}
-                            ]
-                        )
-                        modified_count += result.modified_count
-                        logger.info(
-                            f"Updated member_id: source={member_id_update}, target={member_id_target}"
-                        )
+            # Set-based: every matching token of every record is reassigned
+            # server-side, one update_many per _id range.
+            for id_range in self._orcid_record_id_ranges(orcid_records):
+                result = self.collection_orcid_record.update_many(
+                    {**self._source_tokens_query(), **id_range},
+                    {"$set": token_set_fields},
+                    array_filters=[
+                        {"token.member_id": self.source}
+                    ]
+                )
+                matched_count += result.matched_count
+                modified_count += result.modified_count
 
+            logger.info(
+                f"Updated member_id: source={self.source}, target={self.member_id_target}"
+            )
             logger.info(f" Successfully updated {modified_count} orcid records")
+            logger.info(f"   Matched: {matched_count}")
+            logger.info(f"   Modified: {modified_count}")
 
             return modified_count
 
@@ -453,7 +455,39 @@ class UpdateOrganizationsAssertions:
             logger.error(f" Unexpected error during update: {e}")
             return 0
 
-    def fix_send_notifications_request(self, send_notifications_request: List[Dict[str, Any]]) -> int:
+    def _orcid_record_id_ranges(self, total: int) -> Iterator[Dict[str, Any]]:
+        """
+        Yield `_id` range filters covering the orcid records to fix.
+
+        Up to ORCID_RECORD_BATCH_SIZE records are moved by a single update_many;
+        larger sets are split into consecutive `_id` ranges of that size so no
+        single update runs for too long.
+        """
+        if total <= ORCID_RECORD_BATCH_SIZE:
+            yield {}
+            return
+
+        cursor = self.collection_orcid_record.find(
+            self._source_tokens_query(), {"_id": 1}
+        ).sort("_id", 1)
+        try:
+            first = last = None
+            count = 0
+            for doc in cursor:
+                if first is None:
+                    first = doc["_id"]
+                last = doc["_id"]
+                count += 1
+                if count == ORCID_RECORD_BATCH_SIZE:
+                    yield {"_id": {"$gte": first, "$lte": last}}
+                    first = None
+                    count = 0
+            if first is not None:
+                yield {"_id": {"$gte": first, "$lte": last}}
+        finally:
+            cursor.close()
+
+    def fix_send_notifications_request(self, send_notifications_request: int) -> int:
         """
             Fix the send notifications request to update.
 
@@ -464,7 +498,7 @@ class UpdateOrganizationsAssertions:
             logger.info("No send notifications request to fix")
             return 0
 
-        logger.info(f"\n Applying fixes to {len(send_notifications_request)} send notifications request...")
+        logger.info(f"\n Applying fixes to {send_notifications_request} send notifications request...")
 
         try:
 
@@ -473,7 +507,7 @@ class UpdateOrganizationsAssertions:
                 update_fields['salesforce_id'] = self.salesforce_id_target
 
             result = self.collection_send_notifications_request.update_many(
-                {'member_id': self.source},
+                self._source_query(),
                 {'$set': update_fields}
             )
 
@@ -499,7 +533,7 @@ class UpdateOrganizationsAssertions:
             logger.info(" Verification passed: No problematic assertions found")
             return True
         else:
-            logger.warning(f" Verification failed: {len(remaining)} problematic assertions still exist")
+            logger.warning(f" Verification failed: {remaining} problematic assertions still exist")
             return False
 
     def verify_fixes_orcid_records(self) -> bool:
@@ -510,7 +544,7 @@ class UpdateOrganizationsAssertions:
             logger.info(" Verification passed: No problematic orcid records found")
             return True
         else:
-            logger.warning(f" Verification failed: {len(remaining)} problematic orcid records still exist")
+            logger.warning(f" Verification failed: {remaining} problematic orcid records still exist")
             return False
 
     def verify_fixes_send_notifications_request(self) -> bool:
@@ -521,14 +555,15 @@ class UpdateOrganizationsAssertions:
             logger.info(" Verification passed: No problematic send notifications request found")
             return True
         else:
-            logger.warning(f" Verification failed: {len(remaining)} problematic send notifications request still exist")
+            logger.warning(f" Verification failed: {remaining} problematic send notifications request still exist")
             return False
 
 class UpdateOrganizationsUser:
 
-    def __init__(self, connection_to_db: MongoDBConnection, collection: str, target: str, source: str, member_target: Any, merge: bool, force_update: bool):
+    def __init__(self, connection_to_db: 'MongoDBConnection', collection: str, target: str, source: str, member_target: Optional[MemberRef], merge: bool, force_update: bool):
         self.connection_to_db = connection_to_db
         self.collection_users = connection_to_db.get_collection(collection)
+        self.users = Repository(self.collection_users, UserRef)
         self.target = target
         self.source = source
         self.merge = merge
@@ -537,17 +572,13 @@ class UpdateOrganizationsUser:
         self.remove_owner_from_source_users = False
         self.member_target = member_target
         self.member_id_target = (
-            str(member_target.get('_id'))
-            if member_target and member_target.get('_id') is not None
-            else None
-        )
-        self.salesforce_id_target = (
-            member_target.get('salesforce_id')
-            if member_target and member_target.get('salesforce_id') is not None
+            str(member_target.id)
+            if member_target and member_target.id is not None
             else None
         )
+        self.salesforce_id_target = member_target.salesforce_id if member_target else None
 
-    def find_problematic_users(self) -> Tuple[List[Dict[str, Any]], bool]:
+    def find_problematic_users(self) -> Tuple[List[UserRef], bool]:
         """
         Find users to update.
 
@@ -562,28 +593,26 @@ class UpdateOrganizationsUser:
             logger.info("Searching for users to update...")
             logger.info("="*80)
 
-            users_source = list(self.collection_users.find({ 'member_id': self.source }))
-            users_target = list(self.collection_users.find({ 'member_id': self.target }))
+            users_source = self.users.find_all({'member_id': self.source}, UserRef.OWNER_REPORT)
+            # Only the target's owner matters, not the target's other users.
+            owner = self.users.find_one(owner_query(self.target), UserRef.OWNER_REPORT)
 
             logger.info(f"Found {len(users_source)} users to fix")
             owner_target = False
 
             if users_source:
                 for user in users_source:
-                    if user.get("main_contact"):
-                        self.owner_from_source_users = user.get("_id")
+                    if user.main_contact:
+                        self.owner_from_source_users = user.id
                         break
 
-            if users_target:
-                for user in users_target:
-                    if user.get("main_contact"):
-                        logger.info(
-                            "User email=%s is the organization owner of the target member_id=%s",
-                            user.get("email"),
-                            self.target,
-                        )
-                        owner_target = True
-                        break
+            if owner:
+                logger.info(
+                    "User email=%s is the organization owner of the target member_id=%s",
+                    owner.email,
+                    self.target,
+                )
+                owner_target = True
 
             if self.owner_from_source_users and owner_target:
                 self.remove_owner_from_source_users = True
@@ -602,7 +631,7 @@ class UpdateOrganizationsUser:
             logger.error(f"Unexpected error during query: {e}")
             return [], False
 
-    def print_users_report(self, users: List[Dict[str, Any]]):
+    def print_users_report(self, users: List[UserRef]):
         if not users:
             logger.info("No problematic users found")
             return
@@ -612,11 +641,11 @@ class UpdateOrganizationsUser:
         logger.info("="*80)
 
         for i, rec in enumerate(users, 1):
-            logger.info(f" email: {rec.get('email')} Member Id: {rec.get('member_id')} Salesforce Id: {rec.get('salesforce_id')} Main contact {rec.get('main_contact')}")
+            logger.info(f" email: {rec.email} Member Id: {rec.member_id} Salesforce Id: {rec.salesforce_id} Main contact {rec.main_contact}")
 
         logger.info("\n" + "="*80)
 
-    def fix_users(self, users: List[Dict[str, Any]]) -> int:
+    def fix_users(self, users: List[UserRef]) -> int:
         """
         Fix the users to update.
 
@@ -650,7 +679,7 @@ class UpdateOrganizationsUser:
 
             update_fields = {
                 'member_id': self.member_id_target,
-                'member_name': self.member_target.get('client_name')
+                'member_name': self.member_target.client_name
             }
             if self.salesforce_id_target:
                 update_fields['salesforce_id'] = self.salesforce_id_target
@@ -684,6 +713,325 @@ class UpdateOrganizationsUser:
             logger.warning(f" Verification failed: {len(remaining)} problematic users still exist")
             return False
 
+class BatchOrganizationMerge:
+    """
+    Reassign (and optionally merge) many source members onto their targets.
+
+    Pairs come from a CSV file with ``target`` and ``source`` columns.  Each
+    related collection is updated with one pipeline ``update_many`` keyed by
+    ``member_id: {$in: sources}`` whose ``$switch`` maps every source to its
+    target, so the cost does not grow with the number of pairs.
+    """
+
+    def __init__(self, connection_memberservice: 'MongoDBConnection', connection_assertionservice: 'MongoDBConnection',
+                 connection_userservice: 'MongoDBConnection', pairs: List[Tuple[str, str]], merge: bool):
+        self.collection_member = connection_memberservice.get_collection('member')
+        self.member_refs = Repository(self.collection_member, MemberRef)
+        self.collection_assertion = connection_assertionservice.get_collection('assertion')
+        self.collection_orcid_record = connection_assertionservice.get_collection('orcid_record')
+        self.collection_send_notifications_request = connection_assertionservice.get_collection('send_notifications_request')
+        self.collection_users = connection_userservice.get_collection('jhi_user')
+        self.pairs = pairs
+        self.merge = merge
+        self.sources = [source for _, source in pairs]
+        self.members: Dict[str, MemberRef] = {}
+        self.owners_to_demote: List[Any] = []
+
+    @staticmethod
+    def read_mapping_file(path: str) -> List[Tuple[str, str]]:
+        """
+        Read and validate ``target,source`` pairs from *path*.
+
+        A source may appear only once and may not also be a target, so the
+        result of the batch does not depend on the order of the pairs.
+        """
+        try:
+            with open(path, newline='') as f:
+                reader = csv.DictReader(f)
+                if not reader.fieldnames or not {'target', 'source'} <= {n.strip() for n in reader.fieldnames}:
+                    raise ValueError(f"Error! Mapping file {path} needs a 'target,source' header")
+                rows = [{k.strip(): (v or '').strip() for k, v in row.items() if k} for row in reader]
+        except OSError as e:
+            raise ValueError(f"Error! Cannot read mapping file {path}: {e}")
+
+        pairs: List[Tuple[str, str]] = []
+        seen_sources = set()
+        for line, row in enumerate(rows, 2):
+            target, source = row.get('target'), row.get('source')
+            if not target and not source:
+                continue
+            try:
+                ObjectId(target)
+                ObjectId(source)
+            except (InvalidId, TypeError):
+                raise ValueError(
+                    f"Error! Line {line}: source and target must be valid member_id values "
+                    f"(24-char hex ObjectId): source={source}, target={target}"
+                )
+            if target == source:
+                raise ValueError(f"Error! Line {line}: source and target member cannot be the same {source}")
+            if source in seen_sources:
+                raise ValueError(f"Error! Line {line}: source {source} is listed more than once")
+            seen_sources.add(source)
+            pairs.append((target, source))
+
+        chained = seen_sources & {target for target, _ in pairs}
+        if chained:
+            raise ValueError(
+                f"Error! Members cannot be both a source and a target in one batch: {', '.join(sorted(chained))}"
+            )
+        if not pairs:
+            raise ValueError(f"Error! Mapping file {path} has no target/source pairs")
+        return pairs
+
+    def find_members(self):
+        """Load every member of the batch with one query and check they exist."""
+        logger.info("\n" + "="*80)
+        logger.info(f"Loading {len(self.pairs)} target/source pairs...")
+        logger.info("="*80)
+
+        ids = {ObjectId(member_id) for pair in self.pairs for member_id in pair}
+        self.members = {
+            str(member.id): member
+            for member in self.member_refs.find({'_id': {'$in': list(ids)}}, MemberRef.MERGE)
+        }
+
+        missing_targets = sorted({t for t, _ in self.pairs if t not in self.members})
+        if missing_targets:
+            raise ValueError(f"Error! Target member should exist: target={', '.join(missing_targets)}")
+        if self.merge:
+            missing_sources = sorted(s for s in self.sources if s not in self.members)
+            if missing_sources:
+                raise ValueError(f"Error! Member to merge not found: source={', '.join(missing_sources)}")
+
+            client_id_sources: Dict[str, List[str]] = {}
+            for target, source in self.pairs:
+                if self.members[source].client_id:
+                    client_id_sources.setdefault(target, []).append(source)
+            conflicting = {t: s for t, s in client_id_sources.items() if len(s) > 1}
+            if conflicting:
+                raise ValueError(
+                    "Error! More than one source with a client_id merges into the same target: "
+                    + "; ".join(f"target={t} sources={', '.join(s)}" for t, s in conflicting.items())
+                )
+
+    def _target_of(self, member_id: str, member_field: str = None, current: str = None) -> Any:
+        """
+        Aggregation expression mapping the source id in *member_id* (e.g. ``'$member_id'``)
+        to its target's id, or to the target member's *member_field* when given.
+
+        Anything else, including targets without that field, keeps *current*
+        (by default *member_id* itself).  Ids and field values are wrapped in
+        ``$literal`` so a value starting with ``$`` is not read as a field path.
+        """
+        branches = []
+        for target, source in self.pairs:
+            then = target if member_field is None else getattr(self.members[target], member_field)
+            if then is not None:
+                branches.append({'case': {'$eq': [member_id, {'$literal': source}]}, 'then': {'$literal': then}})
+        default = current or member_id
+        return {'$switch': {'branches': branches, 'default': default}} if branches else default
+
+    def _top_level_update(self, extra_fields: Dict[str, str] = None) -> List[Dict[str, Any]]:
+        fields = {
+            'member_id': self._target_of('$member_id'),
+            'salesforce_id': self._target_of('$member_id', 'salesforce_id', '$salesforce_id'),
+        }
+        for name, member_field in (extra_fields or {}).items():
+            fields[name] = self._target_of('$member_id', member_field, f'${name}')
+        return [{'$set': fields}]
+
+    def _token_update(self) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """
+        ``$set`` and array filters reassigning the tokens of every source.
+
+        One identifier per target, matching the tokens of all its sources, so
+        only the affected token fields are written (as in single mode) rather
+        than the whole ``tokens`` array.
+        """
+        sources_of: Dict[str, List[str]] = {}
+        for target, source in self.pairs:
+            sources_of.setdefault(target, []).append(source)
+
+        fields: Dict[str, Any] = {}
+        array_filters: List[Dict[str, Any]] = []
+        for n, (target, sources) in enumerate(sources_of.items()):
+            fields[f"tokens.$[t{n}].member_id"] = target
+            salesforce_id = self.members[target].salesforce_id
+            if salesforce_id:
+                fields[f"tokens.$[t{n}].salesforce_id"] = salesforce_id
+            array_filters.append({f"t{n}.member_id": {'$in': sources}})
+        return {'$set': fields}, array_filters
+
+    def count_related(self) -> Dict[str, Dict[str, int]]:
+        """Per collection, the number of documents of each source member."""
+        counts: Dict[str, Dict[str, int]] = {}
+        for label, collection, key in (
+            ('assertions', self.collection_assertion, '$member_id'),
+            ('orcid records', self.collection_orcid_record, '$tokens.member_id'),
+            ('send notifications request', self.collection_send_notifications_request, '$member_id'),
+            ('users', self.collection_users, '$member_id'),
+        ):
+            pipeline: List[Dict[str, Any]] = [{'$match': {key[1:]: {'$in': self.sources}}}]
+            if key.startswith('$tokens'):
+                # One count per (record, source) even when a record has several tokens of a source.
+                pipeline += [
+                    {'$project': {'tokens.member_id': 1}},
+                    {'$unwind': '$tokens'},
+                    {'$match': {'tokens.member_id': {'$in': self.sources}}},
+                    {'$group': {'_id': {'record': '$_id', 'member_id': '$tokens.member_id'}}},
+                ]
+                key = '$_id.member_id'
+            pipeline.append({'$group': {'_id': key, 'n': {'$sum': 1}}})
+            counts[label] = {doc['_id']: doc['n'] for doc in collection.aggregate(pipeline)}
+        return counts
+
+    def find_owners_to_demote(self):
+        """
+        Source owners lose main_contact when their target already has an owner.
+
+        With --merge every target must already have an owner, the same rule
+        as a single merge.
+        """
+        owners: Dict[str, Any] = {}
+        cursor = self.collection_users.find(
+            {'member_id': {'$in': list({m for pair in self.pairs for m in pair})}, 'main_contact': True},
+            {'member_id': 1}
+        )
+        for user in cursor:
+            owners.setdefault(user.get('member_id'), user['_id'])
+
+        self.owners_to_demote = []
+        for target, source in self.pairs:
+            if source in owners and target in owners:
+                self.owners_to_demote.append(owners[source])
+            elif self.merge and target not in owners:
+                raise ValueError(f"Error! There is no organization owner for target={target} source={source}")
+
+    def print_report(self, counts: Dict[str, Dict[str, int]]):
+        logger.info("\n" + "="*80)
+        logger.info("BATCH REASSIGNMENT REPORT")
+        logger.info("="*80)
+        for target, source in self.pairs:
+            source_member = self.members.get(source)
+            source_name = source_member.client_name if source_member else None
+            logger.info(
+                f" {source} ({source_name}) -> {target} ({self.members[target].client_name}): "
+                + ", ".join(f"{counts[label].get(source, 0)} {label}" for label in counts)
+            )
+        logger.info("\n" + "="*80)
+
+    def fix_related(self) -> Dict[str, int]:
+        """One update_many per collection; returns modified counts per collection."""
+        modified: Dict[str, int] = {}
+        source_filter = {'member_id': {'$in': self.sources}}
+
+        token_update, token_filters = self._token_update()
+        for label, collection, query, update, array_filters in (
+            ('assertions', self.collection_assertion, source_filter, self._top_level_update(), None),
+            ('orcid records', self.collection_orcid_record, {'tokens.member_id': {'$in': self.sources}},
+             token_update, token_filters),
+            ('send notifications request', self.collection_send_notifications_request, source_filter,
+             self._top_level_update(), None),
+        ):
+            result = collection.update_many(query, update, array_filters=array_filters)
+            modified[label] = result.modified_count
+            logger.info(f" Successfully updated {result.modified_count} {label}")
+            logger.info(f"   Matched: {result.matched_count}")
+            logger.info(f"   Modified: {result.modified_count}")
+
+        if self.owners_to_demote:
+            result = self.collection_users.update_many(
+                {'_id': {'$in': self.owners_to_demote}},
+                {'$set': {'main_contact': False}}
+            )
+            logger.info(f" Removed organization owner flag from {result.modified_count} source users")
+
+        result = self.collection_users.update_many(
+            source_filter, self._top_level_update({'member_name': 'client_name'})
+        )
+        modified['users'] = result.modified_count
+        logger.info(f" Successfully updated salesforce id and member name in {result.modified_count} users")
+        logger.info(f"   Matched: {result.matched_count}")
+        logger.info(f"   Modified: {result.modified_count}")
+        return modified
+
+    def verify(self) -> bool:
+        logger.info("\n Verifying batch reassignment...")
+        remaining = {label: sum(by_source.values()) for label, by_source in self.count_related().items()}
+        if any(remaining.values()):
+            logger.warning(
+                " Verification failed: "
+                + ", ".join(f"{n} {label}" for label, n in remaining.items() if n)
+                + " still reference a source member"
+            )
+            return False
+        logger.info(" Verification passed: no records reference a source member")
+        return True
+
+    def update_members(self):
+        """With --merge, move client_ids to the targets and delete the sources."""
+        if not self.merge:
+            return
+        for target, source in self.pairs:
+            client_id = self.members[source].client_id
+            if client_id:
+                self.collection_member.update_one({'_id': ObjectId(target)}, {'$set': {'client_id': client_id}})
+                logger.info("Updated target member member_id=%s client_id to %s", target, client_id)
+        result = self.collection_member.delete_many({'_id': {'$in': [ObjectId(s) for s in self.sources]}})
+        logger.info("Members deleted %d / %d", result.deleted_count, len(self.sources))
+
+
+def run_batch(registry: MongoConnectionRegistry, mapping_file: str, merge: bool) -> int:
+    """Batch mode for --mapping-file."""
+    pairs = BatchOrganizationMerge.read_mapping_file(mapping_file)
+    batch = BatchOrganizationMerge(
+        registry.get('memberservice'), registry.get('assertionservice'), registry.get('userservice'),
+        pairs, merge
+    )
+    batch.find_members()
+    batch.find_owners_to_demote()
+    counts = batch.count_related()
+    batch.print_report(counts)
+
+    totals = {label: sum(by_source.values()) for label, by_source in counts.items()}
+    if not any(totals.values()) and not merge:
+        logger.info("\n No fixes needed. No records reference the source members.")
+        return 0
+
+    logger.info("\n" + "="*80)
+    logger.info("  WARNING: This will modify the database!")
+    logger.info(f"  {len(pairs)} source members will be reassigned")
+    for label, total in totals.items():
+        logger.info(f"  {total} {label} will be updated")
+    if batch.owners_to_demote:
+        logger.info(f"  {len(batch.owners_to_demote)} source organization owners will be removed, since their target already has one")
+    if merge:
+        logger.info(f"  {len(pairs)} source members will be deleted")
+    logger.info("="*80)
+
+    try:
+        response = input("\nDo you want to proceed? (yes/no): ").strip().lower()
+        if response not in ['yes', 'y']:
+            logger.info("\n Operation cancelled by user")
+            return 0
+    except (KeyboardInterrupt, EOFError):
+        logger.info("\n\n Operation cancelled by user")
+        return 1
+
+    batch.fix_related()
+    if not batch.verify():
+        logger.warning("\n Some records may still need attention")
+        return 1
+
+    batch.update_members()
+
+    logger.info("\n" + "="*80)
+    logger.info("Script completed successfully")
+    logger.info("="*80)
+    return 0
+
+
 def parse_arguments():
     parser = argparse.ArgumentParser(
         description='Manage organizations',
@@ -693,6 +1041,9 @@ Examples:
   # Interactive mode
   python manage_organizations.py
 
+  # Batch: merge every source into its target listed in a CSV (target,source)
+  python manage_organizations.py --mapping-file=merges.csv --merge
+
   MONGO_URI or MONGO_DB       - MongoDB connection string
         """
     )
@@ -705,6 +1056,11 @@ Examples:
         action="store_true",
         help="Delete the source member after references are updated"
     )
+    parser.add_argument(
+        '--mapping-file',
+        help='CSV file with "target,source" columns; reassigns every pair in one batch '
+             '(replaces --target/--source)'
+    )
     parser.add_argument(
         "--force_update",
         action="store_true",
@@ -734,28 +1090,33 @@ def main():
     logger.info(f"Databases: {database_assertionservice}, {database_userservice} and {database_memberservice} ")
     logger.info(f"Collections: assertion, orcid_record, send_notifications_request, jhi_user and member")
     logger.info(f"MongoDB URI: {mongo_uri[:20]}..." if len(mongo_uri) > 20 else f"MongoDB URI: {mongo_uri}")
-    logger.info(f"Target member_id: {target}")
-    logger.info(f"Source member_id: {source}")
+    if args.mapping_file:
+        logger.info(f"Mapping file: {args.mapping_file}")
+    else:
+        logger.info(f"Target member_id: {target}")
+        logger.info(f"Source member_id: {source}")
     logger.info(f"Merge option: {merge}")
     logger.info(f"Force update member option: {force_update}")
     logger.info("="*80 + "\n")
 
-    connection_assertionservice = MongoDBConnection(mongo_uri, database_assertionservice)
-    connection_userservice = MongoDBConnection(mongo_uri, database_userservice)
-    connection_memberservice = MongoDBConnection(mongo_uri, database_memberservice)
+    if args.mapping_file and (target or source or force_update):
+        logger.error("--mapping-file cannot be combined with --target, --source or --force_update")
+        return 1
+
+    # One pooled client serves all three databases.
+    registry = MongoConnectionRegistry(mongo_uri, max_pool_size=config.mongo_max_pool_size)
 
     try:
-        if not connection_assertionservice.connect():
-            logger.error("Failed to connect to assertionservice MongoDB. Exiting.")
+        if not registry.connect():
+            logger.error("Failed to connect to MongoDB. Exiting.")
             return 1
 
-        if not connection_userservice.connect():
-            logger.error("Failed to connect to userservice MongoDB. Exiting.")
-            return 1
+        if args.mapping_file:
+            return run_batch(registry, args.mapping_file, merge)
 
-        if not connection_memberservice.connect():
-            logger.error("Failed to connect to memberservice MongoDB. Exiting.")
-            return 1
+        connection_assertionservice = registry.get(database_assertionservice)
+        connection_userservice = registry.get(database_userservice)
+        connection_memberservice = registry.get(database_memberservice)
 
         fixer_memberservice = UpdateOrganizationMember(connection_memberservice, target, source, merge, force_update)
 
@@ -789,17 +1150,17 @@ def main():
 
         logger.info("\n" + "="*80)
         logger.info("  WARNING: This will modify the database!")
-        logger.info(f"  {len(assertions)} assertions will be updated")
-        logger.info(f"  {len(orcid_records)} orcid records will be updated")
-        logger.info(f"  {len(send_notifications_request)} send notifications request will be updated")
+        logger.info(f"  {assertions} assertions will be updated")
+        logger.info(f"  {orcid_records} orcid records will be updated")
+        logger.info(f"  {send_notifications_request} send notifications request will be updated")
         logger.info(f"  {len(users_list)} users will be updated")
         if remove_owner_flag:
             logger.info(f"  The organization owner user from the source member will be removed, since there is already one on the target")
 
         if merge:
             logger.info(f"  Member {source} will be deleted")
-            source_client_id = member_source.get('client_id') if member_source else None
-            target_client_id = member_target.get('client_id') if member_target else None
+            source_client_id = member_source.client_id if member_source else None
+            target_client_id = member_target.client_id if member_target else None
             if source_client_id:
                 logger.info(f"  The client_id {target_client_id} will be replaced by {source_client_id}")
         logger.info("="*80)
@@ -858,9 +1219,7 @@ def main():
         logger.error(f"\n Unexpected error: {e}", exc_info=True)
         raise
     finally:
-        connection_assertionservice.disconnect()
-        connection_memberservice.disconnect()
-        connection_userservice.disconnect()
+        registry.disconnect()
 
 
 if __name__ == '__main__':
@@ -24,15 +24,21 @@ Parameters
     then deletes all affiliations listed in Affiliation Manager for the
     resolved member ID.
 
+--chunk-size
+    Documents removed per delete_many call (default 1000).
+
 Behavior
 --------
-The script builds the delete query from member scope and removes all matching
-documents in the target collection.
+The script builds the delete query from member scope, counts the matching
+documents in each collection and, after confirmation, deletes them in
+chunks read from a single _id-only cursor, with throughput/ETA progress.
+Several collections are cleaned concurrently.
 
 Usage
 -----
 python delete_documents.py --database assertionservice --collections assertion --member-id <member_id>
 python delete_documents.py --database assertionservice --collections assertion --member-salesforce-id <sf_id>
+python delete_documents.py --database assertionservice --collections assertion send_notifications_request --member-id <member_id>
 
 Examples
 --------
@@ -43,7 +49,9 @@ import argparse
 import re
 import sys
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Dict, Any, Optional
 from pymongo.errors import OperationFailure
 from bson import ObjectId
 
@@ -62,6 +70,13 @@ logger = setup_logger(__name__, log_file='delete_documents.log')
 
 SALESFORCE_ID_PATTERN = re.compile(r"^[a-zA-Z0-9]{18}$")
 
+# Documents deleted per delete_many; also the cursor batch size.
+DEFAULT_CHUNK_SIZE = 1000
+# Seconds between progress lines while deleting.
+PROGRESS_INTERVAL_S = 5
+# _ids listed in the pre-delete report.
+REPORT_SAMPLE_SIZE = 20
+
 
 class DeleteDocuments:
 
@@ -69,11 +84,13 @@ class DeleteDocuments:
             self,
             connection: MongoDBConnection,
             collection_name: str,
-            inline_filters: Optional[List[Dict[str, Any]]] = None
+            inline_filters: Optional[List[Dict[str, Any]]] = None,
+            chunk_size: int = DEFAULT_CHUNK_SIZE
     ):
         self.connection = connection
         self.collection = connection.get_collection(collection_name)
         self.inline_filters = inline_filters or []
+        self.chunk_size = chunk_size
 
     def _load_items(self) -> Optional[List[Dict[str, Any]]]:
         if self.inline_filters:
@@ -82,100 +99,140 @@ class DeleteDocuments:
         logger.error("No inline filters were provided")
         return None
 
-    def find_problematic_collections(self) -> List[Dict[str, Any]]:
-        """
-        Find documents of the JSON provided.
-
-        Returns:
-            List of problematic documents
-        """
+    def _query(self) -> Optional[Dict[str, Any]]:
         items = self._load_items()
         if not items:
-            return []
+            return None
+        return {"$or": [self.prepare_item(dict(item)) for item in items]}
 
-        cleaned_items = [self.prepare_item(item) for item in items]
+    def find_problematic_collections(self) -> int:
+        """
+        Count the documents matching the filters provided.
 
-        query = {"$or": cleaned_items}
+        Returns:
+            Number of problematic documents
+        """
+        query = self._query()
+        if query is None:
+            return 0
 
         try:
             logger.info(f"Searching for documents in collection '{self.collection.name}' where '{query}'")
-            documents = list(self.collection.find(query))
-            for doc in documents:
-                logger.info(f"Document with _id '{doc['_id']}' found")
-                logger.info(f"Found {len(documents)} documents to delete")
-            return documents
+            count = self.collection.count_documents(query)
+            logger.info(f"Found {count} documents to delete in '{self.collection.name}'")
+            return count
         except OperationFailure as e:
             logger.error(f"Failed to query documents: {e}")
-            return []
+            return 0
         except Exception as e:
             logger.error(f"Unexpected error during query: {e}")
-            return []
+            return 0
 
-    def print_report(self, documents: List[Dict[str, Any]]):
-        if not documents:
-            logger.info("No assertions found")
+    def print_report(self, count: int):
+        if not count:
+            logger.info(f"No documents found in '{self.collection.name}'")
             return
 
         logger.info("\n" + "="*80)
-        logger.info("ASSERTIONS DOCUMENTS REPORT")
+        logger.info(f"{self.collection.name.upper()} DOCUMENTS REPORT")
         logger.info("="*80)
 
-        status_counts = {}
-        for doc in documents:
-            status = doc.get('_id', 'Unknown')
-            status_counts[status] = status_counts.get(status, 0) + 1
+        sample = [
+            doc["_id"] for doc in
+            self.collection.find(self._query(), {"_id": 1}).limit(REPORT_SAMPLE_SIZE)
+        ]
+        for doc_id in sample:
+            logger.info(f"Document with _id '{doc_id}' found")
+        if count > len(sample):
+            logger.info(f"... and {count - len(sample)} more")
 
-        logger.info(f"\nTotal documents to delete: {len(documents)}")
+        logger.info(f"\nTotal documents to delete: {count}")
 
         logger.info("\n" + "="*80)
 
-    def delete_documents(self, documents: List[Dict[str, Any]]) -> int:
+    def _id_chunks(self, chunk_size: int) -> Iterator[List[Any]]:
+        """
+        Yield matching `_id`s, *chunk_size* at a time, in natural order.
+
+        A single cursor projected to `_id` streams the whole match; deleting
+        documents it has already returned does not disturb it, and no `_id`
+        sort is needed, so the query runs once whatever indexes exist.
         """
-        Delete the specified documents.
+        query = self._query()
+        if query is None:
+            return
+        cursor = self.collection.find(query, {"_id": 1}, batch_size=chunk_size)
+        try:
+            ids = []
+            for doc in cursor:
+                ids.append(doc["_id"])
+                if len(ids) == chunk_size:
+                    yield ids
+                    ids = []
+            if ids:
+                yield ids
+        finally:
+            cursor.close()
+
+    def delete_documents(self, count: int) -> int:
+        """
+        Delete the matching documents in chunks of ``chunk_size``.
 
         Returns:
             Number of documents successfully deleted
         """
-        if not documents:
-            logger.info("No documents to delete")
+        if not count:
+            logger.info(f"No documents to delete in '{self.collection.name}'")
             return 0
 
-        logger.info(f"\n Deleting {len(documents)} documents...")
+        name = self.collection.name
+        logger.info(f"\n Deleting {count} documents from '{name}' in chunks of {self.chunk_size}...")
 
-        document_ids = [doc['_id'] for doc in documents if '_id' in doc and doc['_id'] is not None]
+        deleted = 0
+        started = time.monotonic()
+        last_report = started
 
         try:
-            object_ids = [ObjectId(aid) if not isinstance(aid, ObjectId) else aid for aid in document_ids]
-
-            result = self.collection.delete_many(
-                {'_id': {'$in': object_ids}},
-            )
-
-            logger.info(f" Successfully deleted {result.deleted_count} documents")
-            logger.info(f"   Matched: {result.deleted_count}")
-            logger.info(f"   Deleted: {result.deleted_count}")
-
-            return result.deleted_count
+            for ids in self._id_chunks(self.chunk_size):
+                result = self.collection.delete_many({"_id": {"$in": ids}})
+                deleted += result.deleted_count
+
+                now = time.monotonic()
+                if now - last_report >= PROGRESS_INTERVAL_S:
+                    last_report = now
+                    rate = deleted / (now - started) if now > started else 0.0
+                    eta = (count - deleted) / rate if rate else 0.0
+                    logger.info(
+                        f"   ...{name}: {deleted}/{count} deleted "
+                        f"({rate:,.0f} docs/s, ETA {eta:,.0f}s)"
+                    )
+
+            elapsed = time.monotonic() - started
+            logger.info(f" Successfully deleted {deleted} documents from '{name}' in {elapsed:,.1f}s")
+            logger.info(f"   Matched: {count}")
+            logger.info(f"   Deleted: {deleted}")
+
+            return deleted
 
         except OperationFailure as e:
-            logger.error(f" Failed to delete documents: {e}")
-            return 0
+            logger.error(f" Failed to delete documents from '{name}' after {deleted} deletions: {e}")
+            return deleted
         except Exception as e:
-            logger.error(f" Unexpected error during deletion: {e}")
-            return 0
+            logger.error(f" Unexpected error during deletion from '{name}' after {deleted} deletions: {e}")
+            return deleted
 
     def verify_fixes(self) -> bool:
-        logger.info("\n Verifying fixes...")
+        logger.info(f"\n Verifying fixes in '{self.collection.name}'...")
         remaining = self.find_problematic_collections()
 
         if not remaining:
             logger.info(" Verification passed: No problematic documents found")
             return True
         else:
-            logger.warning(f" Verification failed: {len(remaining)} problematic documents still exist")
+            logger.warning(f" Verification failed: {remaining} problematic documents still exist")
             return False
 
-    def prepare_item(self, item):  # <-- Add 'self' here
+    def prepare_item(self, item):
         if "_id" in item and isinstance(item["_id"], str):
             try:
                 # Ensure it's a valid 24-character hex string for ObjectId
@@ -204,13 +261,23 @@ Environment Variables:
 
     parser.add_argument('--mongo-uri', help='MongoDB URI (overrides env)')
     parser.add_argument('--database', help='MongoDB database name (overrides env)')
-    parser.add_argument('--collections', help='MongoDB collection(s) name')
+    parser.add_argument(
+        '--collections',
+        nargs='+',
+        help='MongoDB collection name(s), space or comma separated; all are cleaned concurrently'
+    )
     parser.add_argument('--member-id', dest='member_id', help='Internal member ID to clean all affiliations for')
     parser.add_argument(
         '--member-salesforce-id',
         dest='member_salesforce_id',
         help='Salesforce ID to resolve member and clean all affiliations for that member'
     )
+    parser.add_argument(
+        '--chunk-size',
+        type=int,
+        default=DEFAULT_CHUNK_SIZE,
+        help=f'Documents deleted per delete_many call (default: {DEFAULT_CHUNK_SIZE})'
+    )
 
     return parser.parse_args()
 
@@ -256,7 +323,11 @@ def main():
 
     mongo_uri = args.mongo_uri or config.mongo_uri
     database = args.database or config.mongo_database
-    collections = args.collections or config.mongo_collection
+    collections = [
+        name.strip()
+        for value in (args.collections or [config.mongo_collection])
+        for name in value.split(',') if name.strip()
+    ]
     member_id = args.member_id
     member_salesforce_id = args.member_salesforce_id
 
@@ -274,11 +345,15 @@ def main():
             return 1
         member_id = resolved_member_id
 
-    if member_id and collections != 'assertion':
+    if args.chunk_size < 1:
+        logger.error("--chunk-size must be at least 1")
+        return 1
+
+    if member_id and collections != ['assertion']:
         logger.warning(
             "Member cleanup is intended for Affiliation Manager data in 'assertion'. "
-            "Current collection is '%s'.",
-            collections,
+            "Current collections are '%s'.",
+            ", ".join(collections),
         )
 
     inline_filters: List[Dict[str, Any]] = []
@@ -290,7 +365,8 @@ def main():
     logger.info("="*80)
     logger.info(f"MongoDB URI: {mongo_uri[:20]}..." if len(mongo_uri) > 20 else f"MongoDB URI: {mongo_uri}")
     logger.info(f"Database: {database}")
-    logger.info(f"Collection: {collections}")
+    logger.info(f"Collections: {', '.join(collections)}")
+    logger.info(f"Chunk size: {args.chunk_size}")
     if member_id:
         logger.info(f"Member ID scope: {member_id}")
     logger.info("="*80 + "\n")
@@ -302,19 +378,24 @@ def main():
             logger.error("Failed to connect to MongoDB. Exiting.")
             return 1
 
-        fixer = DeleteDocuments(connection, collections, inline_filters)
-
-        documents = fixer.find_problematic_collections()
+        fixers = [
+            DeleteDocuments(connection, name, inline_filters, args.chunk_size)
+            for name in collections
+        ]
 
-        fixer.print_report(documents)
+        counts = {}
+        for fixer in fixers:
+            counts[fixer.collection.name] = fixer.find_problematic_collections()
+            fixer.print_report(counts[fixer.collection.name])
 
-        if not documents:
+        if not any(counts.values()):
             logger.info("\n No deletions needed.")
             return 0
 
         logger.info("\n" + "="*80)
         logger.info("  WARNING: This will modify the database!")
-        logger.info(f"  {len(documents)} documents will be deleted from collection '{collections}'")
+        for name, count in counts.items():
+            logger.info(f"  {count} documents will be deleted from collection '{name}'")
         logger.info("="*80)
 
         try:
@@ -326,12 +407,15 @@ def main():
             logger.info("\n\n Operation cancelled by user")
             return 1
 
-        deleted_count = fixer.delete_documents(documents)
+        # Collections are independent, so each gets its own worker.
+        with ThreadPoolExecutor(max_workers=len(fixers), thread_name_prefix='delete') as pool:
+            deleted = list(pool.map(lambda f: f.delete_documents(counts[f.collection.name]), fixers))
 
-        if deleted_count > 0:
-            if not fixer.verify_fixes():
-                logger.warning("\n Some documents may still need attention")
-                return 1
+        for fixer, deleted_count in zip(fixers, deleted):
+            if deleted_count > 0:
+                if not fixer.verify_fixes():
+                    logger.warning("\n Some documents may still need attention")
+                    return 1
 
         logger.info("\n" + "="*80)
         logger.info("Script completed successfully")
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Tests for the --resume handling of query-fixes/backfill_member_id.py, with a
+stand-in bulk writer instead of a server.
+
+Usage:
+    python -m unittest discover -s tests
+"""
+
+import importlib
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from typing import Any, List
+from unittest import mock
+
+from bson import ObjectId, decode
+from pymongo.errors import BulkWriteError
+
+CURRENT_DIR = Path(__file__).resolve().parent
+UTILS_DIR = CURRENT_DIR.parent / "utils"
+QUERY_FIXES_DIR = CURRENT_DIR.parent / "query-fixes"
+
+for path in (UTILS_DIR, QUERY_FIXES_DIR):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+from backfill_plan import BackfillPlan
+from batch_sizer import AdaptiveBatchSizer
+from raw_bulk import RawBulkResult
+
+backfill_member_id = None
+
+
+def setUpModule():
+    # The script opens logs/backfill-member-id.log on import; keep it out of the tree.
+    global backfill_member_id
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.chdir(temp_dir)
+        try:
+            backfill_member_id = importlib.import_module("backfill_member_id")
+        finally:
+            os.chdir(cwd)
+
+
+class FakeWriter:
+    """Records the `_id` of every statement; fails the batch numbered *fail_on* (1-based)."""
+
+    def __init__(self, fail_on: int = 0):
+        self.fail_on = fail_on
+        self.batches: List[List[Any]] = []
+
+    def execute(self, batch) -> Any:
+        if len(self.batches) + 1 == self.fail_on:
+            raise BulkWriteError({'writeErrors': [{'errmsg': 'boom'}], 'nModified': 0})
+        self.batches.append([decode(statement.raw)['q']['_id'] for statement in batch])
+        result = RawBulkResult()
+        result.modified_count = len(batch)
+        return result
+
+
+class ResumeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.plan_dir = self.temp_dir.name
+        patcher = mock.patch.object(backfill_member_id, "get_write_throttle")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_plan(self, entries: int = 10, **manifest) -> BackfillPlan:
+        plan = BackfillPlan.create(self.plan_dir, backfill_member_id.PLAN_NAME)
+        self.ids = [ObjectId() for _ in range(entries)]
+        with plan.writer("assertion") as writer:
+            for doc_id in self.ids:
+                writer.write({'_id': doc_id, 'old': None, 'new': 'm1'})
+        plan.record("assertion", writer)
+        for key, value in manifest.items():
+            plan.set(key, value)
+        return plan
+
+    def backfiller(self, writer: FakeWriter):
+        backfiller = backfill_member_id.TopLevelBackfiller(mock.MagicMock(), "assertion")
+        backfiller.writer = writer
+        backfiller.sizer = AdaptiveBatchSizer("assertion", initial=3, min_size=3, max_size=3)
+        return backfiller
+
+
+class ApplyResumeTest(ResumeTestCase):
+
+    def test_checkpoint_stops_at_the_last_acknowledged_batch(self):
+        plan = self.make_plan()
+        writer = FakeWriter(fail_on=3)
+        with self.assertRaises(backfill_member_id.BackfillError):
+            self.backfiller(writer).apply(plan)
+        self.assertEqual([doc_id for batch in writer.batches for doc_id in batch], self.ids[:6])
+        reloaded = BackfillPlan(plan.directory)
+        self.assertEqual(reloaded.applied("assertion"), 6)
+        self.assertEqual(reloaded.last_id("assertion"), self.ids[5])
+        self.assertEqual(reloaded.modified("assertion"), 6)
+
+    def test_resume_replays_only_the_remaining_entries(self):
+        plan = self.make_plan()
+        plan.checkpoint("assertion", 6, self.ids[5], 6)
+        writer = FakeWriter()
+        modified = self.backfiller(writer).apply(BackfillPlan(plan.directory))
+        self.assertEqual([doc_id for batch in writer.batches for doc_id in batch], self.ids[6:])
+        self.assertEqual(modified, 10)
+        reloaded = BackfillPlan(plan.directory)
+        self.assertEqual(reloaded.applied("assertion"), 10)
+        self.assertEqual(reloaded.last_id("assertion"), self.ids[-1])
+
+    def test_fully_applied_plan_writes_nothing(self):
+        plan = self.make_plan()
+        plan.checkpoint("assertion", 10, self.ids[-1], 10)
+        writer = FakeWriter()
+        self.assertEqual(self.backfiller(writer).apply(BackfillPlan(plan.directory)), 10)
+        self.assertEqual(writer.batches, [])
+
+
+class LoadResumePlanTest(ResumeTestCase):
+
+    def load(self, resume=None, **kwargs):
+        return backfill_member_id.load_resume_plan(resume or backfill_member_id.LATEST_PLAN, self.plan_dir, **kwargs)
+
+    def assert_refused(self, message: str, resume=None, **kwargs):
+        with self.assertRaises(backfill_member_id.BackfillError) as raised:
+            self.load(resume, **kwargs)
+        self.assertIn(message, str(raised.exception))
+
+    def test_latest_complete_plan(self):
+        plan = self.make_plan(complete=True)
+        self.assertEqual(self.load().directory, plan.directory)
+        self.assertEqual(self.load(str(plan.directory)).directory, plan.directory)
+
+    def test_no_plan(self):
+        self.assert_refused("No backfill-member-id plan found")
+
+    def test_incomplete_plan(self):
+        self.make_plan()
+        self.assert_refused("is incomplete")
+
+    def test_other_source(self):
+        self.make_plan(complete=True, source="SF1")
+        self.assertEqual(self.load(source_filter="SF1").get('source'), "SF1")
+        self.assert_refused("was built for source='SF1'", source_filter="SF2")
+
+    def test_other_token_writes(self):
+        self.make_plan(complete=True, token_writes=backfill_member_id.TOKEN_WRITES_ARRAY_FILTERS)
+        self.assert_refused("--token-writes=array-filters")
+        self.load(token_writes=backfill_member_id.TOKEN_WRITES_ARRAY_FILTERS)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Tests for the plan/execute split of query-fixes/backfill_orcid_record_tokens.py,
+with a stand-in orcid_record collection and bulk writer instead of a server.
+
+Usage:
+    python -m unittest discover -s tests
+"""
+
+import importlib
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from typing import Any, Dict, List
+from unittest import mock
+
+from bson import ObjectId, decode
+
+CURRENT_DIR = Path(__file__).resolve().parent
+UTILS_DIR = CURRENT_DIR.parent / "utils"
+QUERY_FIXES_DIR = CURRENT_DIR.parent / "query-fixes"
+
+for path in (UTILS_DIR, QUERY_FIXES_DIR):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+from batch_sizer import AdaptiveBatchSizer
+from raw_bulk import RawBulkResult
+
+backfill_tokens = None
+
+
+def setUpModule():
+    # The script opens logs/backfill-orcid-record-tokens.log on import; keep it out of the tree.
+    global backfill_tokens
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.chdir(temp_dir)
+        try:
+            backfill_tokens = importlib.import_module("backfill_orcid_record_tokens")
+        finally:
+            os.chdir(cwd)
+
+
+class FakeCursor(list):
+
+    def close(self):
+        pass
+
+
+class FakeCollection:
+    """Answers the `$in` lookups of the planning pass from *docs*."""
+
+    def __init__(self, docs: List[Dict[str, Any]]):
+        self.docs = docs
+        self.finds = 0
+        self.database = mock.MagicMock()
+
+    def find(self, query, projection=None, **kwargs):
+        self.finds += 1
+        emails = set(query["email"]["$in"])
+        return FakeCursor(doc for doc in self.docs if doc["email"] in emails)
+
+
+class FakeWriter:
+    """Acknowledges every statement; records (command, statement count) per batch."""
+
+    def __init__(self):
+        self.batches: List[Any] = []
+
+    def execute(self, batch) -> RawBulkResult:
+        self.batches.append((batch.command, len(batch)))
+        result = RawBulkResult()
+        if batch.command == "insert":
+            result.inserted_count = len(batch)
+        else:
+            result.modified_count = len(batch)
+        return result
+
+
+class PlanExecuteTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(backfill_tokens, "get_write_throttle")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.records = [
+            {"_id": ObjectId(), "email": "a@x.org", "tokens": [{"member_id": "m1"}]},
+            {"_id": ObjectId(), "email": "b@x.org", "tokens": []},
+            {"_id": ObjectId(), "email": "c@x.org", "tokens": [{"member_id": "m1"}, {"member_id": "m2"}]},
+        ]
+        self.needed = {
+            "a@x.org": {"m1", "m2"},
+            "b@x.org": {"m1"},
+            "c@x.org": {"m1", "m2"},
+            "d@x.org": {"m3"},
+            "e@x.org": {"m1", "m3"},
+        }
+        self.collection = FakeCollection(self.records)
+        connection = mock.MagicMock()
+        connection.get_collection.return_value = self.collection
+        self.backfiller = backfill_tokens.OrcidRecordTokenBackfiller(connection)
+        self.backfiller.writer = FakeWriter()
+        self.set_batch_size(1)
+
+    def set_batch_size(self, size: int):
+        for label in list(self.backfiller.sizers):
+            self.backfiller.sizers[label] = AdaptiveBatchSizer(label, initial=size, min_size=size, max_size=size)
+
+    def plan(self):
+        summary, planned = self.backfiller.plan_ops(self.needed)
+        self.addCleanup(planned.close)
+        return summary, planned
+
+    def test_plan_counts_match_the_spooled_statements(self):
+        summary, planned = self.plan()
+        self.assertEqual(self.collection.finds, 1)
+        self.assertEqual(summary.scanned, 3)
+        self.assertEqual(summary.records_to_update, 2)
+        self.assertEqual(summary.tokens_to_add, 2)
+        self.assertEqual(summary.records_to_create, 2)
+        self.assertEqual(len(planned), 4)
+        self.assertGreater(planned.bytes, 0)
+
+        statements = list(planned)
+        self.assertEqual([command for command, _ in statements], ["update", "update", "insert", "insert"])
+        updates = {decode(s.raw)["q"]["_id"]: decode(s.raw) for c, s in statements if c == "update"}
+        self.assertEqual(updates[self.records[0]["_id"]]["u"]["$push"]["tokens"]["$each"], [{"member_id": "m2"}])
+        inserts = [decode(s.raw) for c, s in statements if c == "insert"]
+        self.assertEqual([doc["email"] for doc in inserts], ["d@x.org", "e@x.org"])
+        self.assertEqual(inserts[1]["tokens"], [{"member_id": "m1"}, {"member_id": "m3"}])
+        # The spool can be replayed; it is only deleted by close().
+        self.assertEqual(len(list(planned)), 4)
+
+    def test_close_deletes_the_spool(self):
+        _, planned = self.plan()
+        self.assertTrue(planned.path.exists())
+        planned.close()
+        self.assertFalse(planned.directory.exists())
+
+    def test_batches_regroup_by_command_and_current_size(self):
+        _, planned = self.plan()
+        self.set_batch_size(3)
+        self.assertEqual([(b.command, len(b)) for b in self.backfiller.batches(planned)],
+                         [("update", 2), ("insert", 2)])
+        self.set_batch_size(1)
+        self.assertEqual([(b.command, len(b)) for b in self.backfiller.batches(planned)],
+                         [("update", 1), ("update", 1), ("insert", 1), ("insert", 1)])
+
+    def test_execute_returns_the_acknowledged_counts(self):
+        _, planned = self.plan()
+        self.set_batch_size(3)
+        updated, inserted = self.backfiller.execute(self.backfiller.batches(planned))
+        self.assertEqual((updated, inserted), (2, 2))
+        self.assertEqual(self.backfiller.writer.batches, [("update", 2), ("insert", 2)])
+
+    def test_nothing_needed_plans_nothing(self):
+        self.needed = {}
+        _, planned = self.plan()
+        self.assertEqual(len(planned), 0)
+        self.assertEqual(self.backfiller.execute(self.backfiller.batches(planned)), (0, 0))
+        self.assertEqual(self.collection.finds, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Tests for the plan files and checkpoints of utils/backfill_plan.py.
+
+Usage:
+    python -m unittest discover -s tests
+"""
+
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+from bson import ObjectId
+
+CURRENT_DIR = Path(__file__).resolve().parent
+UTILS_DIR = CURRENT_DIR.parent / "utils"
+
+if str(UTILS_DIR) not in sys.path:
+    sys.path.insert(0, str(UTILS_DIR))
+
+from backfill_plan import BackfillPlan
+
+
+class BackfillPlanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.base = self.temp_dir.name
+        self.plan = BackfillPlan.create(self.base, "test-plan")
+        self.ids = [ObjectId() for _ in range(10)]
+
+    def write(self, label, entries, part=None):
+        with self.plan.writer(label, part) as writer:
+            for entry in entries:
+                writer.write(entry)
+        return writer
+
+    def test_entries_round_trip_and_skip(self):
+        writer = self.write("assertion", [{'_id': i, 'new': 'm'} for i in self.ids])
+        self.plan.record("assertion", writer, scanned=20)
+        self.assertEqual(self.plan.count("assertion"), 10)
+        self.assertEqual([e['_id'] for e in self.plan.entries("assertion")], self.ids)
+        self.assertEqual([e['_id'] for e in self.plan.entries("assertion", skip=7)], self.ids[7:])
+        self.assertEqual(list(self.plan.entries("assertion", skip=10)), [])
+        self.assertEqual(list(self.plan.entries("missing")), [])
+
+    def test_parts_are_replayed_in_part_order_and_skip_spans_them(self):
+        second = self.write("jhi_user", [{'_id': i} for i in self.ids[5:]], part=1)
+        first = self.write("jhi_user", [{'_id': i} for i in self.ids[:5]], part=0)
+        self.plan.record("jhi_user", first, second)
+        self.assertEqual(self.plan.count("jhi_user"), 10)
+        self.assertEqual([e['_id'] for e in self.plan.entries("jhi_user", skip=3)], self.ids[3:])
+
+    def test_checkpoint_survives_reload(self):
+        self.plan.checkpoint("assertion", 4, self.ids[3], 3)
+        self.plan.checkpoint("assertion", 8, self.ids[7], 7)
+        reloaded = BackfillPlan(self.plan.directory)
+        self.assertEqual(reloaded.applied("assertion"), 8)
+        self.assertEqual(reloaded.last_id("assertion"), self.ids[7])
+        self.assertEqual(reloaded.modified("assertion"), 7)
+        self.assertEqual(reloaded.applied("orcid_record"), 0)
+        self.assertFalse(list(Path(self.plan.directory).glob("*.tmp")))
+
+    def test_manifest_values_survive_reload(self):
+        self.plan.set("complete", True)
+        self.plan.set("source", "SF1")
+        reloaded = BackfillPlan(self.plan.directory)
+        self.assertTrue(reloaded.get("complete"))
+        self.assertEqual(reloaded.get("source"), "SF1")
+        self.assertIsNone(reloaded.get("token_writes"))
+
+    def test_latest_ignores_directories_without_manifest(self):
+        self.plan.save()
+        (Path(self.base) / "test-plan_99999999_999999").mkdir()
+        self.assertEqual(BackfillPlan.latest(self.base, "test-plan").directory, self.plan.directory)
+        self.assertIsNone(BackfillPlan.latest(self.base, "other-plan"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Tests for utils/batch_sizer.py (no MongoDB needed).
+
+Usage:
+    python -m unittest discover -s tests
+"""
+
+import sys
+import unittest
+from pathlib import Path
+
+from bson import encode
+from pymongo import UpdateOne
+
+CURRENT_DIR = Path(__file__).resolve().parent
+UTILS_DIR = CURRENT_DIR.parent / "utils"
+
+if str(UTILS_DIR) not in sys.path:
+    sys.path.insert(0, str(UTILS_DIR))
+
+from batch_sizer import AdaptiveBatchSizer, SizedBatch, batch_bytes
+from raw_bulk import RawBatch, encode_update
+
+
+class BatchBytesTest(unittest.TestCase):
+
+    def test_sized_batch_counts_what_was_added(self):
+        query, update = {'_id': 1}, {'$set': {'admin': False}}
+        batch = SizedBatch()
+        batch.add(UpdateOne(query, update), query, update)
+        self.assertEqual(len(batch), 1)
+        self.assertEqual(batch_bytes(batch), len(encode(query)) + len(encode(update)))
+
+    def test_raw_statements_are_measured_exactly(self):
+        batch = RawBatch.updates()
+        batch.append(encode_update({'_id': 1}, {'$set': {'a': 1}}))
+        self.assertEqual(batch_bytes(batch), len(batch[0].raw))
+
+    def test_unknown_models_count_as_zero(self):
+        self.assertEqual(batch_bytes([UpdateOne({'_id': 1}, {'$set': {'a': 1}})]), 0)
+
+
+class AdaptiveBatchSizerTest(unittest.TestCase):
+
+    def test_grows_when_fast_and_small(self):
+        sizer = AdaptiveBatchSizer("test", initial=1000, target_latency_s=1.0)
+        sizer.record(1000, 100_000, 0.1)
+        self.assertEqual(sizer.size, 2000)  # bounded by MAX_STEP
+
+    def test_shrinks_when_slow(self):
+        sizer = AdaptiveBatchSizer("test", initial=1000, target_latency_s=1.0)
+        sizer.record(1000, 100_000, 1.6)
+        self.assertEqual(sizer.size, 625)
+
+    def test_payload_budget_caps_the_size(self):
+        sizer = AdaptiveBatchSizer("test", initial=1000, max_batch_bytes=1_000_000)
+        sizer.record(1000, 2_000_000, 0.01)
+        self.assertEqual(sizer.size, 500)
+
+    def test_stays_within_bounds(self):
+        slow = AdaptiveBatchSizer("test", initial=100, min_size=80, max_size=150)
+        slow.record(100, 1000, 100.0)
+        self.assertEqual(slow.size, 80)
+        fast = AdaptiveBatchSizer("test", initial=100, min_size=80, max_size=150)
+        fast.record(100, 1000, 0.001)
+        self.assertEqual(fast.size, 150)
+
+    def test_failed_write_is_not_recorded(self):
+        sizer = AdaptiveBatchSizer("test", initial=1000)
+        with self.assertRaises(RuntimeError):
+            with sizer.measure([]):
+                raise RuntimeError("write failed")
+        self.assertEqual(sizer.batches, 0)
+        self.assertEqual(sizer.size, 1000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Tests for chunk_values in utils/chunked_lookup.py (no MongoDB needed).
+
+Usage:
+    python -m unittest discover -s tests
+"""
+
+import sys
+import unittest
+from pathlib import Path
+
+from bson import encode
+
+CURRENT_DIR = Path(__file__).resolve().parent
+UTILS_DIR = CURRENT_DIR.parent / "utils"
+
+if str(UTILS_DIR) not in sys.path:
+    sys.path.insert(0, str(UTILS_DIR))
+
+from chunked_lookup import chunk_values
+
+
+class ChunkValuesTest(unittest.TestCase):
+
+    def test_every_chunk_encodes_under_the_limit(self):
+        values = [f"{n:018d}" for n in range(5000)]
+        chunks = list(chunk_values(values, max_bytes=4096))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual([value for chunk in chunks for value in chunk], values)
+        for chunk in chunks:
+            # A BSON array is encoded like a document keyed "0", "1", ...
+            self.assertLessEqual(len(encode({str(i): value for i, value in enumerate(chunk)})), 4096)
+
+    def test_oversized_value_gets_its_own_chunk(self):
+        chunks = list(chunk_values(["a", "x" * 100, "b"], max_bytes=50))
+        self.assertEqual(chunks, [["a"], ["x" * 100], ["b"]])
+
+    def test_empty(self):
+        self.assertEqual(list(chunk_values([])), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Tests for the namespace and document counting of utils/command_metrics.py.
+
+Usage:
+    python -m unittest discover -s tests
+"""
+
+import sys
+import unittest
+from pathlib import Path
+
+CURRENT_DIR = Path(__file__).resolve().parent
+UTILS_DIR = CURRENT_DIR.parent / "utils"
+
+if str(UTILS_DIR) not in sys.path:
+    sys.path.insert(0, str(UTILS_DIR))
+
+from command_metrics import _docs_in_reply, _namespace_of
+
+
+class NamespaceOfTest(unittest.TestCase):
+
+    def test_collection_commands(self):
+        self.assertEqual(_namespace_of('find', 'assertionservice', {'find': 'assertion'}),
+                         'assertionservice.assertion')
+        self.assertEqual(_namespace_of('update', 'userservice', {'update': 'jhi_user', 'updates': []}),
+                         'userservice.jhi_user')
+
+    def test_get_more_names_its_collection(self):
+        self.assertEqual(_namespace_of('getMore', 'assertionservice', {'getMore': 123, 'collection': 'orcid_record'}),
+                         'assertionservice.orcid_record')
+
+    def test_bulk_write_uses_ns_info(self):
+        command = {'bulkWrite': 1, 'nsInfo': [{'ns': 'a.x'}, {'ns': 'b.y'}]}
+        self.assertEqual(_namespace_of('bulkWrite', 'admin', command), 'a.x,b.y')
+        self.assertEqual(_namespace_of('bulkWrite', 'admin', {'bulkWrite': 1}), 'admin.-')
+
+    def test_database_commands(self):
+        self.assertEqual(_namespace_of('ping', 'admin', {'ping': 1}), 'admin.-')
+
+
+class DocsInReplyTest(unittest.TestCase):
+
+    def test_cursor_batches(self):
+        self.assertEqual(_docs_in_reply('find', {'cursor': {'firstBatch': [{}, {}]}}), 2)
+        self.assertEqual(_docs_in_reply('getMore', {'cursor': {'nextBatch': [{}]}}), 1)
+
+    def test_write_counts(self):
+        self.assertEqual(_docs_in_reply('update', {'n': 5, 'nModified': 3}), 3)
+        self.assertEqual(_docs_in_reply('insert', {'n': 4}), 4)
+        self.assertEqual(_docs_in_reply('distinct', {'values': ['a', 'b']}), 2)
+        self.assertEqual(_docs_in_reply('ping', {'ok': 1}), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
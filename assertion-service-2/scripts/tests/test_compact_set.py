@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Tests for utils/compact_set.py (no MongoDB needed).
+
+Each case runs with NumPy when it is installed and always without it.
+
+Usage:
+    python -m unittest discover -s tests
+"""
+
+import sys
+import unittest
+from pathlib import Path
+from unittest import mock
+
+CURRENT_DIR = Path(__file__).resolve().parent
+UTILS_DIR = CURRENT_DIR.parent / "utils"
+
+if str(UTILS_DIR) not in sys.path:
+    sys.path.insert(0, str(UTILS_DIR))
+
+import compact_set
+from compact_set import CompactSetMap, CompactStringSet
+
+
+class _BothSortPaths:
+    """Runs every test with and without NumPy (small runs to exercise the merge)."""
+
+    def run(self, result=None):
+        if compact_set.np is not None:
+            super().run(result)
+        with mock.patch.object(compact_set, "np", None), mock.patch.object(compact_set, "SORT_RUN_SIZE", 7):
+            return super().run(result)
+
+
+class CompactStringSetTest(_BothSortPaths, unittest.TestCase):
+
+    def test_membership_and_len(self):
+        values = [f"user{n}@example.org" for n in range(100)]
+        seen = CompactStringSet(values + values[:10])
+        self.assertEqual(len(seen), 100)
+        self.assertIn("user5@example.org", seen)
+        self.assertNotIn("user100@example.org", seen)
+        self.assertNotIn(5, seen)
+        self.assertEqual(sorted(seen), sorted(values))
+
+    def test_adds_after_a_lookup_are_merged(self):
+        seen = CompactStringSet(f"a{n}" for n in range(50))
+        self.assertIn("a1", seen)
+        for n in range(25, 120):
+            seen.add(f"a{n}")
+        self.assertEqual(len(seen), 120)
+        self.assertEqual(sorted(seen), sorted(f"a{n}" for n in range(120)))
+
+    def test_contains_many(self):
+        seen = CompactStringSet(["x", "y", "é"])
+        self.assertEqual(seen.contains_many(["y", "z", "é", "x"]), [True, False, True, True])
+
+    def test_hash_collisions_are_told_apart(self):
+        with mock.patch.object(compact_set, "hash64", lambda value: 42):
+            seen = CompactStringSet(["a", "b", "a", "c"])
+            self.assertEqual(len(seen), 3)
+            self.assertIn("b", seen)
+            self.assertNotIn("d", seen)
+            self.assertEqual(seen.contains_many(["c", "d"]), [True, False])
+
+    def test_empty(self):
+        seen = CompactStringSet()
+        self.assertFalse(seen)
+        self.assertEqual(len(seen), 0)
+        self.assertNotIn("a", seen)
+        self.assertEqual(list(seen), [])
+
+
+class CompactSetMapTest(_BothSortPaths, unittest.TestCase):
+
+    def setUp(self):
+        self.pairs = [(f"e{n % 40}@example.org", f"m{n % 3}") for n in range(200)]
+        self.expected = {}
+        for key, value in self.pairs:
+            self.expected.setdefault(key, set()).add(value)
+
+    def build(self) -> CompactSetMap:
+        needed = CompactSetMap()
+        for key, value in self.pairs:
+            needed.add(key, value)
+        return needed
+
+    def test_matches_a_dict_of_sets(self):
+        needed = self.build()
+        self.assertEqual(len(needed), len(self.expected))
+        self.assertEqual(dict(needed.items()), self.expected)
+        self.assertEqual(sorted(needed.keys()), sorted(self.expected))
+
+    def test_get_and_getitem(self):
+        needed = self.build()
+        self.assertEqual(needed["e0@example.org"], self.expected["e0@example.org"])
+        self.assertIsNone(needed.get("missing"))
+        self.assertEqual(needed.get("missing", set()), set())
+        with self.assertRaises(KeyError):
+            needed["missing"]
+
+    def test_values_added_after_a_lookup(self):
+        needed = self.build()
+        self.assertIn("e1@example.org", needed)
+        needed.add("e1@example.org", "m9")
+        needed.add("new@example.org", "m0")
+        self.assertEqual(needed["e1@example.org"], self.expected["e1@example.org"] | {"m9"})
+        self.assertEqual(needed["new@example.org"], {"m0"})
+
+    def test_hash_collisions_keep_values_apart(self):
+        with mock.patch.object(compact_set, "hash64", lambda value: 7):
+            needed = CompactSetMap()
+            needed.add("a", "m1")
+            needed.add("b", "m2")
+            needed.add("a", "m3")
+            self.assertEqual(needed["a"], {"m1", "m3"})
+            self.assertEqual(needed["b"], {"m2"})
+            self.assertEqual(len(needed), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
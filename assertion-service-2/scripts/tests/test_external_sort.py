@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Tests for utils/external_sort.py (no MongoDB needed).
+
+Usage:
+    python -m unittest discover -s tests
+"""
+
+import random
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+CURRENT_DIR = Path(__file__).resolve().parent
+UTILS_DIR = CURRENT_DIR.parent / "utils"
+
+if str(UTILS_DIR) not in sys.path:
+    sys.path.insert(0, str(UTILS_DIR))
+
+from external_sort import ExternalSorter, SortedSetMap, sorted_difference
+
+
+# Small enough that a few hundred strings spill several runs.
+TINY_BUDGET_MB = 0.002
+
+
+class ExternalSorterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.items = [f"user{n:05d}@example.org" for n in random.Random(7).sample(range(5000), 2000)]
+
+    def sorter(self, memory_budget_mb: float, **kwargs) -> ExternalSorter:
+        sorter = ExternalSorter("test", memory_budget_mb, temp_dir=self.temp_dir.name, **kwargs)
+        self.addCleanup(sorter.close)
+        return sorter
+
+    def test_sorts_in_memory_without_spilling(self):
+        sorter = self.sorter(64)
+        sorter.extend(self.items)
+        self.assertEqual(list(sorter), sorted(self.items))
+        self.assertEqual(sorter.stats.runs, 0)
+
+    def test_sorts_across_spilled_runs(self):
+        sorter = self.sorter(TINY_BUDGET_MB)
+        sorter.extend(self.items)
+        self.assertEqual(list(sorter), sorted(self.items))
+        self.assertGreater(sorter.stats.runs, 1)
+
+    def test_merges_more_runs_than_fan_in(self):
+        sorter = self.sorter(TINY_BUDGET_MB, fan_in=2)
+        sorter.extend(self.items)
+        self.assertEqual(list(sorter), sorted(self.items))
+
+    def test_unique_drops_repeats_within_and_across_runs(self):
+        for budget in (64, TINY_BUDGET_MB):
+            with self.subTest(budget=budget):
+                sorter = self.sorter(budget, unique=True)
+                sorter.extend(self.items + self.items[::3])
+                self.assertEqual(list(sorter), sorted(set(self.items)))
+
+    def test_tuples_come_back_as_tuples(self):
+        pairs = [(item, str(n % 3)) for n, item in enumerate(self.items)]
+        sorter = self.sorter(TINY_BUDGET_MB)
+        sorter.extend(pairs)
+        result = list(sorter)
+        self.assertEqual(result, sorted(pairs))
+        self.assertIsInstance(result[0], tuple)
+
+    def test_can_iterate_again_after_adding(self):
+        sorter = self.sorter(TINY_BUDGET_MB)
+        sorter.extend(self.items[:1000])
+        self.assertEqual(list(sorter), sorted(self.items[:1000]))
+        sorter.extend(self.items[1000:])
+        self.assertEqual(list(sorter), sorted(self.items))
+
+    def test_close_removes_run_files(self):
+        sorter = self.sorter(TINY_BUDGET_MB)
+        sorter.extend(self.items)
+        list(sorter)
+        self.assertTrue(any(Path(self.temp_dir.name).iterdir()))
+        sorter.close()
+        self.assertFalse(any(Path(self.temp_dir.name).iterdir()))
+
+
+class SortedDifferenceTest(unittest.TestCase):
+
+    def test_items_missing_from_right(self):
+        left = ["a", "b", "c", "e", "g"]
+        right = ["b", "d", "e", "f"]
+        self.assertEqual(list(sorted_difference(left, right)), ["a", "c", "g"])
+
+    def test_empty_sides(self):
+        self.assertEqual(list(sorted_difference([], ["a"])), [])
+        self.assertEqual(list(sorted_difference(["a", "b"], [])), ["a", "b"])
+
+    def test_right_past_the_end_of_left(self):
+        self.assertEqual(list(sorted_difference(["a", "b"], ["a", "c", "d"])), ["b"])
+
+
+class SortedSetMapTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.pairs = [(f"e{n % 300:03d}@example.org", f"m{n % 4}") for n in range(1200)]
+        self.expected = {}
+        for key, value in self.pairs:
+            self.expected.setdefault(key, set()).add(value)
+
+    def set_map(self, memory_budget_mb: float) -> SortedSetMap:
+        set_map = SortedSetMap("test", memory_budget_mb, temp_dir=self.temp_dir.name)
+        self.addCleanup(set_map.close)
+        for key, value in self.pairs:
+            set_map.add(key, value)
+        return set_map
+
+    def test_groups_in_key_order(self):
+        for budget in (64, TINY_BUDGET_MB):
+            with self.subTest(budget=budget):
+                set_map = self.set_map(budget)
+                self.assertEqual(list(set_map.groups()), sorted(self.expected.items()))
+                self.assertEqual(len(set_map), len(self.expected))
+
+    def test_chunks_cover_every_key_once(self):
+        set_map = self.set_map(TINY_BUDGET_MB)
+        chunks = list(set_map.chunks(64))
+        self.assertTrue(all(len(chunk) <= 64 for chunk in chunks))
+        merged = {}
+        for chunk in chunks:
+            self.assertFalse(merged.keys() & chunk.keys())
+            merged.update(chunk)
+        self.assertEqual(merged, self.expected)
+
+    def test_empty_map_is_falsy(self):
+        set_map = SortedSetMap("test", 64, temp_dir=self.temp_dir.name)
+        self.addCleanup(set_map.close)
+        self.assertFalse(set_map)
+        self.assertEqual(list(set_map.chunks(10)), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
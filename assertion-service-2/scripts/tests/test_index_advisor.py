@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Tests for the index suggestions of index_advisor.py (no MongoDB needed).
+
+Usage:
+    python -m unittest discover -s tests
+"""
+
+import importlib
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+CURRENT_DIR = Path(__file__).resolve().parent
+SCRIPTS_DIR = CURRENT_DIR.parent
+
+if str(SCRIPTS_DIR) not in sys.path:
+    sys.path.insert(0, str(SCRIPTS_DIR))
+
+index_advisor = None
+
+
+def setUpModule():
+    # The advisor imports every query-fix script, and each opens its log under logs/.
+    global index_advisor
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.chdir(temp_dir)
+        try:
+            index_advisor = importlib.import_module("index_advisor")
+        finally:
+            os.chdir(cwd)
+
+
+class SuggestIndexTest(unittest.TestCase):
+
+    def test_equality_then_sort_then_range(self):
+        query = {'created': {'$gte': 1}, 'email': 'a@example.org', 'status': {'$in': ['A', 'B']}}
+        self.assertEqual(
+            index_advisor.suggest_index(query, sort=[('modified', -1)]),
+            [('email', 1), ('status', 1), ('modified', -1), ('created', 1)],
+        )
+
+    def test_negations_go_last(self):
+        query = {'put_code': {'$exists': False}, 'added_to_orcid': {'$ne': None}, 'orcid_id': {'$nin': [None]}}
+        self.assertEqual(
+            index_advisor.suggest_index(query),
+            [('added_to_orcid', 1), ('put_code', 1), ('orcid_id', 1)],
+        )
+
+    def test_unindexable_parts_are_left_out(self):
+        query = {'$expr': {'$lt': [{'$strLenCP': '$salesforce_id'}, 18]}, 'tokens.0': {'$exists': True}}
+        self.assertIsNone(index_advisor.suggest_index(query))
+        self.assertEqual(index_advisor.suggest_index({'$or': [{'a': 1}], 'b': 1}), [('b', 1)])
+
+    def test_id_alone_is_not_suggested(self):
+        self.assertIsNone(index_advisor.suggest_index({'_id': {'$in': [1, 2]}}))
+
+    def test_sort_field_already_in_the_filter_is_not_repeated(self):
+        self.assertEqual(index_advisor.suggest_index({'email': 'a'}, sort=[('email', 1)]), [('email', 1)])
+
+    def test_embedded_document_is_an_equality(self):
+        self.assertEqual(index_advisor.suggest_index({'profile': {'name': 'A'}}), [('profile', 1)])
+
+
+if __name__ == "__main__":
+    unittest.main()
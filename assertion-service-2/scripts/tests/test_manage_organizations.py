@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Tests for the --mapping-file validation and the batch merge update expressions
+of query-fixes/manage_organizations.py.
+
+Usage:
+    python -m unittest discover -s tests
+"""
+
+import importlib
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from bson import ObjectId
+
+CURRENT_DIR = Path(__file__).resolve().parent
+UTILS_DIR = CURRENT_DIR.parent / "utils"
+QUERY_FIXES_DIR = CURRENT_DIR.parent / "query-fixes"
+
+for path in (UTILS_DIR, QUERY_FIXES_DIR):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+manage_organizations = None
+
+
+def setUpModule():
+    # The script opens logs/manage-organizations.log on import; keep it out of the tree.
+    global manage_organizations
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.chdir(temp_dir)
+        try:
+            manage_organizations = importlib.import_module("manage_organizations")
+        finally:
+            os.chdir(cwd)
+
+
+class ReadMappingFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.ids = [str(ObjectId()) for _ in range(4)]
+
+    def read(self, text: str):
+        path = Path(self.temp_dir.name) / "merges.csv"
+        path.write_text(text)
+        return manage_organizations.BatchOrganizationMerge.read_mapping_file(str(path))
+
+    def assert_rejected(self, text: str, message: str):
+        with self.assertRaises(ValueError) as raised:
+            self.read(text)
+        self.assertIn(message, str(raised.exception))
+
+    def test_reads_pairs_in_order(self):
+        a, b, c, d = self.ids
+        pairs = self.read(f"target,source\n{a},{b}\n\n{a}, {c}\n{d},{ObjectId()}\n")
+        self.assertEqual(pairs[:2], [(a, b), (a, c)])
+        self.assertEqual(len(pairs), 3)
+
+    def test_header_may_be_padded_and_reordered(self):
+        a, b = self.ids[:2]
+        self.assertEqual(self.read(f" source , target\n{b},{a}\n"), [(a, b)])
+
+    def test_missing_header(self):
+        a, b = self.ids[:2]
+        self.assert_rejected(f"{a},{b}\n", "needs a 'target,source' header")
+
+    def test_invalid_member_id(self):
+        a = self.ids[0]
+        self.assert_rejected(f"target,source\n{a},not-an-id\n", "Line 2: source and target must be valid")
+
+    def test_missing_source(self):
+        a = self.ids[0]
+        self.assert_rejected(f"target,source\n{a},\n", "Line 2")
+
+    def test_source_equals_target(self):
+        a = self.ids[0]
+        self.assert_rejected(f"target,source\n{a},{a}\n", "cannot be the same")
+
+    def test_source_listed_twice(self):
+        a, b, c = self.ids[:3]
+        self.assert_rejected(f"target,source\n{a},{c}\n{b},{c}\n", "Line 3: source")
+
+    def test_chained_merge(self):
+        a, b, c = self.ids[:3]
+        self.assert_rejected(f"target,source\n{a},{b}\n{b},{c}\n", f"both a source and a target in one batch: {b}")
+
+    def test_no_pairs(self):
+        self.assert_rejected("target,source\n\n", "has no target/source pairs")
+
+    def test_unreadable_file(self):
+        with self.assertRaises(ValueError) as raised:
+            manage_organizations.BatchOrganizationMerge.read_mapping_file(
+                str(Path(self.temp_dir.name) / "missing.csv")
+            )
+        self.assertIn("Cannot read mapping file", str(raised.exception))
+
+
+class TargetOfTest(unittest.TestCase):
+
+    def setUp(self):
+        self.target, self.source, self.bare = (str(ObjectId()) for _ in range(3))
+        connection = mock.MagicMock()
+        self.merge = manage_organizations.BatchOrganizationMerge(
+            connection, connection, connection, [(self.target, self.source), (self.bare, str(ObjectId()))], merge=False)
+        MemberRef = manage_organizations.MemberRef
+        self.merge.members = {
+            self.target: MemberRef.from_doc({'_id': ObjectId(self.target), 'client_name': '$Acme'}),
+            self.bare: MemberRef.from_doc({'_id': ObjectId(self.bare)}),
+        }
+
+    def test_ids_and_values_are_literals(self):
+        expression = self.merge._target_of('$member_id', 'client_name', '$member_name')
+        self.assertEqual(expression, {'$switch': {
+            'branches': [{'case': {'$eq': ['$member_id', {'$literal': self.source}]},
+                          'then': {'$literal': '$Acme'}}],
+            'default': '$member_name',
+        }})
+
+    def test_no_target_with_the_field_keeps_the_current_value(self):
+        self.assertEqual(self.merge._target_of('$member_id', 'salesforce_id', '$salesforce_id'), '$salesforce_id')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Tests for utils/partitioning.py against an in-memory stand-in collection.
+
+Usage:
+    python -m unittest discover -s tests
+"""
+
+import random
+import sys
+import unittest
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from unittest import mock
+
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+
+CURRENT_DIR = Path(__file__).resolve().parent
+UTILS_DIR = CURRENT_DIR.parent / "utils"
+
+if str(UTILS_DIR) not in sys.path:
+    sys.path.insert(0, str(UTILS_DIR))
+
+import partitioning
+from partitioning import id_ranges, range_filter
+
+
+class FakeCollection:
+    """Just the calls id_ranges makes: the estimate, the $sample and the min/max _id probes."""
+
+    def __init__(self, ids: List[Any], estimated: Optional[int] = None, sample_error: bool = False):
+        self.name = "fake"
+        self.ids = ids
+        self.estimated = len(ids) if estimated is None else estimated
+        self.sample_error = sample_error
+        self.probes: List[Any] = []
+
+    def estimated_document_count(self) -> int:
+        return self.estimated
+
+    def aggregate(self, pipeline: List[Dict[str, Any]]):
+        if self.sample_error:
+            raise OperationFailure("$sample not allowed")
+        size = pipeline[0]['$sample']['size']
+        return [{'_id': value} for value in random.Random(1).sample(self.ids, min(size, len(self.ids)))]
+
+    def find_one(self, query: Dict[str, Any], projection: Dict[str, int], sort: List[Tuple[str, int]]):
+        self.probes.append(sort)
+        (_, direction), = sort
+        if not self.ids:
+            return None
+        ordered = sorted(self.ids, key=bson_order)
+        return {'_id': ordered[0] if direction == 1 else ordered[-1]}
+
+
+# Rank of each type in BSON comparison order.
+_TYPE_ORDER = {'number': 1, 'string': 2, 'binData': 5, 'objectId': 6, 'date': 8}
+
+
+def bson_order(value: Any) -> Tuple[int, Any]:
+    return _TYPE_ORDER[partitioning._bson_type(value)], value
+
+
+def matches(value: Any, lower: Any, upper: Any) -> bool:
+    return (lower is None or value >= lower) and (upper is None or value < upper)
+
+
+class RangeFilterTest(unittest.TestCase):
+
+    def test_bounds(self):
+        self.assertEqual(range_filter(None, None), {})
+        self.assertEqual(range_filter(1, None), {'_id': {'$gte': 1}})
+        self.assertEqual(range_filter(None, 5), {'_id': {'$lt': 5}})
+        self.assertEqual(range_filter(1, 5), {'_id': {'$gte': 1, '$lt': 5}})
+
+
+class IdRangesTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(partitioning, "MIN_DOCS_PER_PARTITION", 10)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assert_partition(self, ids: List[Any], ranges):
+        for value in ids:
+            owners = [r for r in ranges if matches(value, *r)]
+            self.assertEqual(len(owners), 1, f"{value!r} is in {len(owners)} ranges")
+
+    def test_object_ids_split_into_contiguous_ranges(self):
+        ids = sorted(ObjectId() for _ in range(2000))
+        ranges = id_ranges(FakeCollection(ids), 4)
+        self.assertEqual(len(ranges), 4)
+        self.assertIsNone(ranges[0][0])
+        self.assertIsNone(ranges[-1][1])
+        for (_, upper), (lower, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(upper, lower)
+        self.assert_partition(ids, ranges)
+
+    def test_string_ids(self):
+        ids = [f"id-{n:06d}" for n in range(1000)]
+        ranges = id_ranges(FakeCollection(ids), 3)
+        self.assertEqual(len(ranges), 3)
+        self.assert_partition(ids, ranges)
+
+    def test_one_partition_or_small_collection_is_not_split(self):
+        ids = list(range(1000))
+        self.assertEqual(id_ranges(FakeCollection(ids), 1), [(None, None)])
+        self.assertEqual(id_ranges(FakeCollection(ids[:15]), 8), [(None, None)])
+
+    def test_partitions_capped_by_collection_size(self):
+        ids = list(range(25))
+        self.assertEqual(len(id_ranges(FakeCollection(ids), 8)), 2)
+
+    def test_mixed_id_types_in_the_sample_are_not_split(self):
+        ids = [ObjectId() for _ in range(500)] + [f"s{n}" for n in range(500)]
+        with self.assertLogs(partitioning.logger, "WARNING"):
+            self.assertEqual(id_ranges(FakeCollection(ids), 4), [(None, None)])
+
+    def test_mixed_id_types_outside_the_sample_are_not_split(self):
+        ids = list(range(1000))
+        for stray in ("stray", ObjectId()):
+            with self.subTest(stray=stray):
+                collection = FakeCollection(ids + [stray])  # never sampled, but the max of the _id index
+                collection.aggregate = lambda pipeline: [{'_id': value} for value in ids]
+                with self.assertLogs(partitioning.logger, "WARNING") as logs:
+                    self.assertEqual(id_ranges(collection, 4), [(None, None)])
+                self.assertIn(repr(stray), logs.output[0])
+
+    def test_ints_and_floats_are_one_type(self):
+        collection = FakeCollection(list(range(1000)) + [-1.5, 999.5])
+        self.assertEqual(len(id_ranges(collection, 4)), 4)
+
+    def test_type_check_reads_only_the_ends_of_the_id_index(self):
+        collection = FakeCollection([ObjectId() for _ in range(1000)])
+        id_ranges(collection, 4)
+        self.assertEqual(collection.probes, [[('_id', 1)], [('_id', -1)]])
+
+    def test_sample_failure_falls_back_to_one_range(self):
+        with self.assertLogs(partitioning.logger, "WARNING"):
+            self.assertEqual(id_ranges(FakeCollection(list(range(1000)), sample_error=True), 4), [(None, None)])
+
+
+if __name__ == "__main__":
+    unittest.main()
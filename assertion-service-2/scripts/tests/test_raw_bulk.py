@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Tests for the statement encoding and splitting of utils/raw_bulk.py (no MongoDB needed).
+
+Usage:
+    python -m unittest discover -s tests
+"""
+
+import sys
+import unittest
+from pathlib import Path
+
+from bson import decode, encode
+
+CURRENT_DIR = Path(__file__).resolve().parent
+UTILS_DIR = CURRENT_DIR.parent / "utils"
+
+if str(UTILS_DIR) not in sys.path:
+    sys.path.insert(0, str(UTILS_DIR))
+
+from raw_bulk import RawBatch, encode_insert, encode_update
+
+
+class RawBatchTest(unittest.TestCase):
+
+    def test_chunks_fit_as_array_elements(self):
+        batch = RawBatch.updates()
+        for n in range(3000):
+            batch.append(encode_update({'_id': n}, {'$set': {'member_id': 'm'}}))
+        max_bytes = 20_000
+        chunks = list(batch.chunks(max_bytes))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(sum(len(chunk) for chunk in chunks), len(batch))
+        for chunk in chunks:
+            # The encoded array minus its own length prefix and terminator.
+            self.assertLessEqual(len(encode({'updates': chunk})) - len(encode({'updates': []})), max_bytes)
+
+    def test_statements(self):
+        statement = encode_update({'_id': 1}, {'$set': {'a': 1}}, array_filters=[{'t.a': 1}], upsert=True)
+        self.assertEqual(decode(statement.raw), {
+            'q': {'_id': 1}, 'u': {'$set': {'a': 1}}, 'multi': False,
+            'upsert': True, 'arrayFilters': [{'t.a': 1}],
+        })
+        self.assertIn('_id', encode_insert({'email': 'a@example.org'}))
+        self.assertEqual(RawBatch.inserts().documents_field, 'documents')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Tests for utils/raw_fields.py (no MongoDB needed).
+
+Usage:
+    python -m unittest discover -s tests
+"""
+
+import sys
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+from bson import Binary, Decimal128, Int64, ObjectId, Regex, decode, encode
+from bson.raw_bson import RawBSONDocument
+
+CURRENT_DIR = Path(__file__).resolve().parent
+UTILS_DIR = CURRENT_DIR.parent / "utils"
+
+if str(UTILS_DIR) not in sys.path:
+    sys.path.insert(0, str(UTILS_DIR))
+
+from raw_fields import RawFields, to_dict
+
+
+class RawFieldsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.doc = {
+            '_id': ObjectId(),
+            'email': 'a@example.org',
+            'admin': True,
+            'count': 3,
+            'big': Int64(1 << 40),
+            'ratio': 0.5,
+            'created': datetime(2024, 1, 2, 3, 4, 5),
+            'tokens': [{'salesforce_id': 'SF1', 'member_id': None}],
+            'profile': {'name': 'A'},
+            'blob': Binary(b'\x00\x01'),
+            'price': Decimal128('1.10'),
+            'pattern': Regex('^a', 'i'),
+            'missing_value': None,
+        }
+        self.raw = RawBSONDocument(encode(self.doc))
+
+    def test_reads_every_type_like_decode(self):
+        decoded = decode(self.raw.raw)
+        names = tuple(name for name in self.doc if name != 'pattern')
+        self.assertEqual(RawFields(*names)(self.raw), tuple(decoded[name] for name in names))
+        (pattern,) = RawFields('pattern')(self.raw)
+        self.assertEqual((pattern.pattern, pattern.flags), (decoded['pattern'].pattern, decoded['pattern'].flags))
+
+    def test_requested_order_and_default(self):
+        accessor = RawFields('count', 'absent', 'email', default='-')
+        self.assertEqual(accessor(self.raw), (3, '-', 'a@example.org'))
+
+    def test_dict_documents_use_get(self):
+        accessor = RawFields('email', 'absent')
+        self.assertEqual(accessor(self.doc), accessor(self.raw))
+
+    def test_with_sizes(self):
+        values, sizes = RawFields('email', 'tokens').with_sizes(self.raw)
+        self.assertEqual(values, (self.doc['email'], self.doc['tokens']))
+        self.assertEqual(sizes['email'], len(encode({'email': self.doc['email']})) - 5)
+        self.assertEqual(sizes['tokens'], len(encode({'tokens': self.doc['tokens']})) - 5)
+        self.assertEqual(RawFields('email').with_sizes(self.doc), (('a@example.org',), {}))
+
+    def test_to_dict(self):
+        self.assertEqual(to_dict(self.raw)['tokens'], self.doc['tokens'])
+        self.assertEqual(to_dict(self.doc), self.doc)
+
+
+if __name__ == "__main__":
+    unittest.main()
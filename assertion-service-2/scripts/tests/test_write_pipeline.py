@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Tests for the ordering, error and abort handling of utils/write_pipeline.py.
+
+Usage:
+    python -m unittest discover -s tests
+"""
+
+import sys
+import threading
+import time
+import unittest
+from pathlib import Path
+from typing import Any, List, Tuple
+
+CURRENT_DIR = Path(__file__).resolve().parent
+UTILS_DIR = CURRENT_DIR.parent / "utils"
+
+if str(UTILS_DIR) not in sys.path:
+    sys.path.insert(0, str(UTILS_DIR))
+
+from write_pipeline import BulkWritePipeline, PipelineClosedError
+
+
+# Upper bound on any wait in these tests, so a regression fails instead of hanging.
+TIMEOUT_S = 5
+
+
+class BulkWritePipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.acks: List[Tuple[Any, int]] = []
+
+    def on_ack(self, context: Any, written: int):
+        self.acks.append((context, written))
+
+    def test_total_and_acks_in_submission_order(self):
+        # Batch 0 is held back until batch 1 has been written by the other writer.
+        second_written = threading.Event()
+
+        def write(batch):
+            if batch[0] == 0:
+                self.assertTrue(second_written.wait(TIMEOUT_S))
+            elif batch[0] == 1:
+                second_written.set()
+            return len(batch)
+
+        with BulkWritePipeline(write, workers=2, on_ack=self.on_ack) as pipeline:
+            pipeline.submit([0, 0], "first")
+            pipeline.submit([1], "second")
+            pipeline.submit([2, 2, 2], "third")
+        self.assertEqual(pipeline.total, 6)
+        self.assertEqual(self.acks, [("first", 2), ("second", 1), ("third", 3)])
+
+    def test_empty_batches_are_skipped(self):
+        written = []
+        with BulkWritePipeline(lambda batch: written.append(batch) or len(batch), on_ack=self.on_ack) as pipeline:
+            pipeline.submit([], "empty")
+            pipeline.submit([1], "one")
+        self.assertEqual(written, [[1]])
+        self.assertEqual(self.acks, [("one", 1)])
+
+    def test_write_error_is_raised_and_later_batches_are_not_acknowledged(self):
+        # Batch 1 succeeds before batch 0 fails; its ack must not overtake the failure.
+        second_written = threading.Event()
+
+        def write(batch):
+            if batch[0] == 0:
+                self.assertTrue(second_written.wait(TIMEOUT_S))
+                raise ValueError("write failed")
+            second_written.set()
+            return len(batch)
+
+        with self.assertRaisesRegex(ValueError, "write failed"):
+            with BulkWritePipeline(write, workers=2, on_ack=self.on_ack) as pipeline:
+                pipeline.submit([0], "first")
+                pipeline.submit([1], "second")
+        self.assertEqual(self.acks, [])
+
+    def test_acks_before_the_failure_are_kept(self):
+        def write(batch):
+            if batch[0] == 2:
+                raise ValueError("write failed")
+            return len(batch)
+
+        with self.assertRaises(ValueError):
+            with BulkWritePipeline(write, workers=1, on_ack=self.on_ack) as pipeline:
+                for n in range(4):
+                    pipeline.submit([n], n)
+        self.assertEqual(self.acks, [(0, 1), (1, 1)])
+
+    def test_submit_raises_once_a_write_failed(self):
+        failed = threading.Event()
+
+        def write(batch):
+            failed.set()
+            raise ValueError("write failed")
+
+        pipeline = BulkWritePipeline(write, workers=1)
+        pipeline.submit([1])
+        self.assertTrue(failed.wait(TIMEOUT_S))
+        with self.assertRaises(ValueError):
+            # The error is recorded just after write() raises; retry until it is visible.
+            deadline = time.monotonic() + TIMEOUT_S
+            while time.monotonic() < deadline:
+                pipeline.submit([2])
+                time.sleep(0.005)
+        pipeline.abort()
+
+    def test_error_in_the_producer_aborts_queued_batches(self):
+        release = threading.Event()
+        written = []
+
+        def write(batch):
+            self.assertTrue(release.wait(TIMEOUT_S))
+            written.append(batch[0])
+            return 1
+
+        with self.assertRaisesRegex(KeyError, "producer"):
+            with BulkWritePipeline(write, workers=1, max_pending=4, on_ack=self.on_ack) as pipeline:
+                for n in range(4):
+                    pipeline.submit([n], n)
+                release.set()
+                raise KeyError("producer")
+        # Only the batch already being written when the producer failed may go through.
+        self.assertLessEqual(len(written), 1)
+        self.assertEqual(self.acks, [(n, 1) for n in written])
+
+    def test_ack_callback_error_is_raised(self):
+        def on_ack(context, written):
+            raise RuntimeError("checkpoint failed")
+
+        with self.assertRaisesRegex(RuntimeError, "checkpoint failed"):
+            with BulkWritePipeline(len, on_ack=on_ack) as pipeline:
+                pipeline.submit([1])
+
+    def test_submit_after_close(self):
+        pipeline = BulkWritePipeline(len)
+        self.assertEqual(pipeline.close(), 0)
+        with self.assertRaises(PipelineClosedError):
+            pipeline.submit([1])
+
+    def test_full_queue_blocks_the_producer(self):
+        release = threading.Event()
+        pipeline = BulkWritePipeline(lambda batch: release.wait(TIMEOUT_S) and 1, workers=1, max_pending=1)
+        pipeline.submit([0])  # taken by the writer, which then blocks
+        pipeline.submit([1])  # fills the queue (possibly before the writer took batch 0)
+        submitted = threading.Event()
+
+        def produce():
+            pipeline.submit([2])
+            pipeline.submit([3])
+            submitted.set()
+
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+        self.assertFalse(submitted.wait(0.3))
+        release.set()
+        self.assertTrue(submitted.wait(TIMEOUT_S))
+        self.assertEqual(pipeline.close(), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
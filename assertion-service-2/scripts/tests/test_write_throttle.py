@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Tests for the rate cap and lag backoff of utils/write_throttle.py and the
+throttle settings of utils/config.py, on a fake clock.
+
+Usage:
+    python -m unittest discover -s tests
+"""
+
+import os
+import sys
+import unittest
+from pathlib import Path
+from unittest import mock
+
+CURRENT_DIR = Path(__file__).resolve().parent
+UTILS_DIR = CURRENT_DIR.parent / "utils"
+
+if str(UTILS_DIR) not in sys.path:
+    sys.path.insert(0, str(UTILS_DIR))
+
+import config
+import write_throttle
+from write_throttle import MIN_OPS_PER_SECOND, TokenBucket, WriteThrottle
+
+
+class FakeClock:
+    """Stands in for the ``time`` module; sleeping just advances the clock."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += seconds
+        self.slept += seconds
+
+
+class FakeClockTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(write_throttle, "time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class TokenBucketTest(FakeClockTestCase):
+
+    def test_no_rate_never_waits(self):
+        bucket = TokenBucket(None)
+        self.assertEqual(bucket.acquire(10 ** 6), 0.0)
+        self.assertEqual(self.clock.slept, 0.0)
+
+    def test_deficit_is_slept_off(self):
+        bucket = TokenBucket(100)
+        self.assertEqual(bucket.acquire(100), 0.0)  # starts with one second's worth
+        self.assertAlmostEqual(bucket.acquire(50), 0.5)
+        self.assertAlmostEqual(self.clock.slept, 0.5)
+
+    def test_refill_is_capped_at_capacity(self):
+        bucket = TokenBucket(100, capacity=10)
+        bucket.acquire(10)
+        self.clock.now += 60
+        self.assertEqual(bucket.acquire(10), 0.0)
+        self.assertAlmostEqual(bucket.acquire(10), 0.1)
+
+    def test_set_rate(self):
+        bucket = TokenBucket(100)
+        bucket.acquire(100)
+        bucket.set_rate(10)
+        self.assertAlmostEqual(bucket.acquire(5), 0.5)
+        bucket.set_rate(None)
+        self.assertEqual(bucket.acquire(10 ** 6), 0.0)
+
+
+class WriteThrottleTest(FakeClockTestCase):
+
+    def throttle(self, ops_per_second=None, max_lag_s=None, lags=()):
+        throttle = WriteThrottle(mock.MagicMock(), ops_per_second, max_lag_s, poll_interval_s=5)
+        readings = iter(lags)
+        throttle.monitor._poll = lambda: next(readings)
+        return throttle
+
+    def test_uncapped_without_lag_watching(self):
+        throttle = self.throttle()
+        throttle.wait(10 ** 6)
+        self.assertEqual(self.clock.slept, 0.0)
+        self.assertFalse(throttle.monitor.enabled)
+        self.assertEqual(throttle.slept_s, 0.0)
+
+    def test_rate_cap(self):
+        throttle = self.throttle(ops_per_second=100)
+        throttle.wait(100)
+        throttle.wait(300)
+        self.assertAlmostEqual(self.clock.slept, 3.0)
+        self.assertAlmostEqual(throttle.slept_s, 3.0)
+
+    def test_long_wait_is_logged_and_paced_in_slices(self):
+        throttle = self.throttle(ops_per_second=10)
+        with mock.patch.object(throttle.bucket, "acquire", wraps=throttle.bucket.acquire) as acquire:
+            with self.assertLogs(write_throttle.logger, "WARNING") as logs:
+                throttle.wait(1010)
+        self.assertIn("pacing 1010 ops at 10 ops/s", logs.output[0])
+        # One poll interval's worth (10 ops/s * 5s) per slice.
+        self.assertEqual(acquire.call_count, 21)
+        self.assertAlmostEqual(self.clock.slept, 100.0)
+
+    def test_lag_backs_off_and_recovers(self):
+        throttle = self.throttle(ops_per_second=200, max_lag_s=10, lags=[30.0, 30.0, 1.0])
+        with self.assertLogs(write_throttle.logger, "WARNING"):
+            throttle.wait(1)
+        self.assertEqual(throttle.bucket.rate, 100)
+        self.clock.now += 5
+        with self.assertLogs(write_throttle.logger, "WARNING"):
+            throttle.wait(1)
+        self.assertEqual(throttle.bucket.rate, MIN_OPS_PER_SECOND)
+        self.assertEqual(throttle.backoffs, 2)
+        self.assertEqual(throttle.max_lag_seen, 30.0)
+        self.clock.now += 5
+        throttle.wait(1)
+        self.assertEqual(throttle.bucket.rate, MIN_OPS_PER_SECOND * 1.25)
+
+    def test_stale_reading_is_not_applied_twice(self):
+        throttle = self.throttle(ops_per_second=200, max_lag_s=10, lags=[30.0])
+        with self.assertLogs(write_throttle.logger, "WARNING"):
+            throttle.wait(1)
+        throttle.wait(1)  # within the poll interval: same reading, no second backoff
+        self.assertEqual(throttle.backoffs, 1)
+        self.assertEqual(throttle.bucket.rate, 100)
+
+
+class WriteThrottleSettingsTest(unittest.TestCase):
+
+    def settings(self, **env):
+        with mock.patch.dict(os.environ, env):
+            return config.get_write_throttle_settings()
+
+    def test_defaults(self):
+        keys = ('MONGO_WRITE_OPS_PER_SECOND', 'MONGO_MAX_REPLICATION_LAG_S', 'MONGO_LAG_POLL_S')
+        with mock.patch.dict(os.environ):
+            for key in keys:
+                os.environ.pop(key, None)
+            self.assertEqual(config.get_write_throttle_settings(),
+                             {'ops_per_second': 0.0, 'max_lag_s': 0.0, 'poll_interval_s': 5.0})
+
+    def test_values(self):
+        settings = self.settings(MONGO_WRITE_OPS_PER_SECOND='2500', MONGO_MAX_REPLICATION_LAG_S='7.5',
+                                 MONGO_LAG_POLL_S='2')
+        self.assertEqual(settings, {'ops_per_second': 2500.0, 'max_lag_s': 7.5, 'poll_interval_s': 2.0})
+
+    def test_invalid_values_fall_back_to_the_default(self):
+        for value in ('fast', '-100', 'nan', 'inf'):
+            with self.subTest(value=value):
+                with self.assertLogs(config.logger, "ERROR") as logs:
+                    settings = self.settings(MONGO_WRITE_OPS_PER_SECOND=value, MONGO_LAG_POLL_S='x')
+                self.assertEqual(settings['ops_per_second'], 0.0)
+                self.assertEqual(settings['poll_interval_s'], 5.0)
+                self.assertIn("Invalid MONGO_WRITE_OPS_PER_SECOND", logs.output[0])
+                self.assertEqual(len(logs.output), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+On-disk backfill plans for ORCID scripts.
+
+A plan is a directory holding one BSON file per collection.  Each file is a
+plain sequence of BSON documents (one per change), so it can be streamed back
+with constant memory and inspected with `bsondump`.  The planning pass writes
+it once; the apply and verify phases replay it instead of rescanning the
+collection.
+
+Usage:
+    plan = BackfillPlan.create("plans", "backfill-member-id")
+    with plan.writer("assertion") as writer:
+        writer.write({"_id": doc_id, "old": None, "new": member_id})
+    for entry in plan.entries("assertion", skip=plan.applied("assertion")):
+        ...
+        plan.checkpoint("assertion", applied, last_id, modified)
+
+Checkpoints live next to the plan in checkpoint.json and are rewritten
+atomically after every acknowledged batch, so an interrupted apply phase can
+be resumed from the last acknowledged entry with ``BackfillPlan.latest()``.
+"""
+
+import json
+import logging
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from bson import decode_file_iter, encode, json_util
+
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+CHECKPOINT_FILE = "checkpoint.json"
+
+
+class PlanWriter:
+    """Append-only writer for one collection's plan file."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.entries = 0
+        self.bytes = 0
+        self._file = open(path, "wb")
+
+    def write(self, entry: Dict[str, Any]):
+        data = encode(entry)
+        self._file.write(data)
+        self.entries += 1
+        self.bytes += len(data)
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class BackfillPlan:
+    """A directory of per-collection BSON change files plus a JSON manifest."""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.manifest: Dict[str, Any] = {"collections": {}}
+        self.checkpoints: Dict[str, Dict[str, Any]] = {}
+        manifest_path = self.directory / MANIFEST_FILE
+        if manifest_path.exists():
+            self.manifest = json.loads(manifest_path.read_text())
+        checkpoint_path = self.directory / CHECKPOINT_FILE
+        if checkpoint_path.exists():
+            self.checkpoints = json_util.loads(checkpoint_path.read_text())
+
+    @classmethod
+    def create(cls, base_dir: str, name: str) -> "BackfillPlan":
+        """Create a new, empty, timestamped plan directory under *base_dir*."""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        directory = Path(base_dir) / f"{name}_{timestamp}"
+        directory.mkdir(parents=True, exist_ok=False)
+        plan = cls(directory)
+        plan.manifest["created"] = datetime.now().isoformat()
+        return plan
+
+    @classmethod
+    def latest(cls, base_dir: str, name: str) -> Optional["BackfillPlan"]:
+        """Return the most recently created plan called *name*, if any."""
+        candidates = sorted(
+            p for p in Path(base_dir).glob(f"{name}_*")
+            if (p / MANIFEST_FILE).exists()
+        )
+        return cls(candidates[-1]) if candidates else None
+
+    def _path(self, label: str, part: Optional[int] = None) -> Path:
+        if part is None:
+            return self.directory / f"{label}.bson"
+        return self.directory / f"{label}.part{part:03d}.bson"
+
+    def _paths(self, label: str) -> List[Path]:
+        """Files holding *label*'s entries, in replay order."""
+        single = self._path(label)
+        if single.exists():
+            return [single]
+        return sorted(self.directory.glob(f"{label}.part*.bson"))
+
+    def writer(self, label: str, part: Optional[int] = None) -> PlanWriter:
+        """Open (truncating) the plan file for *label*.
+
+        Parallel scans pass a *part* number so each worker writes its own
+        file; parts are replayed in part order.
+        """
+        return PlanWriter(self._path(label, part))
+
+    def record(self, label: str, *writers: PlanWriter, **summary: Any):
+        """Store the writers' totals (plus any scan counters) in the manifest."""
+        self.manifest["collections"][label] = {
+            "entries": sum(w.entries for w in writers),
+            "bytes": sum(w.bytes for w in writers),
+            **summary,
+        }
+        self.save()
+
+    def entries(self, label: str, skip: int = 0) -> Iterator[Dict[str, Any]]:
+        """Stream the change entries recorded for *label* (empty if none).
+
+        The first *skip* entries are read past without being yielded.
+        """
+        position = 0
+        for path in self._paths(label):
+            with open(path, "rb") as f:
+                for entry in decode_file_iter(f):
+                    if position >= skip:
+                        yield entry
+                    position += 1
+
+    def count(self, label: str) -> int:
+        return self.manifest["collections"].get(label, {}).get("entries", 0)
+
+    def total_bytes(self) -> int:
+        return sum(c.get("bytes", 0) for c in self.manifest["collections"].values())
+
+    def save(self):
+        (self.directory / MANIFEST_FILE).write_text(json.dumps(self.manifest, indent=2, default=str))
+
+    def get(self, key: str, default: Optional[Any] = None) -> Any:
+        return self.manifest.get(key, default)
+
+    def set(self, key: str, value: Any):
+        self.manifest[key] = value
+        self.save()
+
+    # ---- checkpoints --------------------------------------------------------
+
+    def checkpoint(self, label: str, applied: int, last_id: Any, modified: int):
+        """Record that the first *applied* entries of *label* are acknowledged."""
+        self.checkpoints[label] = {
+            "applied": applied,
+            "last_id": last_id,
+            "modified": modified,
+        }
+        path = self.directory / CHECKPOINT_FILE
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json_util.dumps(self.checkpoints, indent=2))
+        os.replace(tmp, path)
+
+    def applied(self, label: str) -> int:
+        """Number of leading entries of *label* already acknowledged."""
+        return self.checkpoints.get(label, {}).get("applied", 0)
+
+    def last_id(self, label: str) -> Any:
+        return self.checkpoints.get(label, {}).get("last_id")
+
+    def modified(self, label: str) -> int:
+        return self.checkpoints.get(label, {}).get("modified", 0)
+
+    def discard(self):
+        """Remove the plan directory (used when there is nothing to apply)."""
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Adaptive bulk-write batch sizing for ORCID scripts.
+
+A fixed batch of 1000 ops is too small for cheap ``$set`` updates and too
+big when every op rewrites a whole ``tokens`` array.  The sizer times each
+``bulk_write``, measures its encoded payload, and moves the batch size
+toward whichever is smaller: the number of ops that takes *target_latency_s*
+to write, or the number that fits in *max_batch_bytes*.  Size changes are
+bounded per batch so one slow write cannot collapse it.
+
+Usage:
+    sizer = AdaptiveBatchSizer(name="orcid_record", log=logger)
+    batch = SizedBatch()
+    for doc in docs:
+        batch.add(InsertOne(doc), doc)
+        if len(batch) >= sizer.size:
+            pipeline.submit(batch)
+            batch = SizedBatch()
+
+    # in the writer thread
+    with sizer.measure(batch):
+        collection.bulk_write(batch, ordered=False)
+
+    sizer.log_summary()
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator, Mapping, Optional, Sequence
+
+from bson import encode
+from bson.raw_bson import RawBSONDocument
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+MIN_BATCH_SIZE = 50
+MAX_BATCH_SIZE = 20_000
+DEFAULT_TARGET_LATENCY_S = 1.0
+# Well under the 48MB a bulk write is split at, so one batch is one message.
+DEFAULT_MAX_BATCH_BYTES = 8 * 1024 * 1024
+# Largest factor the size may grow or shrink by after one batch.
+MAX_STEP = 2.0
+# Weight of the newest batch in the per-op latency/size averages.
+SMOOTHING = 0.3
+# Consecutive batches within SETTLED_TOLERANCE of each other before the size
+# is reported as settled.
+SETTLED_AFTER = 5
+SETTLED_TOLERANCE = 0.1
+
+
+class SizedBatch(list):
+    """A list of pymongo write models plus the encoded size of what they were built from.
+
+    pymongo keeps a write model's filter and document in private attributes
+    whose names change between versions, so the sizer cannot read them back.
+    Pass the filter/update/document dicts to ``add`` along with the model.
+    """
+
+    __slots__ = ('payload_bytes',)
+
+    def __init__(self):
+        super().__init__()
+        self.payload_bytes = 0
+
+    def add(self, op: Any, *parts: Mapping[str, Any]):
+        """Append *op*, counting the encoded size of *parts* (its filter, update or document)."""
+        self.append(op)
+        self.payload_bytes += sum(len(encode(part)) for part in parts)
+
+
+def batch_bytes(batch: Sequence[Any]) -> int:
+    """Encoded payload of *batch*.
+
+    ``SizedBatch`` reports what was counted on ``add``; pre-encoded statements
+    (see raw_bulk) are measured exactly.  Anything else counts as 0, so only
+    the latency target applies to it.
+    """
+    if isinstance(batch, SizedBatch):
+        return batch.payload_bytes
+    return sum(len(op.raw) for op in batch if isinstance(op, RawBSONDocument))
+
+
+class AdaptiveBatchSizer:
+    """
+    Batch size controller fed by the timing and payload of each bulk write.
+
+    Args:
+        name: Label used in log lines (usually the collection).
+        initial: Starting batch size.
+        min_size / max_size: Bounds for the batch size.
+        target_latency_s: Wall time one ``bulk_write`` should take.
+        max_batch_bytes: Encoded payload budget for one batch.
+        log: Logger for the settled/summary lines (the script's own logger,
+            so they reach its console and log file).
+
+    ``size`` is read by the producer and updated from writer threads.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial: int = DEFAULT_BATCH_SIZE,
+        min_size: int = MIN_BATCH_SIZE,
+        max_size: int = MAX_BATCH_SIZE,
+        target_latency_s: float = DEFAULT_TARGET_LATENCY_S,
+        max_batch_bytes: int = DEFAULT_MAX_BATCH_BYTES,
+        log: Optional[logging.Logger] = None
+    ):
+        self.name = name
+        self.log = log or logger
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_latency_s = target_latency_s
+        self.max_batch_bytes = max_batch_bytes
+        self.size = max(min_size, min(initial, max_size))
+        self.batches = 0
+        self.ops = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+        self._latency_per_op = None
+        self._bytes_per_op = None
+        self._stable = 0
+        self._settled_at = None
+
+    @contextmanager
+    def measure(self, batch: Sequence[Any]) -> Iterator[None]:
+        """Time the write of *batch* inside the block and adjust ``size`` afterwards.
+
+        Failed writes are not recorded.
+        """
+        payload = batch_bytes(batch)
+        started = time.monotonic()
+        yield
+        self.record(len(batch), payload, time.monotonic() - started)
+
+    def record(self, ops: int, payload_bytes: int, seconds: float):
+        """Feed one completed batch of *ops* operations into the controller."""
+        if ops <= 0:
+            return
+        with self._lock:
+            self.batches += 1
+            self.ops += ops
+            self.bytes += payload_bytes
+            self.seconds += seconds
+
+            latency = seconds / ops
+            per_op = payload_bytes / ops
+            if self._latency_per_op is None:
+                self._latency_per_op, self._bytes_per_op = latency, per_op
+            else:
+                self._latency_per_op += SMOOTHING * (latency - self._latency_per_op)
+                self._bytes_per_op += SMOOTHING * (per_op - self._bytes_per_op)
+
+            desired = float(self.max_size)
+            if self._latency_per_op > 0:
+                desired = min(desired, self.target_latency_s / self._latency_per_op)
+            if self._bytes_per_op > 0:
+                desired = min(desired, self.max_batch_bytes / self._bytes_per_op)
+            desired = min(max(desired, self.size / MAX_STEP), self.size * MAX_STEP)
+            new_size = int(max(self.min_size, min(desired, self.max_size)))
+
+            if abs(new_size - self.size) <= self.size * SETTLED_TOLERANCE:
+                self._stable += 1
+            else:
+                self._stable = 0
+                self.log.debug("%s batch size %d -> %d (%.1f ms/op, %.0f B/op)",
+                               self.name, self.size, new_size,
+                               self._latency_per_op * 1000, self._bytes_per_op)
+            self.size = new_size
+
+            if self._stable >= SETTLED_AFTER and self._settled_at != self.size:
+                if self._settled_at is None or abs(self.size - self._settled_at) > self._settled_at * SETTLED_TOLERANCE:
+                    self.log.info("  %s batch size settled at %d ops (%.0f ms/batch, %.1f KB/batch)",
+                                  self.name, self.size,
+                                  self._latency_per_op * self.size * 1000,
+                                  self._bytes_per_op * self.size / 1024)
+                    self._settled_at = self.size
+
+    def log_summary(self):
+        """Log the final batch size and averages (nothing if no batch was written)."""
+        if not self.batches:
+            return
+        self.log.info("  %s: %d batches, final batch size %d ops, avg %.0f ops / %.0f ms / %.1f KB per batch",
+                      self.name, self.batches, self.size, self.ops / self.batches,
+                      self.seconds / self.batches * 1000, self.bytes / self.batches / 1024)
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Chunked `$in` lookups for ORCID scripts.
+
+A single ``{field: {"$in": values}}`` query with hundreds of thousands of
+values can exceed MongoDB's 16MB command limit and is slow to plan.  This
+module splits the values into chunks sized from their encoded BSON size,
+runs one query per chunk on a few threads sharing the client's connection
+pool, and streams every result back through a single iterator.
+
+Only use it on single-valued fields (salesforce_id, email, ...): a document
+whose array field matches values in two chunks would be returned twice.
+
+Usage:
+    for doc in find_in_chunks(collection, "email", emails, projection={"email": 1}):
+        ...
+"""
+
+import itertools
+import queue
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from bson import encode
+from pymongo.collection import Collection
+
+
+# MongoDB rejects commands larger than this.
+MAX_BSON_COMMAND_BYTES = 16 * 1024 * 1024
+# Target encoded size of one chunk's $in array; well under the limit so the
+# rest of the command always fits, and small enough to spread across workers.
+DEFAULT_CHUNK_BYTES = 1024 * 1024
+DEFAULT_LOOKUP_WORKERS = 4
+# Documents handed from a worker to the consumer at a time.
+RESULT_BATCH = 1000
+
+_DONE = object()
+
+
+class _Failure:
+    __slots__ = ('error',)
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def chunk_values(values: Iterable[Any], max_bytes: int = DEFAULT_CHUNK_BYTES) -> Iterator[List[Any]]:
+    """Split *values* into lists whose encoded `$in` array stays under *max_bytes*."""
+    max_bytes = min(max_bytes, MAX_BSON_COMMAND_BYTES // 2)
+    chunk: List[Any] = []
+    size = 5  # int32 length + trailing NUL of the array document
+    for value in values:
+        # Exact size of the array element: type byte, index key, value.
+        element = len(encode({str(len(chunk)): value})) - 5
+        if chunk and size + element > max_bytes:
+            yield chunk
+            chunk = []
+            size = 5
+            element = len(encode({'0': value})) - 5
+        chunk.append(value)
+        size += element
+    if chunk:
+        yield chunk
+
+
+def find_in_chunks(
+    collection: Collection,
+    field: str,
+    values: Iterable[Any],
+    query: Optional[Dict[str, Any]] = None,
+    projection: Optional[Dict[str, Any]] = None,
+    workers: int = DEFAULT_LOOKUP_WORKERS,
+    max_chunk_bytes: int = DEFAULT_CHUNK_BYTES,
+    hint: Optional[List[Any]] = None,
+    **find_kwargs: Any
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield every document of *collection* whose *field* is in *values*.
+
+    Args:
+        query: Extra conditions ANDed with the `$in` on every chunk.
+        projection: Passed to ``find``.
+        workers: Chunks queried concurrently; 1 runs them one after another.
+        max_chunk_bytes: Target encoded size of each chunk's `$in` array.
+        hint: Optional index hint applied to every chunk's cursor.
+        find_kwargs: Passed to ``find`` (e.g. ``no_cursor_timeout=True``).
+
+    Documents arrive in no particular order across chunks.  Closing the
+    iterator early stops the workers and their cursors.  *values* is read
+    lazily, one chunk at a time, so it can be a generator over a larger
+    set than would fit in memory as a list.
+    """
+    chunks = chunk_values(values, max_chunk_bytes)
+    head = list(itertools.islice(chunks, 2))
+    if not head:
+        return
+    chunks = itertools.chain(head, chunks)
+
+    def open_cursor(chunk: List[Any]):
+        cursor = collection.find({**(query or {}), field: {'$in': chunk}}, projection, **find_kwargs)
+        return cursor.hint(hint) if hint else cursor
+
+    if workers <= 1 or len(head) == 1:
+        for chunk in chunks:
+            cursor = open_cursor(chunk)
+            try:
+                yield from cursor
+            finally:
+                cursor.close()
+        return
+
+    yield from _threaded(chunks, open_cursor, workers)
+
+
+def _threaded(chunks: Iterator[List[Any]], open_cursor, workers: int) -> Iterator[Dict[str, Any]]:
+    results: "queue.Queue" = queue.Queue(maxsize=workers * 2)
+    stop = threading.Event()
+    pending = chunks
+    # Guards *pending*: chunks are built on demand by whichever worker asks.
+    lock = threading.Lock()
+
+    def put(item: Any) -> bool:
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def work():
+        try:
+            while not stop.is_set():
+                with lock:
+                    chunk = next(pending, None)
+                if chunk is None:
+                    return
+                cursor = open_cursor(chunk)
+                try:
+                    batch: List[Dict[str, Any]] = []
+                    for doc in cursor:
+                        batch.append(doc)
+                        if len(batch) >= RESULT_BATCH:
+                            if not put(batch):
+                                return
+                            batch = []
+                    if batch and not put(batch):
+                        return
+                finally:
+                    cursor.close()
+        except BaseException as e:
+            put(_Failure(e))
+        finally:
+            put(_DONE)
+
+    threads = [
+        threading.Thread(target=work, name=f"chunked-lookup-{i}", daemon=True)
+        for i in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+
+    finished = 0
+    try:
+        while finished < len(threads):
+            item = results.get()
+            if item is _DONE:
+                finished += 1
+            elif isinstance(item, _Failure):
+                raise item.error
+            else:
+                yield from item
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
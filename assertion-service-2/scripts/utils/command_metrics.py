@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Command monitoring module for ORCID scripts.
+
+Opt-in pymongo command listener that records, per command type and
+collection, a latency histogram and the number of documents returned.  A
+summary table is printed and a JSON report written when the process exits.
+
+Enable it for any script by setting MONGO_COMMAND_METRICS:
+    MONGO_COMMAND_METRICS=1                         # JSON under logs/
+    MONGO_COMMAND_METRICS=/tmp/backfill-metrics.json
+
+Reply sizes need every reply re-encoded to BSON, so they are only recorded
+when MONGO_COMMAND_METRICS_BYTES=1 is set as well.
+"""
+
+import atexit
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import encode
+from pymongo import monitoring
+
+from config import get_command_metrics_path, get_command_metrics_reply_bytes
+
+
+logger = logging.getLogger(__name__)
+
+# Commands worth breaking out; anything else is grouped under its own name
+# but is usually noise (ping, hello, endSessions, ...).
+TRACKED_COMMANDS = {
+    'find', 'getMore', 'aggregate', 'distinct', 'count',
+    'insert', 'update', 'delete', 'bulkWrite', 'findAndModify',
+}
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open.
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+_global_metrics: Optional['CommandMetrics'] = None
+
+
+class _Stats:
+    """Accumulated numbers for one (command, collection) pair."""
+
+    __slots__ = ('count', 'failures', 'total_ms', 'max_ms', 'docs', 'reply_bytes', 'histogram')
+
+    def __init__(self):
+        self.count = 0
+        self.failures = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.docs = 0
+        self.reply_bytes = 0
+        self.histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def add(self, duration_ms: float, docs: int, reply_bytes: int, failed: bool):
+        self.count += 1
+        self.failures += int(failed)
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+        self.docs += docs
+        self.reply_bytes += reply_bytes
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if duration_ms <= bound:
+                self.histogram[i] += 1
+                break
+        else:
+            self.histogram[-1] += 1
+
+    def percentile(self, fraction: float) -> float:
+        """Approximate percentile: upper bound of the bucket containing it."""
+        if not self.count:
+            return 0.0
+        threshold = fraction * self.count
+        seen = 0
+        for i, n in enumerate(self.histogram):
+            seen += n
+            if seen >= threshold:
+                return min(float(LATENCY_BUCKETS_MS[i]), self.max_ms) if i < len(LATENCY_BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def to_dict(self) -> Dict[str, Any]:
+        labels = [f"<={b}ms" for b in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+        return {
+            'count': self.count,
+            'failures': self.failures,
+            'total_ms': round(self.total_ms, 3),
+            'avg_ms': round(self.total_ms / self.count, 3) if self.count else 0.0,
+            'p50_ms': self.percentile(0.50),
+            'p95_ms': self.percentile(0.95),
+            'max_ms': round(self.max_ms, 3),
+            'docs': self.docs,
+            'reply_bytes': self.reply_bytes,
+            'histogram': dict(zip(labels, self.histogram)),
+        }
+
+
+def _namespace_of(command_name: str, database_name: str, command: Dict[str, Any]) -> str:
+    if command_name == 'getMore':
+        return f"{database_name}.{command.get('collection', '?')}"
+    if command_name == 'bulkWrite':
+        # Sent to admin; the target namespaces are listed in nsInfo.
+        namespaces = [info.get('ns', '?') for info in command.get('nsInfo') or ()]
+        return ','.join(namespaces) if namespaces else f"{database_name}.-"
+    target = command.get(command_name)
+    return f"{database_name}.{target if isinstance(target, str) else '-'}"
+
+
+def _docs_in_reply(command_name: str, reply: Dict[str, Any]) -> int:
+    cursor = reply.get('cursor')
+    if isinstance(cursor, dict):
+        batch = cursor.get('firstBatch', cursor.get('nextBatch'))
+        return len(batch) if batch is not None else 0
+    if command_name == 'distinct':
+        return len(reply.get('values') or [])
+    if command_name == 'update':
+        return int(reply.get('nModified', 0))
+    if 'n' in reply:
+        return int(reply.get('n') or 0)
+    return 0
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """
+    pymongo CommandListener aggregating per-command, per-collection metrics.
+
+    Register it on a MongoClient through ``event_listeners=[metrics]``.
+    """
+
+    def __init__(self, json_path: Optional[str] = None, reply_bytes: bool = False):
+        self.json_path = json_path
+        self.reply_bytes = reply_bytes
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Tuple[int, Any], Tuple[str, str]] = {}
+        self._stats: Dict[Tuple[str, str], _Stats] = {}
+
+    # ---- listener callbacks -------------------------------------------------
+
+    def started(self, event):
+        if event.command_name not in TRACKED_COMMANDS:
+            return
+        namespace = _namespace_of(event.command_name, event.database_name, event.command)
+        with self._lock:
+            self._in_flight[(event.request_id, event.connection_id)] = (event.command_name, namespace)
+
+    def succeeded(self, event):
+        self._finish(event, event.reply, failed=False)
+
+    def failed(self, event):
+        self._finish(event, None, failed=True)
+
+    def _finish(self, event, reply: Optional[Dict[str, Any]], failed: bool):
+        with self._lock:
+            key = self._in_flight.pop((event.request_id, event.connection_id), None)
+        if key is None:
+            return
+
+        docs = reply_bytes = 0
+        if reply is not None:
+            docs = _docs_in_reply(event.command_name, reply)
+            if self.reply_bytes:
+                try:
+                    reply_bytes = len(encode(reply))
+                except Exception:
+                    reply_bytes = 0
+
+        duration_ms = event.duration_micros / 1000.0
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = _Stats()
+            stats.add(duration_ms, docs, reply_bytes, failed)
+
+    # ---- reporting ----------------------------------------------------------
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            items = sorted(self._stats.items(), key=lambda kv: -kv[1].total_ms)
+            return {
+                'started': datetime.fromtimestamp(self.started_at).isoformat(),
+                'elapsed_s': round(time.time() - self.started_at, 3),
+                'commands': [
+                    {'command': cmd, 'namespace': ns, **stats.to_dict()}
+                    for (cmd, ns), stats in items
+                ],
+            }
+
+    def summary_lines(self) -> List[str]:
+        report = self.to_dict()
+        if not report['commands']:
+            return ["Command metrics: no commands recorded"]
+
+        lines = [
+            "=" * 80,
+            f"COMMAND METRICS (elapsed {report['elapsed_s']:.1f}s)",
+            "=" * 80,
+            "  %-10s %-45s %9s %10s %8s %8s %8s %11s %10s" % (
+                "command", "namespace", "count", "total_s", "avg_ms", "p95_ms", "max_ms", "docs",
+                "reply_MB" if self.reply_bytes else "",
+            ),
+        ]
+        for row in report['commands']:
+            reply_mb = "%.2f" % (row['reply_bytes'] / (1024 * 1024)) if self.reply_bytes else ""
+            lines.append("  %-10s %-45s %9d %10.2f %8.1f %8.0f %8.0f %11d %10s" % (
+                row['command'], row['namespace'][:45], row['count'], row['total_ms'] / 1000.0,
+                row['avg_ms'], row['p95_ms'], row['max_ms'], row['docs'], reply_mb,
+            ))
+        lines.append("=" * 80)
+        return lines
+
+    def write_json(self, path: Optional[str] = None) -> Optional[Path]:
+        target = path or self.json_path
+        if not target:
+            return None
+        out = Path(target)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps(self.to_dict(), indent=2))
+        return out
+
+    def _report_at_exit(self):
+        # Script loggers may already be torn down at exit, so print directly.
+        print("\n" + "\n".join(self.summary_lines()))
+        try:
+            out = self.write_json()
+            if out is not None:
+                print(f"Command metrics written to {out}")
+        except OSError as e:
+            print(f"Failed to write command metrics: {e}")
+
+
+def get_command_metrics() -> Optional[CommandMetrics]:
+    """
+    Return the process-wide CommandMetrics listener, or None when disabled.
+
+    The listener is created on first use when MONGO_COMMAND_METRICS is set and
+    reports once at interpreter exit, so every client in the process feeds
+    the same summary.
+    """
+    global _global_metrics
+    if _global_metrics is not None:
+        return _global_metrics
+
+    json_path = get_command_metrics_path()
+    if json_path is None:
+        return None
+
+    _global_metrics = CommandMetrics(json_path, reply_bytes=get_command_metrics_reply_bytes())
+    atexit.register(_global_metrics._report_at_exit)
+    logger.info("Command metrics enabled (report: %s)", json_path)
+    return _global_metrics
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Compact string sets for planners that hold tens of millions of emails.
+
+A Python ``set`` of emails costs roughly 100 bytes per entry (the str object
+plus the hash table slot), and a ``Dict[str, Set[str]]`` over 300 because
+every key carries its own set object.  ``CompactStringSet`` keeps a sorted
+``array('Q')`` of 64-bit hashes and the UTF-8 bytes of the values in one
+``bytearray``, about 40 bytes per email.  ``CompactSetMap`` maps each key
+to a few values drawn from a small vocabulary (member ids), about 55 bytes
+per (key, value) pair.
+
+Hashes only locate candidates: every hit is confirmed by comparing the
+stored bytes, so two values sharing a hash are kept apart and a lookup never
+returns a false positive.
+
+Build first, then query.  Values added after a lookup are sorted on their
+own and merged into the sorted arrays on the next lookup.  When NumPy is
+installed it sorts the hashes and answers ``contains_many`` with one
+``searchsorted`` call; otherwise the same work is done with ``sorted``,
+``heapq.merge`` and ``bisect``.  Without NumPy, new entries are sorted in runs
+of ``SORT_RUN_SIZE`` so the temporary Python objects stay bounded.
+
+Usage:
+    seen = CompactStringSet()
+    for doc in cursor:
+        seen.add(doc["email"])
+    if email in seen:
+        ...
+
+    needed = CompactSetMap()
+    needed.add("a@example.org", member_id)
+    needed["a@example.org"]   # {member_id}
+"""
+
+import heapq
+import threading
+from array import array
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # not in the container image; fall back to array/bisect
+    np = None
+
+
+HASH_MASK = (1 << 64) - 1
+# Entries sorted at once without NumPy; runs are merged with heapq.merge.
+SORT_RUN_SIZE = 1 << 16
+
+
+def hash64(value: str) -> int:
+    """Unsigned 64-bit hash of *value*, stable for the life of the process."""
+    return hash(value) & HASH_MASK
+
+
+class CompactStringSet:
+    """A set of strings stored as sorted 64-bit hashes plus their UTF-8 bytes.
+
+    Supports ``add``, ``in``, ``len``, iteration (in hash order) and
+    ``contains_many`` for a batch of lookups.
+    """
+
+    # Keep repeated values (CompactSetMap stores one entry per pair).
+    _KEEP_DUPLICATES = False
+
+    def __init__(self, values: Iterable[str] = ()):
+        self._blob = bytearray()
+        # Entry number -> offset of its bytes in _blob.
+        self._starts = array('Q')
+        # Sorted hashes and, at the same position, the entry they belong to.
+        self._hashes = array('Q')
+        self._order = array('Q')
+        # 1 where the position holds the first entry of its value.
+        self._first = bytearray()
+        self._distinct = 0
+        # Hashes of entries added since the last sort.
+        self._pending = array('Q')
+        self._lock = threading.Lock()
+        for value in values:
+            self.add(value)
+
+    def add(self, value: str):
+        self._starts.append(len(self._blob))
+        self._blob += value.encode('utf-8')
+        self._pending.append(hash64(value))
+
+    def __contains__(self, value: Any) -> bool:
+        return isinstance(value, str) and self._find(value) >= 0
+
+    def __len__(self) -> int:
+        self._freeze()
+        return self._distinct
+
+    def __bool__(self) -> bool:
+        return bool(self._pending) or self._distinct > 0
+
+    def __iter__(self) -> Iterator[str]:
+        self._freeze()
+        for position, first in enumerate(self._first):
+            if first:
+                yield self._value(self._order[position]).decode('utf-8')
+
+    def contains_many(self, values: List[str]) -> List[bool]:
+        """Membership of every value in *values*, with the hash search done in one pass."""
+        self._freeze()
+        hashes = array('Q', (hash64(value) for value in values))
+        if np is not None:
+            positions = np.searchsorted(
+                np.frombuffer(self._hashes, dtype=np.uint64), np.frombuffer(hashes, dtype=np.uint64)
+            ).tolist()
+        else:
+            positions = [bisect_left(self._hashes, h) for h in hashes]
+        return [
+            self._match(position, h, value.encode('utf-8')) >= 0
+            for position, h, value in zip(positions, hashes, values)
+        ]
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the set's arrays (excluding the fixed object overhead)."""
+        arrays = (self._starts, self._hashes, self._order, self._pending)
+        return len(self._blob) + len(self._first) + sum(a.itemsize * len(a) for a in arrays)
+
+    # ---- internals ----------------------------------------------------------
+
+    def _value(self, entry: int) -> bytes:
+        start = self._starts[entry]
+        end = self._starts[entry + 1] if entry + 1 < len(self._starts) else len(self._blob)
+        return bytes(self._blob[start:end])
+
+    def _find(self, value: str) -> int:
+        """Sorted position of the first entry equal to *value*, or -1."""
+        self._freeze()
+        h = hash64(value)
+        return self._match(bisect_left(self._hashes, h), h, value.encode('utf-8'))
+
+    def _match(self, position: int, h: int, data: bytes) -> int:
+        hashes = self._hashes
+        while position < len(hashes) and hashes[position] == h:
+            if self._value(self._order[position]) == data:
+                return position
+            position += 1
+        return -1
+
+    def _freeze(self):
+        """Merge pending entries in with the sorted ones and mark repeated values."""
+        if not self._pending:
+            return
+        with self._lock:
+            if not self._pending:
+                return
+            hashes, order, runs = self._sorted(len(self._starts) - len(self._pending))
+
+            first = bytearray(b'\x01') * len(hashes)
+            for run_start, run_end in runs:
+                # Same hash: the same value added again, or (rarely) a collision.
+                seen = set()
+                for position in range(run_start, run_end):
+                    data = self._value(order[position])
+                    if data in seen:
+                        first[position] = 0
+                    seen.add(data)
+
+            if not self._KEEP_DUPLICATES and first.count(0):
+                keep = [position for position, flag in enumerate(first) if flag]
+                hashes = array('Q', (hashes[position] for position in keep))
+                order = array('Q', (order[position] for position in keep))
+                first = bytearray(b'\x01') * len(keep)
+            self._hashes, self._order, self._first = hashes, order, first
+            self._distinct = first.count(1)
+            self._pending = array('Q')
+
+    def _sorted(self, first_new: int) -> Tuple[array, array, List[Tuple[int, int]]]:
+        """All entries sorted by hash, plus the (start, end) runs of equal hashes.
+
+        Only the pending entries are sorted; they are then merged with the
+        already sorted arrays.  Within equal hashes entries stay in the order
+        they were added, so the first of a value is always the earliest.
+        """
+        pending = self._pending
+        if np is not None:
+            existing = np.frombuffer(self._hashes, dtype=np.uint64)
+            index = np.argsort(np.frombuffer(pending, dtype=np.uint64), kind='stable')
+            new_hashes = np.frombuffer(pending, dtype=np.uint64)[index]
+            new_order = index.astype(np.uint64) + np.uint64(first_new)
+            # side='right' puts new entries after earlier entries with the same hash.
+            at = np.searchsorted(existing, new_hashes, side='right')
+            hashes = np.insert(existing, at, new_hashes)
+            order = np.insert(np.frombuffer(self._order, dtype=np.uint64), at, new_order)
+            repeats = np.flatnonzero(hashes[1:] == hashes[:-1]).tolist()
+            return array('Q', hashes.tobytes()), array('Q', order.tobytes()), _runs(repeats)
+
+        runs = [(self._hashes, self._order)]
+        for start in range(0, len(pending), SORT_RUN_SIZE):
+            index = sorted(range(start, min(start + SORT_RUN_SIZE, len(pending))), key=pending.__getitem__)
+            runs.append((array('Q', (pending[i] for i in index)), array('Q', (first_new + i for i in index))))
+        hashes, order = array('Q'), array('Q')
+        # (hash, entry) pairs: equal hashes come out by entry number, i.e. in insertion order.
+        for h, entry in heapq.merge(*(zip(run_hashes, run_order) for run_hashes, run_order in runs)):
+            hashes.append(h)
+            order.append(entry)
+        repeats = [p for p in range(len(hashes) - 1) if hashes[p] == hashes[p + 1]]
+        return hashes, order, _runs(repeats)
+
+
+def _runs(repeats: List[int]) -> List[Tuple[int, int]]:
+    """Group positions *p* where ``hashes[p] == hashes[p + 1]`` into (start, end) runs."""
+    runs: List[Tuple[int, int]] = []
+    for p in repeats:
+        if runs and runs[-1][1] == p + 1:
+            runs[-1] = (runs[-1][0], p + 2)
+        else:
+            runs.append((p, p + 2))
+    return runs
+
+
+class CompactSetMap(CompactStringSet):
+    """
+    Maps strings to small sets of strings, like ``Dict[str, Set[str]]``.
+
+    Values come from a small vocabulary (member ids, salesforce ids) and are
+    stored once; each ``add(key, value)`` costs one entry.  Supports ``in``,
+    ``[key]`` / ``get`` (a new ``set`` each time), ``len``, ``keys()`` and
+    iteration over keys.
+    """
+
+    _KEEP_DUPLICATES = True
+
+    def __init__(self):
+        super().__init__()
+        self._vocabulary: List[str] = []
+        self._vocabulary_ids: Dict[str, int] = {}
+        # Entry number -> vocabulary id of its value.
+        self._values = array('I')
+
+    def add(self, key: str, value: str):
+        vocabulary_id = self._vocabulary_ids.get(value)
+        if vocabulary_id is None:
+            vocabulary_id = self._vocabulary_ids[value] = len(self._vocabulary)
+            self._vocabulary.append(value)
+        super().add(key)
+        self._values.append(vocabulary_id)
+
+    def __getitem__(self, key: str) -> Set[str]:
+        values = self.get(key)
+        if values is None:
+            raise KeyError(key)
+        return values
+
+    def get(self, key: str, default: Optional[Set[str]] = None) -> Optional[Set[str]]:
+        position = self._find(key) if isinstance(key, str) else -1
+        if position < 0:
+            return default
+        data = self._value(self._order[position])
+        h = self._hashes[position]
+        values = set()
+        while position < len(self._hashes) and self._hashes[position] == h:
+            entry = self._order[position]
+            if self._value(entry) == data:
+                values.add(self._vocabulary[self._values[entry]])
+            position += 1
+        return values
+
+    def keys(self) -> Iterator[str]:
+        return iter(self)
+
+    def items(self) -> Iterator[Tuple[str, Set[str]]]:
+        for key in self:
+            yield key, self[key]
+
+    @property
+    def nbytes(self) -> int:
+        return super().nbytes + self._values.itemsize * len(self._values)
+
+
+class SetMap(dict):
+    """A plain ``Dict[str, Set[str]]`` with the ``add(key, value)`` of ``CompactSetMap``."""
+
+    def add(self, key: str, value: str):
+        self.setdefault(key, set()).add(value)
@@ -3,8 +3,13 @@
 Handles loading configuration from environment variables with sensible defaults.
 """
 
+import logging
 import os
-from typing import Dict
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+
+logger = logging.getLogger(__name__)
 
 
 class Config:
@@ -20,6 +25,7 @@ class Config:
         self.mongo_uri = self._get_mongo_uri()
         self.mongo_database = self._get_env('MONGO_DATABASE', 'assertionservice')
         self.mongo_collection = self._get_env('MONGO_COLLECTION', 'assertion')
+        self.mongo_max_pool_size = self._get_int_env('MONGO_MAX_POOL_SIZE', 10)
 
     def _get_mongo_uri(self) -> str:
         return (
@@ -30,11 +36,25 @@ class Config:
     def _get_env(self, primary_key: str, default: str) -> str:
         return os.getenv(primary_key) or default
 
-    def to_dict(self) -> Dict[str, str]:
+    def _get_int_env(self, primary_key: str, default: int) -> int:
+        """Non-negative integer setting; a malformed value is logged and *default* used."""
+        value = self._get_env(primary_key, str(default))
+        try:
+            parsed = int(value)
+        except ValueError:
+            parsed = -1
+        if parsed < 0:
+            logger.error("Invalid %s=%r (expected a non-negative integer); using %d",
+                         primary_key, value, default)
+            return default
+        return parsed
+
+    def to_dict(self) -> Dict[str, Any]:
         return {
             'mongo_uri': self.mongo_uri,
             'mongo_database': self.mongo_database,
             'mongo_collection': self.mongo_collection,
+            'mongo_max_pool_size': self.mongo_max_pool_size,
         }
 
     def __repr__(self) -> str:
@@ -60,3 +80,58 @@ def get_database_name(default: str = 'caca') -> str:
 
 def get_collection_name(default: str = 'assertion') -> str:
     return os.getenv('MONGO_COLLECTION') or default
+
+
+def get_command_metrics_path(log_dir: str = 'logs') -> Optional[str]:
+    """Return the JSON report path for command metrics, or None when disabled.
+
+    MONGO_COMMAND_METRICS may be a file path, or a truthy flag (1/true/yes) to
+    write a timestamped report under *log_dir*.
+    """
+    value = (os.getenv('MONGO_COMMAND_METRICS') or '').strip()
+    if not value or value.lower() in ('0', 'false', 'no', 'off'):
+        return None
+    if value.lower() in ('1', 'true', 'yes', 'on'):
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        return os.path.join(log_dir, f"command-metrics_{timestamp}.json")
+    return value
+
+
+def get_command_metrics_reply_bytes() -> bool:
+    """Return whether command metrics also record reply sizes.
+
+    Sizing a reply re-encodes it to BSON, so MONGO_COMMAND_METRICS_BYTES
+    (1/true/yes) turns it on separately from MONGO_COMMAND_METRICS.
+    """
+    value = (os.getenv('MONGO_COMMAND_METRICS_BYTES') or '').strip().lower()
+    return value in ('1', 'true', 'yes', 'on')
+
+
+def get_write_throttle_settings() -> Dict[str, float]:
+    """Return the write throttle limits.
+
+    MONGO_WRITE_OPS_PER_SECOND caps write operations per second,
+    MONGO_MAX_REPLICATION_LAG_S is the secondary lag above which writes slow
+    down and MONGO_LAG_POLL_S how often lag is checked.  Throttling is opt-in:
+    unset (or 0) means no cap and no lag watching.
+    """
+    return {
+        'ops_per_second': _get_float_env('MONGO_WRITE_OPS_PER_SECOND', 0.0),
+        'max_lag_s': _get_float_env('MONGO_MAX_REPLICATION_LAG_S', 0.0),
+        'poll_interval_s': _get_float_env('MONGO_LAG_POLL_S', 5.0),
+    }
+
+
+def _get_float_env(primary_key: str, default: float) -> float:
+    """Non-negative number setting; a malformed value is logged and *default* used."""
+    value = os.getenv(primary_key) or str(default)
+    try:
+        parsed = float(value)
+    except ValueError:
+        parsed = -1.0
+    # NaN fails the comparison too, so it is rejected with negatives and inf.
+    if not 0 <= parsed < float('inf'):
+        logger.error("Invalid %s=%r (expected a non-negative number); using %g",
+                     primary_key, value, default)
+        return default
+    return parsed
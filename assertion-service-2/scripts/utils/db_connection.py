@@ -6,15 +6,29 @@ Provides MongoDB connection handling with proper error handling and validation.
 """
 
 import logging
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 from pymongo import MongoClient
 from pymongo.database import Database
 from pymongo.collection import Collection
 from pymongo.errors import ConnectionFailure, OperationFailure, ServerSelectionTimeoutError
 
+from command_metrics import get_command_metrics
+from raw_fields import RAW_CODEC_OPTIONS
+
 
 logger = logging.getLogger(__name__)
 
+# Default upper bound on pooled sockets for a shared client.  The scripts are
+# mostly single-threaded, so a small pool is plenty and keeps the footprint on
+# the server low during long backfills.
+DEFAULT_MAX_POOL_SIZE = 10
+
+
+def _client_options() -> Dict[str, Any]:
+    """Extra MongoClient options shared by every client the scripts create."""
+    metrics = get_command_metrics()
+    return {'event_listeners': [metrics]} if metrics is not None else {}
+
 
 class MongoDBConnection:
     """
@@ -26,28 +40,40 @@ class MongoDBConnection:
             collection = connection.get_collection("my_collection")
             # Use collection...
             connection.disconnect()
+
+    When ``client`` is given the connection borrows that (already connected)
+    client instead of creating its own; ``disconnect()`` then only drops the
+    handle and leaves the client open for its owner.  See
+    ``MongoConnectionRegistry``.
     """
 
     def __init__(
         self,
         uri: str,
         database_name: str,
-        timeout_ms: int = 5000
+        timeout_ms: int = 5000,
+        client: Optional[MongoClient] = None
     ):
         self.uri = uri
         self.database_name = database_name
         self.timeout_ms = timeout_ms
-        self.client: Optional[MongoClient] = None
+        self.client: Optional[MongoClient] = client
         self.db: Optional[Database] = None
+        self._shared_client = client is not None
 
     def connect(self) -> bool:
+        if self._shared_client:
+            self.db = self.client[self.database_name]
+            return True
+
         try:
             logger.info(f"Connecting to MongoDB database: {self.database_name}")
 
             # Create client with timeout
             self.client = MongoClient(
                 self.uri,
-                serverSelectionTimeoutMS=self.timeout_ms
+                serverSelectionTimeoutMS=self.timeout_ms,
+                **_client_options()
             )
 
             self.client.admin.command('ping')
@@ -72,17 +98,30 @@ class MongoDBConnection:
             return False
 
     def disconnect(self):
+        if self._shared_client:
+            self.db = None
+            return
+
         if self.client is not None:
             self.client.close()
             logger.info("Disconnected from MongoDB")
             self.client = None
             self.db = None
 
-    def get_collection(self, collection_name: str) -> Optional[Collection]:
+    def get_collection(self, collection_name: str, raw: bool = False) -> Optional[Collection]:
+        """
+        Return *collection_name* from the connected database.
+
+        With ``raw=True`` reads return undecoded ``RawBSONDocument``s; read
+        them with ``raw_fields.RawFields`` so only the needed fields are
+        decoded.
+        """
         if self.db is None:
             logger.error("Not connected to database. Call connect() first.")
             return None
 
+        if raw:
+            return self.db.get_collection(collection_name, codec_options=RAW_CODEC_OPTIONS)
         return self.db[collection_name]
 
     def __enter__(self):
@@ -93,6 +132,100 @@ class MongoDBConnection:
         self.disconnect()
 
 
+class MongoConnectionRegistry:
+    """
+    Hands out per-database connections backed by a single pooled MongoClient.
+
+    Scripts that touch several databases (memberservice, assertionservice,
+    userservice) on the same server should use one registry instead of one
+    MongoDBConnection per database: that is one connection pool, one
+    handshake and one set of monitor threads for the whole run.
+
+    Usage:
+        registry = MongoConnectionRegistry(uri, max_pool_size=20)
+        if registry.connect():
+            members = registry.get("memberservice").get_collection("member")
+            users = registry.get("userservice").get_collection("jhi_user")
+            # Use collections...
+            registry.disconnect()
+    """
+
+    def __init__(
+        self,
+        uri: str,
+        timeout_ms: int = 5000,
+        max_pool_size: int = DEFAULT_MAX_POOL_SIZE
+    ):
+        self.uri = uri
+        self.timeout_ms = timeout_ms
+        self.max_pool_size = max_pool_size
+        self.client: Optional[MongoClient] = None
+        self._database_names: List[str] = []
+        self._connections: Dict[str, MongoDBConnection] = {}
+
+    def connect(self) -> bool:
+        try:
+            logger.info("Connecting to MongoDB (shared pool, maxPoolSize=%d)", self.max_pool_size)
+
+            self.client = MongoClient(
+                self.uri,
+                serverSelectionTimeoutMS=self.timeout_ms,
+                maxPoolSize=self.max_pool_size,
+                **_client_options()
+            )
+
+            self.client.admin.command('ping')
+            self._database_names = self.client.list_database_names()
+
+            logger.info(" Successfully connected to MongoDB")
+            return True
+
+        except ServerSelectionTimeoutError as e:
+            logger.error(f" Connection timeout: {e}")
+            logger.error("Check if MongoDB is accessible and the URI is correct")
+        except ConnectionFailure as e:
+            logger.error(f" Failed to connect to MongoDB: {e}")
+        except Exception as e:
+            logger.error(f" Unexpected error during connection: {e}")
+
+        self.disconnect()
+        return False
+
+    def get(self, database_name: str) -> Optional[MongoDBConnection]:
+        """Return the connection handle for *database_name*, creating it on first use."""
+        if self.client is None:
+            logger.error("Registry is not connected. Call connect() first.")
+            return None
+
+        connection = self._connections.get(database_name)
+        if connection is None:
+            if database_name not in self._database_names:
+                logger.warning(f"Database '{database_name}' does not exist yet")
+            connection = MongoDBConnection(
+                self.uri, database_name, self.timeout_ms, client=self.client
+            )
+            connection.connect()
+            self._connections[database_name] = connection
+        return connection
+
+    def disconnect(self):
+        for connection in self._connections.values():
+            connection.disconnect()
+        self._connections.clear()
+
+        if self.client is not None:
+            self.client.close()
+            logger.info("Disconnected from MongoDB")
+            self.client = None
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.disconnect()
+
+
 def create_connection(
     uri: str,
     database: str,
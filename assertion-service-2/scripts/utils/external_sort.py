@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Disk-spilling sort, dedupe and set difference for planner working sets.
+
+``ExternalSorter`` buffers items until their estimated size reaches the
+memory budget, then sorts the buffer and writes it to a temporary run file
+(a plain sequence of BSON documents, like backfill plans).  Reading the
+result k-way merges the runs, so memory stays near the budget however many
+items are added.  When everything fits in the budget nothing touches disk.
+
+Items are strings or tuples of strings/numbers (e.g. ``(email, member_id)``
+pairs), compared with Python's ordering; for strings that is also
+MongoDB's binary order, so sorted output can be merge-joined with an
+index-ordered cursor.
+
+Usage:
+    with ExternalSorter("assertion-emails", memory_budget_mb=256, unique=True) as sorter:
+        for email in emails:
+            sorter.add(email)
+        for email in sorted_difference(sorter, existing_sorted_emails):
+            ...
+        logger.info(sorter.stats.summary())
+"""
+
+import heapq
+import itertools
+import logging
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import weakref
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from bson import decode_file_iter, encode
+
+
+logger = logging.getLogger(__name__)
+
+# Most run files merged at once; more runs are first merged into larger ones.
+DEFAULT_FAN_IN = 64
+# Read buffer per open run during a merge (bounded by the memory budget).
+MAX_READ_BUFFER_BYTES = 1024 * 1024
+MIN_READ_BUFFER_BYTES = 64 * 1024
+# Items pulled from the merge per timing sample.
+MERGE_BLOCK = 4096
+
+
+def _footprint(item: Any) -> int:
+    """Approximate bytes *item* holds while buffered (object plus list slot)."""
+    if isinstance(item, tuple):
+        return sys.getsizeof(item) + sum(sys.getsizeof(part) for part in item) + 8
+    return sys.getsizeof(item) + 8
+
+
+def _unique(items: Iterable[Any]) -> Iterator[Any]:
+    """Drop adjacent repeats from a sorted stream."""
+    previous = object()
+    for item in items:
+        if item != previous:
+            previous = item
+            yield item
+
+
+class SortStats:
+    """Spill and merge counters for one sorter, for the run summary."""
+
+    __slots__ = ("items", "runs", "spilled_items", "spilled_bytes", "temp_bytes",
+                 "peak_temp_bytes", "merged_items", "merge_seconds")
+
+    def __init__(self):
+        self.items = 0
+        self.runs = 0
+        self.spilled_items = 0
+        self.spilled_bytes = 0
+        self.temp_bytes = 0
+        self.peak_temp_bytes = 0
+        self.merged_items = 0
+        self.merge_seconds = 0.0
+
+    def summary(self) -> str:
+        if not self.runs:
+            return f"{self.items} items sorted in memory"
+        rate = self.merged_items / self.merge_seconds if self.merge_seconds else 0.0
+        return (
+            f"{self.items} items, {self.runs} runs spilled "
+            f"({self.spilled_bytes / (1024 * 1024):.1f} MB written, "
+            f"peak temp {self.peak_temp_bytes / (1024 * 1024):.1f} MB), "
+            f"merged {self.merged_items} items at {rate:,.0f} items/s"
+        )
+
+
+class ExternalSorter:
+    """
+    Sorts any number of items within roughly *memory_budget_mb* of memory.
+
+    Args:
+        name: Label used for the temp directory and log lines.
+        memory_budget_mb: Buffered items are spilled once their estimated
+            size reaches this.
+        unique: Drop repeated items (within runs and across the merge).
+        temp_dir: Parent for the run files (default: the system temp dir).
+        fan_in: Most runs merged in one pass.
+
+    Iterating the sorter (or calling ``sorted()``) yields the items in order
+    and can be repeated; items may be added between iterations.  Run files
+    are removed by ``close()``, or when the sorter is garbage-collected.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        memory_budget_mb: float,
+        unique: bool = False,
+        temp_dir: Optional[str] = None,
+        fan_in: int = DEFAULT_FAN_IN
+    ):
+        self.name = name
+        self.budget_bytes = max(1, int(memory_budget_mb * 1024 * 1024))
+        self.unique = unique
+        self.temp_dir = temp_dir
+        self.fan_in = max(2, fan_in)
+        self.stats = SortStats()
+        self._buffer: List[Any] = []
+        self._buffer_bytes = 0
+        self._runs: List[Path] = []
+        self._directory: Optional[Path] = None
+        self._cleanup = None
+        self._run_numbers = itertools.count()
+        self._lock = threading.Lock()
+
+    def add(self, item: Any):
+        self._buffer.append(item)
+        self._buffer_bytes += _footprint(item)
+        self.stats.items += 1
+        if self._buffer_bytes >= self.budget_bytes:
+            self._spill()
+
+    def extend(self, items: Iterable[Any]):
+        for item in items:
+            self.add(item)
+
+    def __iter__(self) -> Iterator[Any]:
+        return self.sorted()
+
+    def sorted(self) -> Iterator[Any]:
+        """Yield every item added so far, in order (repeats dropped if ``unique``)."""
+        with self._lock:
+            if self._runs and self._buffer:
+                self._spill()
+            if not self._runs:
+                self._buffer.sort()
+                if self.unique:
+                    self._buffer[:] = _unique(self._buffer)
+                items = self._buffer
+                runs = None
+            else:
+                while len(self._runs) > self.fan_in:
+                    self._merge_runs()
+                runs = list(self._runs)
+        if runs is None:
+            yield from items
+            return
+        yield from self._timed(self._merged(runs))
+
+    def close(self):
+        """Delete the run files."""
+        if self._cleanup is not None:
+            self._cleanup()
+        self._directory = None
+        self._cleanup = None
+        self._runs = []
+        self._buffer = []
+        self._buffer_bytes = 0
+        self.stats.temp_bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    # ---- runs -------------------------------------------------------------
+
+    def _new_run_path(self) -> Path:
+        if self._directory is None:
+            self._directory = Path(tempfile.mkdtemp(prefix=f"{self.name}-", dir=self.temp_dir))
+            self._cleanup = weakref.finalize(self, shutil.rmtree, str(self._directory), True)
+            logger.debug("%s: spilling to %s", self.name, self._directory)
+        return self._directory / f"run-{next(self._run_numbers):05d}.bson"
+
+    def _spill(self):
+        self._buffer.sort()
+        items = _unique(self._buffer) if self.unique else self._buffer
+        self._runs.append(self._write_run(items))
+        self._buffer = []
+        self._buffer_bytes = 0
+
+    def _write_run(self, items: Iterable[Any]) -> Path:
+        path = self._new_run_path()
+        written = 0
+        count = 0
+        with open(path, "wb") as run:
+            for item in items:
+                data = encode({"v": item})
+                run.write(data)
+                written += len(data)
+                count += 1
+        self.stats.runs += 1
+        self.stats.spilled_items += count
+        self.stats.spilled_bytes += written
+        self.stats.temp_bytes += written
+        self.stats.peak_temp_bytes = max(self.stats.peak_temp_bytes, self.stats.temp_bytes)
+        return path
+
+    def _merge_runs(self):
+        """Merge the oldest ``fan_in`` runs into one (to bound open files)."""
+        group, self._runs = self._runs[:self.fan_in], self._runs[self.fan_in:]
+        self._runs.append(self._write_run(self._timed(self._merged(group))))
+        for path in group:
+            self.stats.temp_bytes -= path.stat().st_size
+            path.unlink()
+
+    def _merged(self, runs: List[Path]) -> Iterator[Any]:
+        buffer = max(MIN_READ_BUFFER_BYTES, min(MAX_READ_BUFFER_BYTES, self.budget_bytes // (2 * len(runs))))
+        files = [open(path, "rb", buffering=buffer) for path in runs]
+        try:
+            merged = heapq.merge(*(self._read(f) for f in files))
+            yield from (_unique(merged) if self.unique else merged)
+        finally:
+            for f in files:
+                f.close()
+
+    @staticmethod
+    def _read(run) -> Iterator[Any]:
+        for doc in decode_file_iter(run):
+            value = doc["v"]
+            yield tuple(value) if isinstance(value, list) else value
+
+    def _timed(self, items: Iterator[Any]) -> Iterator[Any]:
+        """Pass *items* through, timing only the merge (not the consumer)."""
+        while True:
+            started = time.monotonic()
+            block = list(itertools.islice(items, MERGE_BLOCK))
+            self.stats.merge_seconds += time.monotonic() - started
+            if not block:
+                return
+            self.stats.merged_items += len(block)
+            yield from block
+
+
+class SortedSetMap:
+    """
+    ``(key, value)`` pairs sorted on disk and read back grouped by key.
+
+    A spilling stand-in for ``Dict[str, Set[str]]`` when the map is too large
+    to hold: instead of random lookups it hands out the map in key order,
+    ``chunk_size`` keys at a time, each chunk a plain dict of sets.
+    """
+
+    def __init__(self, name: str, memory_budget_mb: float, temp_dir: Optional[str] = None):
+        self.sorter = ExternalSorter(name, memory_budget_mb, unique=True, temp_dir=temp_dir)
+        self._keys: Optional[int] = None
+
+    def add(self, key: str, value: str):
+        self.sorter.add((key, value))
+        self._keys = None
+
+    def __bool__(self) -> bool:
+        return self.sorter.stats.items > 0
+
+    def __len__(self) -> int:
+        """Number of distinct keys (counted with one pass over the runs, then cached)."""
+        if self._keys is None:
+            self._keys = sum(1 for _ in self.groups())
+        return self._keys
+
+    def groups(self) -> Iterator[Tuple[str, Set[str]]]:
+        for key, pairs in itertools.groupby(self.sorter, key=lambda pair: pair[0]):
+            yield key, {value for _, value in pairs}
+
+    def chunks(self, chunk_size: int) -> Iterator[Dict[str, Set[str]]]:
+        """Yield dicts of at most *chunk_size* consecutive keys."""
+        groups = self.groups()
+        while True:
+            chunk = dict(itertools.islice(groups, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        self.sorter.close()
+
+
+def sorted_difference(left: Iterable[Any], right: Iterable[Any]) -> Iterator[Any]:
+    """Items of sorted *left* that are not in sorted *right* (a merge-join, constant memory)."""
+    right = iter(right)
+    current = next(right, None)
+    for item in left:
+        while current is not None and current < item:
+            current = next(right, None)
+        if current != item:
+            yield item
@@ -5,13 +5,14 @@ Common modules for ORCID database scripts to eliminate code duplication.
 
 Modules:
 - logger_config: Logging configuration
-- db_connection: MongoDB connection handling
+- db_connection: MongoDB connection handling (single client or shared pool registry)
+- command_metrics: Opt-in per-command latency/document metrics (MONGO_COMMAND_METRICS, reply bytes with MONGO_COMMAND_METRICS_BYTES)
 
 Usage:
     from logger_config import setup_logger
-    from db_connection import MongoDBConnection
+    from db_connection import MongoDBConnection, MongoConnectionRegistry
     from config import Config
 """
 
 __version__ = '1.0.0'
-__all__ = ['logger_config', 'db_connection', 'config']
+__all__ = ['logger_config', 'db_connection', 'config', 'command_metrics']
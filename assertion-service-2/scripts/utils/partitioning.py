@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+_id keyspace partitioning for parallel collection scans.
+
+Splits a collection's `_id` range into roughly equal slices using a `$sample`
+of `_id`s (no admin privileges needed, unlike `splitVector`), so several
+worker threads can each scan one slice with their own cursor.
+
+Usage:
+    ranges = id_ranges(collection, partitions=8)
+    for lower, upper in ranges:
+        collection.find({**query, **range_filter(lower, upper)})
+"""
+
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import Binary, ObjectId
+from pymongo.collection import Collection
+from pymongo.errors import OperationFailure
+
+
+logger = logging.getLogger(__name__)
+
+# Sampled _ids per requested partition; more samples give more even slices.
+SAMPLES_PER_PARTITION = 100
+# Collections smaller than this per partition are not worth splitting.
+MIN_DOCS_PER_PARTITION = 50_000
+
+IdRange = Tuple[Optional[Any], Optional[Any]]
+
+# $type alias for each _id type that can bound a range.  Range operators only
+# match values of the same BSON type (all numeric types count as one).
+_BSON_TYPES = ((bool, None), (ObjectId, 'objectId'), (str, 'string'), ((int, float), 'number'),
+               (datetime, 'date'), (Binary, 'binData'))
+
+
+def _bson_type(value: Any) -> Optional[str]:
+    for python_type, alias in _BSON_TYPES:
+        if isinstance(value, python_type):
+            return alias
+    return None
+
+
+def range_filter(lower: Optional[Any], upper: Optional[Any]) -> Dict[str, Any]:
+    """Query fragment selecting `lower <= _id < upper` (open ends when None)."""
+    bounds: Dict[str, Any] = {}
+    if lower is not None:
+        bounds['$gte'] = lower
+    if upper is not None:
+        bounds['$lt'] = upper
+    return {'_id': bounds} if bounds else {}
+
+
+def id_ranges(collection: Collection, partitions: int) -> List[IdRange]:
+    """
+    Return up to *partitions* contiguous, non-overlapping `_id` ranges covering
+    the whole collection.
+
+    `$gte`/`$lt` only match `_id`s of the boundary's BSON type, so the
+    collection is split only when every `_id` has that type.  Falls back to
+    a single open range when the collection is small, the sample fails, or
+    the `_id`s are of mixed (or unsupported) BSON types, whether or not the
+    sample saw them.
+    """
+    whole: List[IdRange] = [(None, None)]
+    if partitions <= 1:
+        return whole
+
+    try:
+        estimated = collection.estimated_document_count()
+    except OperationFailure as e:
+        logger.warning("Could not estimate size of %s, scanning unpartitioned: %s", collection.name, e)
+        return whole
+
+    partitions = min(partitions, max(1, estimated // MIN_DOCS_PER_PARTITION))
+    if partitions <= 1:
+        return whole
+
+    try:
+        sample = [
+            doc['_id'] for doc in collection.aggregate([
+                {'$sample': {'size': partitions * SAMPLES_PER_PARTITION}},
+                {'$project': {'_id': 1}},
+            ])
+        ]
+        sample.sort()
+    except (OperationFailure, TypeError) as e:
+        logger.warning("Could not sample _ids of %s, scanning unpartitioned: %s", collection.name, e)
+        return whole
+    if not sample:
+        return whole
+
+    id_type = _bson_type(sample[0])
+    if id_type is None or any(_bson_type(value) != id_type for value in sample):
+        logger.warning("_ids of %s are not all of one supported type, scanning unpartitioned", collection.name)
+        return whole
+    # An _id of another type would be missed by every range.  BSON orders
+    # values by type first, so the type is uniform iff the smallest and the
+    # largest _id have it; each end is one key read off the _id index
+    # (a $not/$type filter cannot use index bounds and would scan it all).
+    try:
+        ends = [
+            collection.find_one({}, {'_id': 1}, sort=[('_id', direction)])
+            for direction in (1, -1)
+        ]
+    except OperationFailure as e:
+        logger.warning("Could not check _id types of %s, scanning unpartitioned: %s", collection.name, e)
+        return whole
+    for end in ends:
+        if end is not None and _bson_type(end['_id']) != id_type:
+            logger.warning("%s has _ids that are not of type %s (e.g. %r), scanning unpartitioned",
+                           collection.name, id_type, end['_id'])
+            return whole
+
+    step = len(sample) / partitions
+    boundaries: List[Any] = []
+    for i in range(1, partitions):
+        candidate = sample[int(i * step)]
+        if not boundaries or candidate > boundaries[-1]:
+            boundaries.append(candidate)
+
+    lowers = [None] + boundaries
+    uppers = boundaries + [None]
+    return list(zip(lowers, uppers))
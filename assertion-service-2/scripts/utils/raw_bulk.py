@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Pre-encoded bulk writes for ORCID scripts.
+
+``collection.bulk_write`` needs one ``UpdateOne``/``InsertOne`` object per
+document, which pymongo validates and turns into a command dict before
+encoding it.  For multi-million-document runs that per-op Python work is a
+real share of the time.  Here each statement is encoded to BSON once, when
+the batch is built, and a whole batch is sent as a single ``update`` or
+``insert`` command whose statements are copied into the message as-is.
+
+Commands go through ``Database.command`` so the command listener
+(MONGO_COMMAND_METRICS) sees them like any other write.  Write errors are
+raised as ``BulkWriteError`` with the same ``details`` keys ``bulk_write``
+uses (``writeErrors``, ``nModified``, ``nInserted``, ...).  Unlike
+``bulk_write`` these commands are not retried on a network error, so only
+use them for idempotent writes or catch the error and rerun.
+
+Usage:
+    writer = RawBulkWriter(collection)
+    batch = RawBatch.updates()
+    batch.append(encode_update({"_id": doc_id}, {"$set": {"member_id": mid}}))
+    result = writer.execute(batch)
+    result.modified_count
+"""
+
+from typing import Any, Dict, Iterator, List, Mapping, Optional
+
+from bson import ObjectId, encode
+from bson.raw_bson import RawBSONDocument
+from bson.son import SON
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError
+
+
+# Largest write command MongoDB accepts: 16MB of user documents plus 16KB of
+# command overhead.  Batches above this are sent as several commands.
+MAX_COMMAND_BYTES = 16 * 1024 * 1024
+# Room left for the command envelope (name, ordered, writeConcern, ...); the
+# statements' array index keys are counted per statement in RawBatch.chunks.
+COMMAND_OVERHEAD_BYTES = 16 * 1024
+
+
+def encode_update(
+    query: Mapping[str, Any],
+    update: Any,
+    array_filters: Optional[List[Mapping[str, Any]]] = None,
+    upsert: bool = False
+) -> RawBSONDocument:
+    """Encode one ``update`` command statement (``UpdateOne`` equivalent)."""
+    statement: Dict[str, Any] = {'q': query, 'u': update, 'multi': False}
+    if upsert:
+        statement['upsert'] = True
+    if array_filters:
+        statement['arrayFilters'] = array_filters
+    return RawBSONDocument(encode(statement))
+
+
+def encode_insert(document: Dict[str, Any]) -> RawBSONDocument:
+    """Encode one document for an ``insert`` command, adding an ``_id`` if missing."""
+    if '_id' not in document:
+        document = {'_id': ObjectId(), **document}
+    return RawBSONDocument(encode(document))
+
+
+def array_element_bytes(index: int, statement: RawBSONDocument) -> int:
+    """Encoded size of *statement* as element *index* of a BSON array."""
+    return 1 + len(str(index)) + 1 + len(statement.raw)
+
+
+class RawBatch(list):
+    """A list of encoded statements for one command type (``update`` or ``insert``)."""
+
+    __slots__ = ('command',)
+
+    def __init__(self, command: str):
+        super().__init__()
+        self.command = command
+
+    @classmethod
+    def updates(cls) -> "RawBatch":
+        return cls('update')
+
+    @classmethod
+    def inserts(cls) -> "RawBatch":
+        return cls('insert')
+
+    @property
+    def documents_field(self) -> str:
+        return 'updates' if self.command == 'update' else 'documents'
+
+    def chunks(self, max_bytes: int) -> Iterator[List[RawBSONDocument]]:
+        """Split into lists whose encoded statements fit in *max_bytes*.
+
+        Sizes are counted as array elements: each statement also costs a type
+        byte and its index key (``"0"``, ``"1"``, ...) with a NUL terminator.
+        """
+        chunk: List[RawBSONDocument] = []
+        size = 0
+        for statement in self:
+            if chunk and size + array_element_bytes(len(chunk), statement) > max_bytes:
+                yield chunk
+                chunk = []
+                size = 0
+            size += array_element_bytes(len(chunk), statement)
+            chunk.append(statement)
+        if chunk:
+            yield chunk
+
+
+class RawBulkResult:
+    """The counters of ``pymongo.results.BulkWriteResult`` for a raw batch."""
+
+    __slots__ = ('inserted_count', 'matched_count', 'modified_count', 'upserted_count')
+
+    def __init__(self):
+        self.inserted_count = 0
+        self.matched_count = 0
+        self.modified_count = 0
+        self.upserted_count = 0
+
+
+class RawBulkWriter:
+    """Sends ``RawBatch``es to *collection* as unordered write commands."""
+
+    def __init__(self, collection: Collection):
+        self.collection = collection
+        self.max_bytes = MAX_COMMAND_BYTES - COMMAND_OVERHEAD_BYTES
+
+    def execute(self, batch: RawBatch) -> RawBulkResult:
+        """Write *batch*; raise ``BulkWriteError`` if any statement failed.
+
+        Every command of the batch is sent even after a failure, as with an
+        unordered ``bulk_write``; the error then carries the combined counts.
+        """
+        result = RawBulkResult()
+        write_errors: List[Dict[str, Any]] = []
+        concern_errors: List[Dict[str, Any]] = []
+        offset = 0
+        for chunk in batch.chunks(self.max_bytes):
+            reply = self.collection.database.command(self._command(batch, chunk))
+            self._accumulate(batch.command, reply, result)
+            for error in reply.get('writeErrors', []):
+                # Report indexes relative to the whole batch, like bulk_write.
+                write_errors.append({**error, 'index': error.get('index', 0) + offset})
+            if reply.get('writeConcernError'):
+                concern_errors.append(reply['writeConcernError'])
+            offset += len(chunk)
+
+        if write_errors or concern_errors:
+            raise BulkWriteError({
+                'writeErrors': write_errors,
+                'writeConcernErrors': concern_errors,
+                'nInserted': result.inserted_count,
+                'nUpserted': result.upserted_count,
+                'nMatched': result.matched_count,
+                'nModified': result.modified_count,
+                'nRemoved': 0,
+                'upserted': [],
+            })
+        return result
+
+    def _command(self, batch: RawBatch, chunk: List[RawBSONDocument]) -> SON:
+        command = SON([
+            (batch.command, self.collection.name),
+            (batch.documents_field, chunk),
+            ('ordered', False),
+        ])
+        write_concern = self.collection.write_concern
+        if not write_concern.is_server_default:
+            command['writeConcern'] = write_concern.document
+        return command
+
+    @staticmethod
+    def _accumulate(command: str, reply: Mapping[str, Any], result: RawBulkResult):
+        n = int(reply.get('n', 0))
+        if command == 'insert':
+            result.inserted_count += n
+            return
+        upserted = len(reply.get('upserted', []))
+        result.upserted_count += upserted
+        result.matched_count += n - upserted
+        result.modified_count += int(reply.get('nModified', 0))
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Compact, projection-only read models for ORCID scripts.
+
+Scripts that hold query results in memory keep them as small ``__slots__``
+records instead of whole-document dicts, and every query names the fields
+its caller reads, so the server never sends the rest.  Each record type
+carries the projections its callers use (``AssertionRef.SF_ID_REPORT``,
+``UserRef.OWNER_REPORT``, ...); fields outside the projection are None.
+
+The document ``_id`` is exposed as ``id``, and ``tokens`` arrays are turned
+into tuples of ``TokenRef``.
+
+Usage:
+    assertions = Repository(connection.get_collection('assertion'), AssertionRef)
+    for assertion in assertions.find(query, AssertionRef.SF_ID_REPORT):
+        logger.info(f"{assertion.email} {assertion.salesforce_id}")
+"""
+
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Type, TypeVar
+
+from pymongo.collection import Collection
+
+
+R = TypeVar('R', bound='Record')
+
+
+def projection(*fields: str) -> Dict[str, int]:
+    """Find projection returning only *fields* (``_id`` is excluded unless listed)."""
+    spec = {field: 1 for field in fields}
+    spec.setdefault('_id', 0)
+    return spec
+
+
+def _document_field(slot: str) -> str:
+    return '_id' if slot == 'id' else slot
+
+
+class Record:
+    """Base for the read models: one slot per document field, no ``__dict__``."""
+
+    __slots__ = ()
+    # Record type for the elements of an array field, by slot name.
+    NESTED: Dict[str, Type['Record']] = {}
+
+    def __init__(self, **values: Any):
+        for slot in self.__slots__:
+            setattr(self, slot, values.get(slot))
+
+    @classmethod
+    def from_doc(cls: Type[R], doc: Mapping[str, Any]) -> R:
+        record = cls.__new__(cls)
+        for slot in cls.__slots__:
+            value = doc.get(_document_field(slot))
+            nested = cls.NESTED.get(slot)
+            if nested is not None and value is not None:
+                value = tuple(nested.from_doc(item) for item in value if isinstance(item, Mapping))
+            setattr(record, slot, value)
+        return record
+
+    def __repr__(self) -> str:
+        fields = ', '.join(
+            f"{slot}={getattr(self, slot)!r}" for slot in self.__slots__ if getattr(self, slot) is not None
+        )
+        return f"{type(self).__name__}({fields})"
+
+
+class TokenRef(Record):
+    """One entry of ``orcid_record.tokens``; ``revoked_date`` is None while active."""
+
+    __slots__ = ('salesforce_id', 'member_id', 'revoked_date')
+
+
+class AssertionRef(Record):
+    """An ``assertion`` (affiliation) document."""
+
+    __slots__ = (
+        'id', 'email', 'salesforce_id', 'member_id', 'status',
+        'put_code', 'added_to_orcid', 'orcid_id', 'org_name',
+    )
+
+    # find_short_sf_ids: assertions listed by email and salesforce_id.
+    SF_ID_REPORT = projection('email', 'salesforce_id')
+    # add_missing_ORCID_iD_from_affiliations: assertions matched to orcid records.
+    ORCID_MATCH = projection('_id', 'email', 'salesforce_id')
+    # fix_affiliation_status: affiliations reset to PENDING, and their report.
+    STATUS_REPORT = projection('_id', 'status', 'put_code', 'added_to_orcid', 'orcid_id', 'org_name')
+
+
+class NotificationRequestRef(Record):
+    """A ``send_notifications_request`` document."""
+
+    __slots__ = ('id', 'email', 'salesforce_id', 'member_id')
+
+    SF_ID_REPORT = projection('email', 'salesforce_id')
+
+
+class OrcidRecordRef(Record):
+    """An ``orcid_record`` document."""
+
+    __slots__ = ('id', 'email', 'orcid', 'tokens')
+    NESTED = {'tokens': TokenRef}
+
+    # find_short_sf_ids: records listed with their tokens' salesforce_id.
+    SF_ID_REPORT = projection('email', 'tokens.salesforce_id', 'tokens.revoked_date')
+    # add_missing_ORCID_iD_from_affiliations: the ORCID iD and active tokens per email.
+    ACTIVE_TOKENS = projection('email', 'orcid', 'tokens.salesforce_id', 'tokens.revoked_date')
+
+    def has_active_token(self, salesforce_id: str) -> bool:
+        """Client-side equivalent of ``tokens: {$elemMatch: {salesforce_id, revoked_date: {$exists: false}}}``."""
+        return any(
+            token.salesforce_id == salesforce_id and token.revoked_date is None
+            for token in self.tokens or ()
+        )
+
+
+class UserRef(Record):
+    """A ``jhi_user`` document."""
+
+    __slots__ = ('id', 'email', 'member_id', 'member_name', 'salesforce_id', 'main_contact')
+
+    # find_short_sf_ids: users listed by email and salesforce_id.
+    SF_ID_REPORT = projection('email', 'salesforce_id')
+    # manage_organizations: users moved to another member, and who owns each member.
+    OWNER_REPORT = projection('_id', 'email', 'member_id', 'salesforce_id', 'main_contact')
+    # demote_non_superadmin_admins: admins to demote and their audit lines.
+    ADMIN_AUDIT = projection('_id', 'email', 'member_id', 'member_name', 'salesforce_id')
+
+
+class MemberRef(Record):
+    """A ``member`` document (memberservice)."""
+
+    __slots__ = ('id', 'salesforce_id', 'client_name', 'client_id')
+
+    # manage_organizations: members being updated or merged.
+    MERGE = projection('_id', 'salesforce_id', 'client_name', 'client_id')
+
+
+class Repository:
+    """
+    Reads one record type from *collection*.
+
+    Every read takes a projection, so a call site always states which fields
+    it needs.
+    """
+
+    def __init__(self, collection: Collection, record_type: Type[R]):
+        self.collection = collection
+        self.record_type = record_type
+
+    def find(self, query: Mapping[str, Any], fields: Mapping[str, Any], **kwargs: Any) -> Iterator[R]:
+        """Yield a record per matching document; *kwargs* go to ``Collection.find``."""
+        from_doc = self.record_type.from_doc
+        cursor = self.collection.find(query, fields, **kwargs)
+        try:
+            for doc in cursor:
+                yield from_doc(doc)
+        finally:
+            cursor.close()
+
+    def find_all(self, query: Mapping[str, Any], fields: Mapping[str, Any], **kwargs: Any) -> List[R]:
+        return list(self.find(query, fields, **kwargs))
+
+    def find_one(self, query: Mapping[str, Any], fields: Mapping[str, Any]) -> Optional[R]:
+        doc = self.collection.find_one(query, fields)
+        return self.record_type.from_doc(doc) if doc is not None else None
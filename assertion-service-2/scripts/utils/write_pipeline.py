@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Producer/consumer pipeline for bulk writes.
+
+Lets a script keep draining its cursor while earlier batches are written:
+the producer submits batches into a bounded queue and background writer
+threads run them.  A full queue blocks the producer (backpressure), the first
+write error is re-raised to the producer, and acknowledgements are delivered
+in submission order so callers can checkpoint safely.
+
+Usage:
+    with BulkWritePipeline(self._flush, on_ack=self._checkpoint) as pipeline:
+        for batch in batches:
+            pipeline.submit(batch, context=batch_position)
+    modified = pipeline.total
+"""
+
+import queue
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+
+DEFAULT_WRITERS = 2
+DEFAULT_MAX_PENDING = 4
+
+_STOP = object()
+
+
+class PipelineClosedError(RuntimeError):
+    pass
+
+
+class BulkWritePipeline:
+    """
+    Bounded queue feeding background writer threads.
+
+    Args:
+        write: Called with each submitted batch from a writer thread; returns
+            the number of documents written (added to ``total``).
+        workers: Number of writer threads.
+        max_pending: Batches that may wait in the queue before ``submit``
+            blocks.
+        on_ack: Optional ``on_ack(context, written)`` callback, invoked in
+            submission order once a batch and every batch before it are
+            written.
+        name: Prefix for the writer thread names.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[Sequence[Any]], int],
+        workers: int = DEFAULT_WRITERS,
+        max_pending: int = DEFAULT_MAX_PENDING,
+        on_ack: Optional[Callable[[Any, int], None]] = None,
+        name: str = 'bulk-writer'
+    ):
+        self.write = write
+        self.on_ack = on_ack
+        self.name = name
+        self.total = 0
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, max_pending))
+        self._lock = threading.Lock()
+        self._error: Optional[BaseException] = None
+        self._next_seq = 0
+        self._next_ack = 0
+        self._done: Dict[int, Any] = {}
+        self._closed = False
+        self._threads: List[threading.Thread] = [
+            threading.Thread(target=self._run, name=f"{name}-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    # ---- producer side ------------------------------------------------------
+
+    def submit(self, batch: Sequence[Any], context: Any = None):
+        """Queue *batch* for writing; blocks while the queue is full."""
+        if self._closed:
+            raise PipelineClosedError(f"{self.name}: submit() after close()")
+        self._raise_if_failed()
+        if not batch:
+            return
+        seq = self._next_seq
+        self._next_seq += 1
+        while True:
+            try:
+                self._queue.put((seq, batch, context), timeout=0.5)
+                return
+            except queue.Full:
+                self._raise_if_failed()
+
+    def close(self) -> int:
+        """Wait for every queued batch, re-raise any write error, return ``total``."""
+        if not self._closed:
+            self._closed = True
+            for _ in self._threads:
+                self._queue.put(_STOP)
+            for thread in self._threads:
+                thread.join()
+        self._raise_if_failed()
+        return self.total
+
+    def abort(self):
+        """Drop queued batches and stop the writers (in-flight writes finish)."""
+        with self._lock:
+            if self._error is None:
+                self._error = PipelineClosedError(f"{self.name}: aborted")
+        self._drain_queue()
+        if not self._closed:
+            self._closed = True
+            for _ in self._threads:
+                self._queue.put(_STOP)
+            for thread in self._threads:
+                thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    # ---- writer side --------------------------------------------------------
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            seq, batch, context = item
+            if self._error is not None:
+                continue
+            try:
+                written = self.write(batch)
+            except BaseException as e:
+                with self._lock:
+                    if self._error is None:
+                        self._error = e
+                continue
+            self._acknowledge(seq, context, written)
+
+    def _acknowledge(self, seq: int, context: Any, written: int):
+        with self._lock:
+            self._done[seq] = (context, written)
+            while self._next_ack in self._done:
+                ctx, n = self._done.pop(self._next_ack)
+                self._next_ack += 1
+                self.total += n
+                # Batches acknowledged by the server are reported even after
+                # another batch failed, so checkpoints never lag behind.
+                if self.on_ack is not None:
+                    try:
+                        self.on_ack(ctx, n)
+                    except BaseException as e:
+                        if self._error is None:
+                            self._error = e
+
+    def _raise_if_failed(self):
+        if self._error is not None:
+            raise self._error
+
+    def _drain_queue(self):
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                return
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Replication-lag-aware write throttle for ORCID scripts.
+
+Every bulk write goes through one process-wide throttle per client: a token
+bucket caps write operations per second, and the secondaries' replication
+lag is polled every few seconds.  When lag exceeds the threshold the rate is
+halved (down to a floor); once lag is back under half the threshold it
+recovers step by step to the configured cap.
+
+Lag comes from ``replSetGetStatus`` (needs clusterMonitor); without that
+privilege it falls back to the ``hello`` responses the driver already
+collects for each member (``lastWrite.lastWriteDate``).  Standalone servers
+have no lag and are only rate capped.
+
+Limits come from the environment (see ``config.get_write_throttle_settings``)
+and are off unless set:
+    MONGO_WRITE_OPS_PER_SECOND=5000   # unset/0 = no cap
+    MONGO_MAX_REPLICATION_LAG_S=10    # unset/0 = ignore lag
+    MONGO_LAG_POLL_S=5
+
+A large batch is paced in slices of at most one lag poll interval, so rate
+changes apply mid-batch and no single sleep outlasts a lag reading.
+
+Usage:
+    throttle = get_write_throttle(collection.database.client)
+    throttle.wait(len(batch))
+    collection.bulk_write(batch, ordered=False)
+"""
+
+import atexit
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from pymongo import MongoClient
+from pymongo.errors import OperationFailure, PyMongoError
+from pymongo.server_type import SERVER_TYPE
+
+from config import get_write_throttle_settings
+
+
+logger = logging.getLogger(__name__)
+
+# Slowest pace the throttle backs off to, whatever the lag.
+MIN_OPS_PER_SECOND = 50.0
+# Factors applied to the rate on each lag reading above / well below the threshold.
+BACKOFF_FACTOR = 0.5
+RECOVERY_FACTOR = 1.25
+# A batch expected to wait longer than this is logged before waiting.
+LONG_WAIT_S = 30.0
+
+_throttles: Dict[int, 'WriteThrottle'] = {}
+_throttles_lock = threading.Lock()
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled at *rate* tokens per second.
+
+    ``acquire`` reserves tokens immediately and sleeps off any deficit, so a
+    request larger than the bucket is allowed but delays the callers after
+    it.  A rate of None disables the cap.
+    """
+
+    def __init__(self, rate: Optional[float], capacity: Optional[float] = None):
+        self._lock = threading.Lock()
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    @property
+    def rate(self) -> Optional[float]:
+        return self._rate
+
+    @property
+    def capacity(self) -> float:
+        if self._capacity is not None:
+            return self._capacity
+        # One second's worth of writes by default.
+        return self._rate or 0.0
+
+    def set_rate(self, rate: Optional[float]):
+        with self._lock:
+            self._refill()
+            self._rate = rate
+            self._tokens = min(self._tokens, self.capacity)
+
+    def acquire(self, n: float = 1) -> float:
+        """Take *n* tokens, sleeping until they are available; returns the seconds slept."""
+        with self._lock:
+            if self._rate is None:
+                return 0.0
+            self._refill()
+            self._tokens -= n
+            delay = -self._tokens / self._rate if self._tokens < 0 else 0.0
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def _refill(self):
+        now = time.monotonic()
+        if self._rate is not None:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+
+class ReplicationLagMonitor:
+    """Cached view of the worst secondary's replication lag, in seconds."""
+
+    def __init__(self, client: MongoClient, poll_interval_s: float):
+        self.client = client
+        self.poll_interval_s = poll_interval_s
+        self.enabled = True
+        self._lag: Optional[float] = None
+        self.polled_at = 0.0
+        self._poll_lock = threading.Lock()
+        self._use_hello = False
+
+    def lag(self) -> Optional[float]:
+        """Return the last lag reading, polling first when it is stale.
+
+        None means the lag is unknown (or monitoring is disabled).  Only one
+        thread polls at a time; the others reuse the previous reading.
+        """
+        if not self.enabled:
+            return None
+        if time.monotonic() - self.polled_at >= self.poll_interval_s and self._poll_lock.acquire(blocking=False):
+            try:
+                self._lag = self._poll()
+                self.polled_at = time.monotonic()
+            finally:
+                self._poll_lock.release()
+        return self._lag
+
+    def _poll(self) -> Optional[float]:
+        if not self._use_hello:
+            try:
+                return self._lag_from_status(self.client.admin.command('replSetGetStatus'))
+            except OperationFailure as e:
+                if e.code == 76:  # NoReplicationEnabled
+                    return self._disable("standalone server, no replication lag to watch")
+                logger.warning("replSetGetStatus unavailable (%s), reading lag from hello responses", e)
+                self._use_hello = True
+            except PyMongoError as e:
+                logger.warning("Could not read replication lag: %s", e)
+                return self._lag
+            except Exception as e:
+                return self._disable(f"replication lag not available ({e})")
+        return self._lag_from_hello()
+
+    def _lag_from_status(self, status: Dict[str, Any]) -> Optional[float]:
+        members = status.get('members', [])
+        primary = next((m for m in members if m.get('stateStr') == 'PRIMARY'), None)
+        secondaries = [m for m in members if m.get('stateStr') == 'SECONDARY' and m.get('health', 1)]
+        if primary is None or not secondaries:
+            return None
+        oldest = min(m['optimeDate'] for m in secondaries)
+        return max(0.0, (primary['optimeDate'] - oldest).total_seconds())
+
+    def _lag_from_hello(self) -> Optional[float]:
+        try:
+            servers = self.client.topology_description.server_descriptions().values()
+        except Exception as e:
+            return self._disable(f"replication lag not available ({e})")
+
+        primary = next((s for s in servers if s.server_type == SERVER_TYPE.RSPrimary), None)
+        secondaries = [s for s in servers if s.server_type == SERVER_TYPE.RSSecondary]
+        if primary is None:
+            if any(s.server_type == SERVER_TYPE.Standalone for s in servers):
+                return self._disable("standalone server, no replication lag to watch")
+            return None
+        if primary.last_write_date is None or not secondaries:
+            return None
+        dates = [s.last_write_date for s in secondaries if s.last_write_date is not None]
+        if not dates:
+            return None
+        return max(0.0, (primary.last_write_date - min(dates)).total_seconds())
+
+    def _disable(self, reason: str) -> None:
+        logger.info("Write throttle: %s", reason)
+        self.enabled = False
+        return None
+
+
+class WriteThrottle:
+    """
+    Paces writes to *ops_per_second* and backs off while secondaries lag.
+
+    Args:
+        client: Client whose replica set is watched.
+        ops_per_second: Cap on write operations per second (None/0 = no cap).
+        max_lag_s: Lag above which the rate is cut (None/0 = ignore lag).
+        poll_interval_s: Seconds between lag readings.
+    """
+
+    def __init__(
+        self,
+        client: MongoClient,
+        ops_per_second: Optional[float] = None,
+        max_lag_s: Optional[float] = None,
+        poll_interval_s: float = 5.0
+    ):
+        self.max_ops_per_second = ops_per_second or None
+        self.max_lag_s = max_lag_s or None
+        self.bucket = TokenBucket(self.max_ops_per_second)
+        self.monitor = ReplicationLagMonitor(client, poll_interval_s)
+        self.monitor.enabled = self.max_lag_s is not None
+        self.slept_s = 0.0
+        self.backoffs = 0
+        self.max_lag_seen = 0.0
+        self._lock = threading.Lock()
+        self._last_reading: Optional[float] = None
+        self._ops_since_reading = 0
+        self._reading_at = time.monotonic()
+        # Observed throughput when an uncapped throttle first backed off; the
+        # cap is lifted again once recovery gets back to it.
+        self._uncapped_rate: Optional[float] = None
+
+    def wait(self, ops: int = 1):
+        """Block until *ops* more write operations may be sent.
+
+        Tokens are taken in slices of one poll interval's worth, re-reading
+        the lag between slices.
+        """
+        remaining = float(ops)
+        slept = 0.0
+        logged = False
+        while remaining > 0:
+            self._adjust()
+            rate = self.bucket.rate
+            if rate is None:
+                break
+            if not logged and remaining / rate > LONG_WAIT_S:
+                logger.warning("Write throttle: pacing %d ops at %.0f ops/s, about %.0fs",
+                               ops, rate, remaining / rate)
+                logged = True
+            step = min(remaining, max(1.0, rate * self.monitor.poll_interval_s))
+            slept += self.bucket.acquire(step)
+            remaining -= step
+        with self._lock:
+            self._ops_since_reading += ops
+            self.slept_s += slept
+
+    def _adjust(self):
+        lag = self.monitor.lag()
+        with self._lock:
+            if lag is None or self.monitor.polled_at == self._last_reading:
+                return
+            self._last_reading = self.monitor.polled_at
+            now = time.monotonic()
+            observed = self._ops_since_reading / max(now - self._reading_at, 1e-3)
+            self._ops_since_reading = 0
+            self._reading_at = now
+            self.max_lag_seen = max(self.max_lag_seen, lag)
+
+            rate = self.bucket.rate
+            if lag > self.max_lag_s:
+                if rate is None:
+                    self._uncapped_rate = max(observed, MIN_OPS_PER_SECOND)
+                    rate = self._uncapped_rate
+                new_rate = max(MIN_OPS_PER_SECOND, rate * BACKOFF_FACTOR)
+                self.backoffs += 1
+                logger.warning(
+                    "Replication lag %.1fs exceeds %.0fs, slowing writes to %.0f ops/s",
+                    lag, self.max_lag_s, new_rate
+                )
+                self.bucket.set_rate(new_rate)
+            elif rate is not None and lag < self.max_lag_s / 2:
+                ceiling = self.max_ops_per_second or self._uncapped_rate
+                new_rate = rate * RECOVERY_FACTOR
+                if new_rate >= ceiling:
+                    new_rate = self.max_ops_per_second
+                    self._uncapped_rate = None
+                if new_rate == rate:
+                    return
+                logger.info(
+                    "Replication lag %.1fs, raising write rate to %s",
+                    lag, f"{new_rate:.0f} ops/s" if new_rate else "uncapped"
+                )
+                self.bucket.set_rate(new_rate)
+
+    def summary(self) -> str:
+        rate = self.bucket.rate
+        return (
+            f"throttled {self.slept_s:.1f}s, {self.backoffs} lag backoffs, "
+            f"max lag seen {self.max_lag_seen:.1f}s, "
+            f"current rate {f'{rate:.0f} ops/s' if rate else 'uncapped'}"
+        )
+
+    def _report_at_exit(self):
+        # Script loggers may already be torn down at exit, so print directly.
+        if self.slept_s or self.backoffs:
+            print(f"Write throttle: {self.summary()}")
+
+
+def get_write_throttle(client: MongoClient) -> WriteThrottle:
+    """
+    Return the process-wide WriteThrottle for *client*.
+
+    Every writer thread sharing a client shares its throttle, so the cap
+    applies to the process as a whole rather than to each thread.
+    """
+    with _throttles_lock:
+        throttle = _throttles.get(id(client))
+        if throttle is None:
+            settings = get_write_throttle_settings()
+            throttle = _throttles[id(client)] = WriteThrottle(client, **settings)
+            atexit.register(throttle._report_at_exit)
+            logger.info(
+                "Write throttle: %s ops/s, max replication lag %s",
+                f"{settings['ops_per_second']:.0f}" if settings['ops_per_second'] else "uncapped",
+                f"{settings['max_lag_s']:.0f}s" if settings['max_lag_s'] else "ignored",
+            )
+        return throttle